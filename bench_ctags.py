@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for 'ctags.py'.
+
+These are not run as part of the unit tests. Run them with::
+
+    python bench_ctags.py [--lines N] [benchmark ...]
+
+Each benchmark works on a synthetic tag file of ``N`` lines (one million by
+default) and prints its results.
+"""
+
+import argparse
+import gc
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import ctags
+
+#
+# Helper functions
+#
+
+KINDS = ('c', 'f', 'm', 'v', 'i')
+
+
+def build_tag_lines(count, seed=0):
+    """
+    Build a sorted list of synthetic tag lines.
+
+    Lines are spread over roughly one file per 50 tags, with a realistic
+    mix of kinds, ex commands and fields.
+
+    :param count: number of tag lines to build
+    :param seed: seed for the random generator, so runs are comparable
+
+    :returns: list of tag lines, without line endings
+    """
+    rand = random.Random(seed)
+    files = ['src/package_{0}/module_{1}.py'.format(i % 97, i)
+             for i in range(max(1, count // 50))]
+    classes = ['Class{0}'.format(i) for i in range(max(1, count // 200))]
+    lines = []
+
+    for index in range(count):
+        symbol = 'symbol_{0}'.format(rand.randint(0, count // 4))
+        kind = rand.choice(KINDS)
+        if kind in ('m', 'v'):
+            fields = '\tclass:{0}\tlanguage:Python'.format(
+                rand.choice(classes))
+        else:
+            fields = '\tlanguage:Python'
+        lines.append('{0}\t{1}\t/^    def {0}(self, arg_{2}):$/;"\t{3}{4}'
+                     .format(symbol, rand.choice(files), index, kind,
+                             fields))
+
+    lines.sort()
+    return lines
+
+
+def write_tag_file(lines):
+    """
+    Write a list of tag lines to a temporary tag file.
+
+    :param lines: list of tag lines, without line endings
+
+    :returns: path to the tag file
+    """
+    handle, path = tempfile.mkstemp(prefix='bench_tags_')
+
+    with os.fdopen(handle, 'wb') as file_:
+        for line in lines:
+            file_.write((line + '\n').encode('utf-8'))
+
+    return path
+
+
+def measure_memory(func):
+    """
+    Measure memory allocated by a function call.
+
+    :param func: function to call
+
+    :returns: tuple of the result, the memory still allocated on return and
+        the peak allocated memory, both in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def report(name, **values):
+    """
+    Print benchmark results.
+    """
+    print('{0:<24} {1}'.format(name, '  '.join(
+        '{0}={1}'.format(key, values[key]) for key in sorted(values))))
+
+
+def megabytes(size):
+    return '{0:.1f}MB'.format(size / (1024.0 * 1024.0))
+
+#
+# Benchmarks
+#
+
+
+def bench_tag_memory(lines):
+    """
+    Compare memory used by ``TagElements`` and ``CompactTagElements``.
+    """
+    tag_lines = build_tag_lines(lines)
+
+    for tag_class in (ctags.TagElements, ctags.CompactTagElements):
+        start = time.time()
+        result, current, peak = measure_memory(
+            lambda: ctags.parse_tag_lines(tag_lines, tag_class=tag_class))
+        report(tag_class.__name__, retained=megabytes(current),
+               peak=megabytes(peak),
+               seconds='{0:.2f}'.format(time.time() - start))
+        del result
+
+
+def bench_resort(lines):
+    """
+    Compare peak memory and throughput of ``resort_ctags`` run sizes.
+    """
+    tag_file = write_tag_file(build_tag_lines(lines))
+    size = os.path.getsize(tag_file)
+
+    try:
+        for run_size in (None, 1 << 20, 8 << 20, 64 << 20):
+            start = time.time()  # time separately, as tracing is slow
+            ctags.resort_ctags(tag_file, run_size=run_size)
+            seconds = time.time() - start
+            _, _, peak = measure_memory(
+                lambda: ctags.resort_ctags(tag_file, run_size=run_size))
+            report('run_size={0}'.format(run_size or 'all'),
+                   peak=megabytes(peak),
+                   throughput='{0}/s'.format(megabytes(size / seconds)))
+    finally:
+        os.remove(tag_file)
+        os.remove(tag_file + '_sorted_by_file')
+
+
+def bench_lookup(lines):
+    """
+    Compare looking up many symbols one by one and with ``search_many``.
+    """
+    tag_lines = build_tag_lines(lines)
+    tag_file = write_tag_file(tag_lines)
+    index_file = ctags.build_line_index(tag_file)
+    rand = random.Random(1)
+    symbols = [line.split('\t')[0] for line in tag_lines]
+
+    try:
+        for count in (100, 1000, 10000):
+            keys = [rand.choice(symbols) for _ in range(count)]
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                start = time.time()
+                for key in keys:
+                    list(tagfile.search(True, key))
+                single = time.time() - start
+
+                start = time.time()
+                tagfile.search_many(keys)
+                many = time.time() - start
+
+            report('keys={0}'.format(count),
+                   search='{0:.3f}s'.format(single),
+                   search_many='{0:.3f}s'.format(many))
+    finally:
+        os.remove(tag_file)
+        os.remove(index_file)
+
+
+def bench_prefix(lines):
+    """
+    Compare reading all tags with a prefix and ``search_prefix``.
+    """
+    tag_file = write_tag_file(build_tag_lines(lines))
+    index_file = ctags.build_line_index(tag_file)
+
+    try:
+        with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+            for prefix in ('s', 'symbol_1', 'symbol_12'):
+                start = time.time()
+                tags = list(tagfile.search(False, prefix))
+                search = time.time() - start
+
+                start = time.time()
+                symbols = tagfile.search_prefix(
+                    prefix, limit=50, distinct_symbols_only=True)
+                search_prefix = time.time() - start
+
+                report('prefix={0}'.format(prefix), tags=len(tags),
+                       symbols=len(symbols),
+                       search='{0:.1f}ms'.format(search * 1000),
+                       search_prefix='{0:.1f}ms'.format(search_prefix * 1000))
+    finally:
+        os.remove(tag_file)
+        os.remove(index_file)
+
+
+def bench_completions(lines):
+    """
+    Compare filtering every symbol by prefix and ``search_completions``.
+    """
+    tag_file = write_tag_file(build_tag_lines(lines))
+    start = time.time()
+    index_file = ctags.build_completion_index(tag_file)
+    report('build', seconds='{0:.2f}'.format(time.time() - start))
+
+    try:
+        with open(tag_file, 'rb') as file_:
+            symbols = sorted(set(
+                line.split(b'\t', 1)[0].decode('utf-8') for line in file_))
+
+        with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+            for prefix in ('s', 'symbol_1', 'symbol_12'):
+                start = time.time()
+                filtered = [symbol for symbol in symbols
+                            if symbol.lower().startswith(prefix)]
+                linear = time.time() - start
+
+                start = time.time()
+                completions = tagfile.search_completions(prefix)
+                indexed = time.time() - start
+
+                report('prefix={0}'.format(prefix), symbols=len(filtered),
+                       completions=len(completions),
+                       filter='{0:.1f}ms'.format(linear * 1000),
+                       index='{0:.1f}ms'.format(indexed * 1000))
+    finally:
+        os.remove(tag_file)
+        os.remove(index_file)
+        os.remove(tag_file + ctags.ABBREVIATION_INDEX_SUFFIX)
+        os.remove(tag_file + ctags.BLOOM_FILTER_SUFFIX)
+
+
+def bench_abbreviations(lines):
+    """
+    Compare abbreviating every symbol and ``search_abbreviations``.
+    """
+    words = ['get', 'set', 'display', 'name', 'user', 'value', 'parse',
+             'item', 'list', 'node', 'index', 'file', 'path', 'update']
+
+    def camel_case(match):
+        number = int(match.group(1))
+        snake_case = number % 2
+        parts = [words[number % 2]]  # a word for each digit, in base 14
+        while number:
+            parts.append(words[number % len(words)])
+            number //= len(words)
+        if snake_case:
+            return '_'.join(parts)
+        return parts[0] + ''.join(part.title() for part in parts[1:])
+
+    tag_lines = sorted(re.sub(r'^symbol_(\d+)', camel_case, line)
+                       for line in build_tag_lines(lines))
+    tag_file = write_tag_file(tag_lines)
+    index_file = ctags.build_completion_index(tag_file)
+
+    try:
+        symbols = sorted(set(line.split('\t', 1)[0] for line in tag_lines))
+
+        with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+            for abbreviation in ('g', 'gD', 'gDN'):
+                key = abbreviation.lower()
+                start = time.time()
+                scanned = [symbol for symbol in symbols if
+                           (ctags.get_abbreviation(symbol) or '')
+                           .startswith(key)]
+                linear = time.time() - start
+
+                start = time.time()
+                indexed = tagfile.search_abbreviations(abbreviation)
+                seconds = time.time() - start
+
+                report('abbreviation={0}'.format(abbreviation),
+                       symbols=len(scanned), matches=len(indexed),
+                       scan='{0:.1f}ms'.format(linear * 1000),
+                       index='{0:.1f}ms'.format(seconds * 1000))
+    finally:
+        os.remove(tag_file)
+        os.remove(index_file)
+        os.remove(tag_file + ctags.ABBREVIATION_INDEX_SUFFIX)
+        os.remove(tag_file + ctags.BLOOM_FILTER_SUFFIX)
+
+
+def bench_parsed_cache(lines):
+    """
+    Compare parsing a tag file and loading it from a ``ParsedTagCache``.
+    """
+    tag_file = write_tag_file(build_tag_lines(lines))
+    cache_dir = tempfile.mkdtemp(prefix='bench_cache_')
+    cache = ctags.ParsedTagCache(cache_dir)
+
+    def parse():
+        with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+            return tagfile.get_tags_dict(compact=True)
+
+    try:
+        for name in ('parse', 'cold', 'warm'):
+            start = time.time()
+            if name == 'parse':
+                tags = parse()
+            else:
+                tags = cache.get_tags(tag_file, 'all', parse)
+            loaded = time.time() - start
+
+            start = time.time()
+            count = sum(len(tags[key]) for key in tags)
+            read = time.time() - start
+
+            report(name, tags=count, load='{0:.2f}s'.format(loaded),
+                   read_all='{0:.2f}s'.format(read))
+            del tags
+    finally:
+        os.remove(tag_file)
+        shutil.rmtree(cache_dir)
+
+
+def bench_bloom(lines):
+    """
+    Compare searching 12 tag files for a missing symbol with and without
+    checking their bloom filters first.
+    """
+    tag_files = [write_tag_file(build_tag_lines(lines // 12, seed))
+                 for seed in range(12)]
+    for tag_file in tag_files:
+        ctags.build_line_index(tag_file)
+        ctags.build_completion_index(tag_file)
+    keys = ['missing_{0}'.format(i) for i in range(100)]
+
+    try:
+        for name in ('search', 'bloom'):
+            start = time.time()
+            searched = 0
+            for key in keys:
+                for tag_file in tag_files:
+                    if (name == 'bloom' and
+                            not ctags.may_contain_symbol(tag_file, key)):
+                        continue
+                    searched += 1
+                    with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                        list(tagfile.search(True, key))
+            report(name, searched=searched,
+                   per_lookup='{0:.2f}ms'.format(
+                       (time.time() - start) * 1000 / len(keys)))
+    finally:
+        for tag_file in tag_files:
+            for suffix in ('', ctags.LINE_INDEX_SUFFIX,
+                           ctags.COMPLETION_INDEX_SUFFIX,
+                           ctags.ABBREVIATION_INDEX_SUFFIX,
+                           ctags.BLOOM_FILTER_SUFFIX):
+                os.remove(tag_file + suffix)
+
+
+BENCHMARKS = {
+    'abbreviations': bench_abbreviations,
+    'bloom': bench_bloom,
+    'completions': bench_completions,
+    'lookup': bench_lookup,
+    'parsed_cache': bench_parsed_cache,
+    'prefix': bench_prefix,
+    'resort': bench_resort,
+    'tag_memory': bench_tag_memory,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, default=1000000,
+                        help='number of lines in the synthetic tag file')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run, from: {0} (default: all)'
+                        .format(', '.join(sorted(BENCHMARKS))))
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {0}'.format(name))
+
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print('# {0} ({1} lines)'.format(name, args.lines))
+        BENCHMARKS[name](args.lines)
+
+
+if __name__ == '__main__':
+    main()
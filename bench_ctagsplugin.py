@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for 'ctagsplugin.py'.
+
+These are not run as part of the unit tests. Run them with::
+
+    python bench_ctagsplugin.py [--views N] [--lines N] [benchmark ...]
+
+Each benchmark works on ``N`` synthetic views (40 by default), using the
+fake ``sublime`` module, and prints its results.
+"""
+
+import argparse
+import os
+import random
+import time
+
+import bench_ctags
+import ctags
+import ctagsplugin
+from tests.sublime_fake import sublime
+
+#
+# Helper functions
+#
+
+
+def build_views(count, lines, seed=0):
+    """
+    Build views of synthetic Python source.
+
+    :param count: number of views to build
+    :param lines: number of lines in each view
+    :param seed: seed for the random generator, so runs are comparable
+
+    :returns: list of views
+    """
+    rand = random.Random(seed)
+    views = []
+
+    for _ in range(count):
+        text = []
+        for index in range(lines):
+            text.append('    value_{0} = symbol_{1}(arg_{2}, self.{3})\n'
+                        .format(index, rand.randint(0, lines * count // 4),
+                                rand.randint(0, 99),
+                                rand.choice(('alpha', 'beta', 'gamma'))))
+        views.append(sublime.View(''.join(text)))
+
+    return views
+
+
+def report(name, **values):
+    """
+    Print benchmark results.
+    """
+    print('{0:<24} {1}'.format(name, '  '.join(
+        '{0}={1}'.format(key, values[key]) for key in sorted(values))))
+
+#
+# Benchmarks
+#
+
+
+def bench_buffer_completions(views, lines):
+    """
+    Compare ``extract_completions`` on every view and ``BufferCompletions``
+    while typing in one of them.
+    """
+    views = build_views(views, lines)
+    completions = ctagsplugin.BufferCompletions()
+    typed = 'symbol_12 = value_3'
+
+    start = time.time()
+    completions.complete(views, '')
+    report('index', seconds='{0:.3f}'.format(time.time() - start))
+
+    for name in ('extract_completions', 'BufferCompletions'):
+        view = views[0]
+        view.insert('\n')
+        completions.modified(view)
+        start = time.time()
+
+        for index, char in enumerate(typed):
+            view.insert(char)
+            prefix = typed[:index + 1].split(' ')[-1].lower()
+            if name == 'BufferCompletions':
+                completions.modified(view)
+                results = completions.complete(views, prefix)
+            else:
+                results = set()
+                for other in views:
+                    results.update(other.extract_completions(prefix))
+
+        report(name, keystrokes=len(typed), results=len(results),
+               per_keystroke='{0:.2f}ms'.format(
+                   (time.time() - start) * 1000 / len(typed)))
+
+
+def bench_completion_session(views, lines):
+    """
+    Compare searching the tag file and ``CompletionSession`` while typing a
+    symbol.
+    """
+    tag_file = bench_ctags.write_tag_file(
+        bench_ctags.build_tag_lines(views * lines))
+    index_file = ctags.build_completion_index(tag_file)
+    typed = 'symbol_123'
+
+    try:
+        for name in ('search_completions', 'CompletionSession'):
+            session = ctagsplugin.CompletionSession()
+            times = []
+
+            for index in range(len(typed)):
+                prefix = typed[:index + 1]
+                start = time.time()
+                if name == 'CompletionSession':
+                    results = session.complete(tag_file, prefix)
+                else:
+                    results = ctagsplugin.search_completions(tag_file, prefix)
+                times.append(time.time() - start)
+
+            report(name, keystrokes=len(typed), results=len(results),
+                   first='{0:.2f}ms'.format(times[0] * 1000),
+                   then='{0:.2f}ms'.format(
+                       sum(times[1:]) * 1000 / (len(times) - 1)))
+    finally:
+        ctagsplugin.tag_files.invalidate(tag_file)
+        os.remove(tag_file)
+        os.remove(index_file)
+        os.remove(tag_file + ctags.ABBREVIATION_INDEX_SUFFIX)
+        os.remove(tag_file + ctags.BLOOM_FILTER_SUFFIX)
+
+
+def bench_federated_search(views, lines):
+    """
+    Compare searching tag files one by one, stopping at the first with
+    results, and searching them all with ``search_tag_files``.
+    """
+    tag_lines = bench_ctags.build_tag_lines(views * lines)
+    tag_files = [bench_ctags.write_tag_file(tag_lines[index::12])
+                 for index in range(12)]
+    for tag_file in tag_files:
+        ctags.build_line_index(tag_file)
+    # symbols only in the last tag file
+    last = set(line.split('\t', 1)[0] for line in tag_lines[11::12])
+    for index in range(11):
+        last.difference_update(
+            line.split('\t', 1)[0] for line in tag_lines[index::12])
+    symbols = sorted(last)[:100]
+
+    def search(path, symbol):
+        return ctagsplugin.search_tags_file(path, symbol)
+
+    try:
+        for name in ('sequential', 'search_tag_files'):
+            start = time.time()
+            for symbol in symbols:
+                if name == 'sequential':
+                    for tag_file in tag_files:
+                        if search(tag_file, symbol):
+                            break
+                else:
+                    ctags.search_tag_files(
+                        tag_files, lambda path: search(path, symbol))
+            report(name, files=len(tag_files), symbols=len(symbols),
+                   per_lookup='{0:.2f}ms'.format(
+                       (time.time() - start) * 1000 / len(symbols)))
+    finally:
+        for tag_file in tag_files:
+            ctagsplugin.tag_files.invalidate(tag_file)
+            os.remove(tag_file)
+            os.remove(tag_file + ctags.LINE_INDEX_SUFFIX)
+
+
+BENCHMARKS = {
+    'buffer_completions': bench_buffer_completions,
+    'completion_session': bench_completion_session,
+    'federated_search': bench_federated_search,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--views', type=int, default=40,
+                        help='number of synthetic views')
+    parser.add_argument('--lines', type=int, default=2000,
+                        help='number of lines in each synthetic view')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run, from: {0} (default: all)'
+                        .format(', '.join(sorted(BENCHMARKS))))
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {0}'.format(name))
+
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print('# {0} ({1} views of {2} lines)'.format(
+            name, args.views, args.lines))
+        BENCHMARKS[name](args.views, args.lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,18 +3,54 @@ A ctags wrapper, parser and sorter.
 """
 
 import codecs
+import fnmatch
+import hashlib
+import json
 import re
 import os
 import sys
 import subprocess
-import bisect
+import heapq
+import marshal
 import mmap
+import multiprocessing
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from itertools import chain, islice
 
 if sys.version_info < (2, 7):
     from helpers.check_output import check_output
 else:
     from subprocess import check_output
 
+try:
+    from sys import intern
+except ImportError:  # python 2, where intern is a builtin for str only
+    _intern = intern
+
+    def intern(string):
+        """
+        Intern ``string`` if it is a native string, else return it as is.
+        """
+        if isinstance(string, str):
+            return _intern(string)
+        return string
+
+try:
+    from shlex import quote
+except ImportError:  # python 2
+    from pipes import quote
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
 #
 # Contants
 #
@@ -27,6 +63,17 @@ TAGS_RE = re.compile(
     r'(?:\t(?P<fields>.*))?'
 )
 
+# separator between ex_command and the remaining elements of a tag line
+EX_COMMAND_END = ';"\t'
+
+EX_COMMAND_ESCAPES_RE = re.compile(r"\\(\$|/|\^|\\)")
+
+# elements of a tag line, in order
+TAG_ELEMENTS = ('symbol', 'filename', 'ex_command', 'type', 'fields')
+
+# elements which are unchanged by ``post_process_tag``
+RAW_ELEMENTS = ('symbol', 'filename', 'type')
+
 # column indexes
 SYMBOL = 0
 FILENAME = 1
@@ -42,6 +89,122 @@ PATH_IGNORE_FIELDS = (
 
 TAG_PATH_SPLITTERS = ('/', '.', '::', ':')
 
+# line-offset index file layout: magic, then one entry per line start, then
+# the size of the tag file as a sentinel
+LINE_INDEX_SUFFIX = '.idx'
+LINE_INDEX_MAGIC = b'CTAGSIDX'
+LINE_INDEX_ENTRY = struct.Struct('<Q')
+
+# suffix index file layout: as a line index, but with the offsets of lines
+# ordered by the reversed value of a column
+SUFFIX_INDEX_SUFFIX = '.sfx'
+SUFFIX_INDEX_MAGIC = b'CTAGSSFX'
+
+# fold index file layout: as a line index, but with the offsets of lines
+# ordered by their uppercased symbol
+FOLD_INDEX_SUFFIX = '.fold'
+FOLD_INDEX_MAGIC = b'CTAGSFLD'
+
+# trigram index file layout: magic, header of the number of runs of lines
+# with the same symbol and of trigrams, the offset of the start of each run
+# with the size of the tag file as a sentinel, the sorted trigrams with the
+# start and length of their postings, then the postings of run numbers
+TRIGRAM_INDEX_SUFFIX = '.tri'
+TRIGRAM_INDEX_MAGIC = b'CTAGSTRI'
+TRIGRAM_INDEX_HEADER = struct.Struct('<QQ')
+TRIGRAM_INDEX_GRAM = struct.Struct('<3sQI')
+TRIGRAM_INDEX_POSTING = struct.Struct('<I')
+
+# completion index file layout: magic, header of the number of distinct
+# symbols and the size of the tag file, the offset of each entry with the
+# size of the entries as a sentinel, then the entries. Each entry is a line
+# of the lowercased symbol, a tab and the symbol, and entries are sorted
+COMPLETION_INDEX_SUFFIX = '.cmp'
+COMPLETION_INDEX_MAGIC = b'CTAGSCMP'
+COMPLETION_INDEX_HEADER = struct.Struct('<QQ')
+
+# abbreviation index file layout: as a completion index, but each entry is a
+# line of the abbreviation of a symbol, a tab and the symbol. See
+# ``get_abbreviation``
+ABBREVIATION_INDEX_SUFFIX = '.abv'
+ABBREVIATION_INDEX_MAGIC = b'CTAGSABV'
+
+# bloom filter file layout: magic, header of the size of the tag file, the
+# number of bits and the number of hashes per symbol, then the bits. Each
+# symbol is added lowercased, so the filter can be checked ignoring case
+BLOOM_FILTER_SUFFIX = '.blm'
+BLOOM_FILTER_MAGIC = b'CTAGSBLM'
+BLOOM_FILTER_HEADER = struct.Struct('<QQI')
+
+# bits per symbol and hashes of a bloom filter, for about 1% false positives
+BLOOM_FILTER_BITS = 10
+BLOOM_FILTER_HASHES = 7
+
+# words of a symbol, split at camel humps, digits and punctuation
+SYMBOL_WORDS_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+# minimum trigram similarity of symbols matched by a fuzzy search
+FUZZY_THRESHOLD = 0.5
+
+# seconds an unused tag file is kept open by a ``TagFilePool``
+TAG_FILE_POOL_MAX_IDLE = 60
+
+# smallest read buffer, in bytes, of each sort run file being merged
+SORT_RUN_MIN_BUFFER = 8192
+
+# approximate memory, in bytes, held for each item of a sort run besides the
+# characters of its strings: the tuple, any integers and the string headers
+SORT_RUN_OVERHEAD = 200
+
+# directories never searched for source files when building tags in parallel
+IGNORED_DIRS = ('.git', '.hg', '.svn', '.bzr', 'CVS')
+
+# values of the ctags ``--sort`` option
+SORT_NO = 'no'
+SORT_YES = 'yes'
+SORT_FOLDCASE = 'foldcase'
+
+# values of the ``!_TAG_FILE_SORTED`` pseudo-tag for each sort mode
+TAG_FILE_SORTED = {'0': SORT_NO, '1': SORT_YES, '2': SORT_FOLDCASE}
+
+# pseudo-tags some versions of ctags leave out when writing to stdout
+TAG_FILE_FORMAT_HEADER = (
+    b'!_TAG_FILE_FORMAT\t2\t/extended format; --format=1 will not append ;" '
+    b'to lines/\n')
+TAG_FILE_SORTED_HEADER = (
+    '!_TAG_FILE_SORTED\t{0}\t/0=unsorted, 1=sorted, 2=foldcase/\n')
+
+# strategies for searching a tag file. See ``get_search_strategy``
+SEARCH_BISECT = 'bisect'
+SEARCH_FOLDCASE = 'foldcase'
+SEARCH_INDEXED = 'indexed'
+SEARCH_LINEAR = 'linear'
+
+# manifest of source files recorded for incremental builds
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_VERSION = 1
+
+# version of the tags returned by ``parse_tag_lines``. Bump this when
+# parsing changes, so tags parsed by older versions are not loaded from a
+# ``ParsedTagCache``
+PARSER_VERSION = 2
+
+# parsed tag cache entry layout: magic, size of the header, the header of
+# whether the tags are compact, the ``root_dir`` of their tag class and the
+# start and end of the tags of each key, then the tags of each key, all
+# marshalled
+PARSED_TAG_CACHE_MAGIC = b'CTAGSPTC'
+PARSED_TAG_CACHE_HEADER = struct.Struct('<Q')
+
+# default maximum size of a parsed tag cache, in bytes
+PARSED_TAG_CACHE_SIZE = 256 * 1024 * 1024
+
+# default memory budget of a ``TagsCache``, in bytes
+TAGS_CACHE_SIZE = 64 * 1024 * 1024
+
+# number of keys of parsed tags measured to estimate their size
+TAGS_SIZE_SAMPLES = 64
+
 #
 # Functions
 #
@@ -65,6 +228,38 @@ def splits(string, *splitters):
         if string:
             yield string
 
+def split_tag_path(tag_path):
+    """
+    Split a tag path on all of ``TAG_PATH_SPLITTERS``.
+
+    Gives the same result as ``splits(tag_path, *TAG_PATH_SPLITTERS)``, but
+    avoids the recursive generators, as every splitter is itself made up of
+    splitters.
+
+    :param tag_path: string to split
+
+    :returns: list of non-empty parts of ``tag_path``"""
+    first = TAG_PATH_SPLITTERS[0]
+
+    for splitter in TAG_PATH_SPLITTERS[1:]:
+        tag_path = tag_path.replace(splitter, first)
+
+    return [part for part in tag_path.split(first) if part]
+
+def match_any(matchers):
+    """
+    Combine a number of match functions.
+
+    :param matchers: functions taking a string, such as ``pattern.match``
+
+    :returns: function returning True if any of ``matchers`` match a string"""
+    def match(value):
+        for matcher in matchers:
+            if matcher(value):
+                return True
+        return False
+    return match
+
 # Tag processing functions
 
 def parse_tag_lines(lines, order_by='symbol', tag_class=None, filters=None):
@@ -78,48 +273,231 @@ def parse_tag_lines(lines, order_by='symbol', tag_class=None, filters=None):
 
     :param lines: list of tag lines from a tagfile
     :param order_by: element by which the result should be sorted
-    :param tag_class: a Class to wrap around the resulting dictionary
+    :param tag_class: a Class to wrap around the resulting dictionary. If
+        this is a ``LazyTagElements``, tags are built from the raw line and
+        only processed as their elements are accessed
     :param filters: filters to apply to resulting dictionary
 
     :returns: tag object or dictionary containing a sorted, filtered version
         of the original input tag lines
     """
     tags_lookup = {}
+    lazy = tag_class is not None and issubclass(tag_class, LazyTagElements)
+    raw_filters, tag_filters = compile_tag_filters(filters)
 
     for line in lines:
-        skip = False
-
         if isinstance(line, Tag):  # handle both text and tag objects
             line = line.line
 
         line = line.rstrip('\r\n')
 
-        search_obj = TAGS_RE.search(line)
+        if lazy:  # defer processing until elements are accessed
+            spans = locate_tag_line(line) or locate_tag_line_regex(line)
 
-        if not search_obj:
-            continue
+            if spans is None:
+                continue
 
-        tag = search_obj.groupdict()  # convert regex search result to dict
+            tag = tag_class(line, spans)
+
+            if raw_filters and is_filtered(tag, raw_filters):
+                continue
+        else:
+            tag = match_tag_line(line)
+
+            if tag is None:
+                continue
 
-        tag = post_process_tag(tag)
+            # filter before processing, so filtered lines cost less
+            if raw_filters and is_filtered(tag, raw_filters):
+                continue
 
-        if tag_class is not None:  # if 'casting' to a class
-            tag = tag_class(tag)
+            tag = post_process_tag(tag)
 
-        if filters:
-            # apply filters, filtering out any matching entries
-            for filt in filters:
-                for key, val in list(filt.items()):
-                    if re.match(val, tag[key]):
-                        skip = True
+            if tag_class is not None:  # if 'casting' to a class
+                tag = tag_class(tag)
 
-        if skip:  # if a filter was matched, ignore line (filter out)
+        if tag_filters and is_filtered(tag, tag_filters):
             continue
 
         tags_lookup.setdefault(tag[order_by], []).append(tag)
 
     return tags_lookup
 
+def compile_tag_filters(filters):
+    """
+    Compile a list of filters into predicates.
+
+    Each filter is a dict mapping a tag element to a regex. A tag is
+    filtered out if any regex matches the start of the element. Filters are
+    compiled into a single predicate per element, and split by whether the
+    element is available before a tag is processed (see ``RAW_ELEMENTS``).
+
+    :param filters: list of dicts of element names and regexen
+
+    :returns: tuple of lists of ``(element, predicate)`` pairs for raw and
+        processed elements
+    """
+    patterns = {}
+
+    for filt in filters or []:
+        for key, val in filt.items():
+            patterns.setdefault(key, []).append(re.compile(val))
+
+    raw_filters, tag_filters = [], []
+
+    for key in sorted(patterns):
+        matchers = [pattern.match for pattern in patterns[key]]
+
+        if len(matchers) == 1:
+            predicate = matchers[0]
+        else:
+            predicate = match_any(matchers)
+
+        if key in RAW_ELEMENTS:
+            raw_filters.append((key, predicate))
+        else:
+            tag_filters.append((key, predicate))
+
+    return raw_filters, tag_filters
+
+def is_filtered(tag, filters):
+    """
+    Check if a tag should be filtered out.
+
+    :param tag: dict containing a tag
+    :param filters: list of ``(element, predicate)`` pairs, as returned by
+        ``compile_tag_filters``
+
+    :returns: True if any predicate matches, else False. Elements missing
+        from the tag never match
+    """
+    for key, predicate in filters:
+        value = tag.get(key)
+        if value is not None and predicate(value):
+            return True
+    return False
+
+def locate_tag_line(line):
+    """
+    Locate the elements of a tag line without using regexen.
+
+    This is a fast path equivalent to the group spans of
+    ``TAGS_RE.search(line)`` for well-formed tag lines. Like the greedy
+    ``ex_command`` group in ``TAGS_RE``, the ``ex_command`` is taken to end at
+    the last ``;"``.
+
+    :param line: a tag line, without line endings
+
+    :returns: tuple of ``(start, end)`` offsets of the symbol, filename,
+        ex_command, type and fields elements, with None for missing fields,
+        or None if the line could not be split, in which case ``TAGS_RE``
+        should be tried instead
+    """
+    symbol_end = line.find('\t')
+    filename_end = line.find('\t', symbol_end + 1)
+
+    if symbol_end < 1 or filename_end <= symbol_end + 1:
+        return None
+
+    ex_start = filename_end + 1
+    ex_end = line.rfind(EX_COMMAND_END, ex_start)
+
+    if ex_end == -1:
+        return None
+
+    type_start = ex_end + len(EX_COMMAND_END)
+    type_end = line.find('\t', type_start)
+
+    if type_end == -1:
+        type_end = len(line)
+        fields = None
+    else:
+        fields = (type_end + 1, len(line))
+
+    if (type_end == type_start or line.find('\r', type_start, type_end) != -1
+            or line.find('\n', type_start, type_end) != -1):
+        return None
+
+    first, last = line[ex_start], line[ex_end - 1]
+
+    if not ((ex_end - ex_start > 2 and first == last and first in '/?') or
+            line[ex_start:ex_end].isdigit()):
+        return None
+
+    return ((0, symbol_end), (symbol_end + 1, filename_end),
+            (ex_start, ex_end), (type_start, type_end), fields)
+
+def locate_tag_line_regex(line):
+    """
+    Locate the elements of a tag line using ``TAGS_RE``.
+
+    :param line: a tag line, without line endings
+
+    :returns: tuple of offsets as for ``locate_tag_line``, or None if the line
+        is not a valid tag
+    """
+    search_obj = TAGS_RE.search(line)
+
+    if not search_obj:
+        return None
+
+    spans = tuple(search_obj.span(name) for name in TAG_ELEMENTS)
+
+    if spans[-1][0] == -1:  # no fields
+        spans = spans[:-1] + (None, )
+
+    return spans
+
+def split_tag_line(line):
+    """
+    Split a tag line into its elements without using regexen.
+
+    This is a fast path equivalent to ``TAGS_RE.search(line).groupdict()``
+    for well-formed tag lines. See ``locate_tag_line``.
+
+    :param line: a tag line, without line endings
+
+    :returns: dict containing the unprocessed tag, or None if the line could
+        not be split, in which case ``TAGS_RE`` should be tried instead
+    """
+    spans = locate_tag_line(line)
+
+    if spans is None:
+        return None
+
+    symbol, filename, ex_command, type_, fields = spans
+
+    return {
+        'symbol': line[symbol[0]:symbol[1]],
+        'filename': line[filename[0]:filename[1]],
+        'ex_command': line[ex_command[0]:ex_command[1]],
+        'type': line[type_[0]:type_[1]],
+        'fields': line[fields[0]:fields[1]] if fields else None}
+
+def match_tag_line(line):
+    """
+    Split a tag line into its elements.
+
+    Uses ``split_tag_line``, falling back to ``TAGS_RE`` for lines the fast
+    path cannot handle.
+
+    :param line: a tag line, without line endings
+
+    :returns: dict containing the unprocessed tag, or None if the line is not
+        a valid tag
+    """
+    tag = split_tag_line(line)
+
+    if tag is None:
+        search_obj = TAGS_RE.search(line)
+
+        if not search_obj:
+            return None
+
+        tag = search_obj.groupdict()  # convert regex search result to dict
+
+    return tag
+
 def post_process_tag(tag):
     """
     Process 'EX Command'-related elements of a tag.
@@ -185,8 +563,13 @@ def process_ex_cmd(tag):
 
     if ex_cmd.isdigit():  # if a line number, do nothing
         return ex_cmd
-    else:                 # else a regex, so unescape
-        return re.sub(r"\\(\$|/|\^|\\)", r'\1', ex_cmd[2:-2])  # unescape regex
+
+    ex_cmd = ex_cmd[2:-2]
+
+    if '\\' in ex_cmd:  # else a regex, so unescape
+        ex_cmd = EX_COMMAND_ESCAPES_RE.sub(r'\1', ex_cmd)
+
+    return ex_cmd
 
 def process_fields(tag):
     """
@@ -252,8 +635,7 @@ def create_tag_path(tag):
     tag_path += tag.get('symbol')
 
     # split string on seperators and append tag filename to resulting list
-    splitup = ([tag.get('filename')] +
-               list(splits(tag_path, *TAG_PATH_SPLITTERS)))
+    splitup = [tag.get('filename')] + split_tag_path(tag_path)
 
     # convert list to tuple
     result = {'tag_path': tuple(splitup)}
@@ -262,7 +644,9 @@ def create_tag_path(tag):
 
 # Tag building/sorting functions
 
-def build_ctags(path, cmd=None, tag_file=None, recursive=False, opts=None):
+def build_ctags(path, cmd=None, tag_file=None, recursive=False, opts=None,
+                run_size=None, jobs=1, stream=False, incremental=False,
+                manifest_hash=False):
     """
     Execute the ``ctags`` command using ``Popen``.
 
@@ -272,6 +656,18 @@ def build_ctags(path, cmd=None, tag_file=None, recursive=False, opts=None):
         given by path. This overrides filename specified by ``path``
     :param tag_file: filename to use for the tag file. Defaults to ``tags``
     :param opts: list of additional options to pass to the ctags executable
+    :param run_size: if given, re-sort the tag file using roughly at most
+        this many bytes of memory. See ``resort_ctags``
+    :param jobs: number of ctags processes to run in parallel when ``path``
+        is a directory, or 0 for one per CPU. See ``build_ctags_parallel``
+    :param stream: read tags from the output of ctags, writing the tag file,
+        its re-sorted copy and their indexes in a single pass. See
+        ``write_tag_files``
+    :param incremental: when ``path`` is a directory, only tag the files
+        changed since the last incremental build. See
+        ``build_ctags_incremental``
+    :param manifest_hash: compare file contents, not just modification times
+        and sizes, to find changed files in an incremental build
 
     :returns: original ``tag_file`` filename
     """
@@ -290,171 +686,2630 @@ def build_ctags(path, cmd=None, tag_file=None, recursive=False, opts=None):
     else:
         cwd = path
 
-    if tag_file:
-        cmd.append('-f {0}'.format(tag_file))
+    if opts and type(opts) != list:  # *should* be a list, but better safe
+        opts = [opts]                 # than sorry
+
+    if jobs is not None and jobs < 1:
+        jobs = multiprocessing.cpu_count()
+
+    if incremental and not os.path.isfile(path):
+        build_ctags_incremental(cmd, cwd,
+                                os.path.join(cwd, tag_file or 'tags'),
+                                recursive, opts, jobs or 1, run_size,
+                                manifest_hash)
+        return os.path.join(cwd, tag_file or 'tags')
 
-    if opts:
-        if type(opts) == list:
+    if jobs and jobs > 1 and not os.path.isfile(path):
+        # Exuberant ctags defaults to ``tags`` filename.
+        tag_file = os.path.join(cwd, tag_file or 'tags')
+        files = find_source_files(cwd, recursive, opts, tag_file)
+
+        if not recursive:  # named as ctags names the files of ``path/*``
+            files = [os.path.join(path, name) for name in files]
+
+        build_ctags_parallel(cmd, cwd, files, tag_file, opts, jobs, run_size,
+                             stream)
+    else:
+        if stream:  # write tags to stdout
+            cmd.extend(['-f', '-'])
+        elif tag_file:
+            cmd.append('-f {0}'.format(tag_file))
+
+        if opts:
             cmd.extend(opts)
-        else:  # *should* be a list, but better safe than sorry
-            cmd.append(opts)
 
-    if recursive:  # ignore any file specified in path if recursive set
-        cmd.append('-R')
-    elif os.path.isfile(path):
-        filename = os.path.basename(path)
-        cmd.append(filename)
-    else:  # search all files in current directory
-        cmd.append(os.path.join(path, '*'))
+        if recursive:  # ignore any file specified in path if recursive set
+            cmd.append('-R')
+        elif os.path.isfile(path):
+            filename = os.path.basename(path)
+            cmd.append(filename)
+        else:  # search all files in current directory
+            cmd.append(os.path.join(path, '*'))
+
+        if not tag_file:  # Exuberant ctags defaults to ``tags`` filename.
+            tag_file = os.path.join(cwd, 'tags')
+        else:
+            if os.path.dirname(tag_file) != cwd:
+                tag_file = os.path.join(cwd, tag_file)
+
+        if stream:
+            write_tag_files(stream_ctags(cmd, cwd), tag_file, run_size,
+                            get_sort_mode(opts))
+        else:
+            run_ctags(cmd, cwd)
+
+    if not stream:
+        # re-sort ctag file in filename order to improve search performance
+        resort_ctags(tag_file, run_size)
+
+        # index line offsets so searches can bisect over lines, not bytes
+        build_line_index(tag_file)
+        build_line_index(tag_file + '_sorted_by_file')
+
+        # index filenames by suffix, for searching by file extension
+        build_suffix_index(tag_file + '_sorted_by_file', FILENAME, run_size)
+
+        # index symbols by suffix, for searching by symbol suffix
+        build_suffix_index(tag_file, SYMBOL, run_size)
+
+        # index symbols by trigram, for searching by substring
+        build_trigram_index(tag_file)
+
+        # index symbols ignoring case, for case-insensitive searches
+        build_fold_index(tag_file, run_size)
+
+        # index distinct symbols ignoring case, for completions
+        build_completion_index(tag_file)
+
+    return tag_file
+
+def stream_ctags(cmd, cwd):
+    """
+    Execute a ``ctags`` command which writes tags to stdout.
+
+    :param cmd: list containing the command and its arguments, including
+        ``-f -``
+    :param cwd: directory to execute the command in
 
+    :returns: generator of tag lines, as bytes, read as ctags writes them.
+        Raises ``CalledProcessError`` once exhausted if ctags failed
+    """
     # workaround for the issue described here:
     #   http://bugs.python.org/issue6689
     if os.name == 'posix':
         cmd = ' '.join(cmd)
 
-    # execute the command
-    check_output(cmd, cwd=cwd, shell=True, stdin=subprocess.PIPE,
-                 stderr=subprocess.STDOUT)
+    # stderr goes to a file, as a full pipe would block ctags
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, cwd=cwd, shell=True,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=errors)
+        process.stdin.close()
 
-    if not tag_file:  # Exuberant ctags defaults to ``tags`` filename.
-        tag_file = os.path.join(cwd, 'tags')
-    else:
-        if os.path.dirname(tag_file) != cwd:
-            tag_file = os.path.join(cwd, tag_file)
+        try:
+            for line in process.stdout:
+                yield line
+        finally:
+            process.stdout.close()
+            retcode = process.wait()
 
-    # re-sort ctag file in filename order to improve search performance
-    resort_ctags(tag_file)
+        if retcode:
+            errors.seek(0)
+            error = subprocess.CalledProcessError(retcode, cmd)
+            error.output = errors.read()
+            raise error
 
-    return tag_file
+def write_tag_files(lines, tag_file, run_size=None, sort_mode=SORT_YES):
+    """
+    Write a tag file and its re-sorted copy from a stream of tag lines.
+
+    Produces the same files as writing ``lines`` to ``tag_file`` then
+    calling ``resort_ctags`` and ``build_line_index`` on both files, but
+    without reading or decoding ``tag_file`` again. Pseudo-tags giving the
+    format and sort order are added if ``lines`` has none, as ctags leaves
+    them out when writing to stdout.
 
-def resort_ctags(tag_file):
+    :param lines: iterable of tag lines, as bytes
+    :param tag_file: The location of the tagfile to write
+    :param run_size: if given, re-sort and sort the indexes using bounded
+        memory. See ``resort_ctags``
+    :param sort_mode: how ``lines`` are sorted. See ``get_sort_mode``
+
+    :returns: None
     """
-    Rearrange ctags file for speed.
+    fold = sort_mode != SORT_FOLDCASE  # else bisected as is
+    if not fold and os.path.exists(tag_file + FOLD_INDEX_SUFFIX):
+        os.remove(tag_file + FOLD_INDEX_SUFFIX)
 
-    Resorts (re-sort) a CTag file in order of file. This improves searching
-    performance when searching tags by file as a binary search can be used.
+    with TagFileWriter(tag_file, suffix_column=SYMBOL, trigrams=True,
+                       fold=fold, completions=True,
+                       run_size=run_size) as writer:
+        def decoded():
+            for line in add_tag_headers(lines, sort_mode):
+                writer.write(line)
+                yield line.decode('utf-8', 'replace')
 
-    The algorithm works as so:
+        with TagFileWriter(tag_file + '_sorted_by_file',
+                           suffix_column=FILENAME,
+                           run_size=run_size) as sorted_writer:
+            for line in sort_lines_by_file(decoded(), run_size):
+                sorted_writer.write(
+                    strip_filename_prefix(line).encode('utf-8', 'replace'))
 
-        For each line in the tag file
-            Read the file name (``file_name``) the tag belongs to
-            If not exists, create an empty array and store in the
-                dictionary with the file name as key
-            Save the line to this list
-        Create a new ``[tagfile]_sorted_by_file`` file
-        For each key in the sorted dictionary
-            For each line in the list indicated by the key
-                Split the line on tab character
-                Remove the prepending ``.\`` from the ``file_name`` part of
-                    the                   tag
-                Join the line again and write the ``sorted_by_file`` file
+def add_tag_headers(lines, sort_mode=SORT_YES):
+    """
+    Add the format and sort order pseudo-tags to tag lines missing them.
 
-    :param tag_file: The location of the tagfile to be sorted
+    :param lines: iterable of tag lines, as bytes
+    :param sort_mode: how ``lines`` are sorted. See ``get_sort_mode``
 
-    :returns: None
+    :returns: generator of tag lines, as bytes
     """
-    keys = {}
+    lines = iter(lines)
+    headers, first = [], []
 
-    with codecs.open(tag_file, encoding='utf-8', errors='replace') as file_:
-        for line in file_:
-            keys.setdefault(line.split('\t')[FILENAME], []).append(line)
+    for line in lines:
+        if not line.startswith(b'!_'):
+            first.append(line)
+            break
+        headers.append(line)
 
-    with codecs.open(tag_file+'_sorted_by_file', 'w', encoding='utf-8',
-                     errors='replace') as file_:
-        for k in sorted(keys):
-            for line in keys[k]:
-                split = line.split('\t')
-                split[FILENAME] = split[FILENAME].lstrip('.\\')
-                file_.write('\t'.join(split))
+    names = set(line.split(b'\t', 1)[0] for line in headers)
+    sorted_value = dict((mode, value) for value, mode
+                        in TAG_FILE_SORTED.items())[sort_mode]
+    missing = [line for line in (
+        TAG_FILE_FORMAT_HEADER,
+        TAG_FILE_SORTED_HEADER.format(sorted_value).encode('utf-8'))
+        if line.split(b'\t', 1)[0] not in names]
 
-#
-# Models
-#
+    if missing:
+        headers = sorted(headers + missing)
 
-class TagElements(dict):
+    for line in chain(headers, first, lines):
+        yield line
+
+def run_ctags(cmd, cwd):
     """
-    Model the entries of a tag file.
+    Execute a ``ctags`` command, raising an error if it fails.
+
+    :param cmd: list containing the command and its arguments
+    :param cwd: directory to execute the command in
+
+    :returns: output of the command
     """
-    def __init__(self, *args, **kw):
-        """Initialise Tag object"""
-        dict.__init__(self, *args, **kw)
-        self.__dict__ = self
+    # workaround for the issue described here:
+    #   http://bugs.python.org/issue6689
+    if os.name == 'posix':
+        cmd = ' '.join(cmd)
 
-class Tag(object):
+    # execute the command
+    return check_output(cmd, cwd=cwd, shell=True, stdin=subprocess.PIPE,
+                        stderr=subprocess.STDOUT)
+
+def build_ctags_parallel(cmd, cwd, files, tag_file, opts=None, jobs=2,
+                         run_size=None, stream=False):
     """
-    Model a tag.
+    Build a tag file by running a number of ``ctags`` processes in parallel.
 
-    This exists mainly to enable different types of sorting.
+    The source files are split into ``jobs`` shards of roughly equal size,
+    each of which is tagged by a separate ``ctags`` process. The resulting
+    sorted tag files are then merged into ``tag_file``.
+
+    :param cmd: list containing the ctags command
+    :param cwd: directory to execute ctags in
+    :param files: list of paths of source files, relative to ``cwd``
+    :param tag_file: path of the tag file to build
+    :param opts: list of additional options to pass to the ctags executable
+    :param jobs: number of ctags processes to run
+    :param run_size: see ``write_tag_files``
+    :param stream: write the merged tags using ``write_tag_files``, rather
+        than just writing ``tag_file``
+
+    :returns: None
     """
-    def __init__(self, line, column=0):
-        if isinstance(line, bytes):  # python 3 compatibility
-            line = line.decode('utf-8', 'replace')
-        self.line = line
-        self.column = column
+    shards = [shard for shard in shard_files(files, jobs, cwd) if shard]
+    tmp_dir = tempfile.mkdtemp(prefix='ctags_shards_')
+    threads, errors, shard_tag_files = [], [], []
 
-    def __lt__(self, other):
-        return self.line.split('\t')[self.column] < other
+    def run(shard_cmd):
+        try:
+            run_ctags(shard_cmd, cwd)
+        except Exception as e:
+            errors.append(e)
 
-    def __gt__(self, other):
-        return self.line.split('\t')[self.column] > other
+    try:
+        for index, shard in enumerate(shards):
+            list_file = os.path.join(tmp_dir, 'files_{0}'.format(index))
+            shard_tag_file = os.path.join(tmp_dir, 'tags_{0}'.format(index))
 
-    def __getitem__(self, index):
-        return self.line.split('\t')[index]
+            with open(list_file, 'w') as file_:
+                file_.write('\n'.join(shard) + '\n')
 
-    def __len__(self):
-        return len(self.line.split('\t'))
+            if os.name == 'posix':  # joined into a shell command
+                paths = [quote(shard_tag_file), quote(list_file)]
+            else:  # quoted by ``Popen``
+                paths = [shard_tag_file, list_file]
 
-class TagFile(object):
+            shard_cmd = (cmd + ['-f', paths[0]] + (opts or []) +
+                         ['-L', paths[1]])
+
+            threads.append(threading.Thread(target=run, args=(shard_cmd, )))
+            shard_tag_files.append(shard_tag_file)
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        if stream:
+            shard_files_o = [open(path, 'rb') for path in shard_tag_files]
+            try:
+                write_tag_files(
+                    merge_tag_lines(shard_files_o, get_sort_mode(opts)),
+                    tag_file, run_size, get_sort_mode(opts))
+            finally:
+                for file_ in shard_files_o:
+                    file_.close()
+        else:
+            merge_tag_files(shard_tag_files, tag_file, get_sort_mode(opts))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def build_ctags_incremental(cmd, cwd, tag_file, recursive=False, opts=None,
+                            jobs=1, run_size=None, hashed=False):
     """
-    Model a tag file.
+    Update a tag file by tagging only the source files changed since the
+    last build.
 
-    This doesn't actually hold a entire tag file, due in part to the sheer
-    size of some tag files (> 100 MB files are possible). Instead, it acts
-    as a 'wrapper' of sorts around a file, providing functionality like
-    searching for a retrieving tags, finding tags based on given criteria
-    (prefix, suffix, exact), getting the directory of a tag and so forth.
+    The modification time and size (and, if ``hashed``, a hash of the
+    contents) of each source file are recorded in a manifest next to the tag
+    file. Files which are new or differ from the manifest are tagged, and
+    the resulting tags spliced into the tag file in place of any old tags
+    for those files or for deleted files. If there is no usable manifest,
+    all files are tagged.
+
+    :param cmd: list containing the ctags command
+    :param cwd: directory to execute ctags in
+    :param tag_file: path of the tag file to update
+    :param recursive: search subdirectories of ``cwd`` for source files
+    :param opts: list of additional options to pass to the ctags executable
+    :param jobs: number of ctags processes to run
+    :param run_size: see ``write_tag_files``
+    :param hashed: compare file contents as well as modification times and
+        sizes
+
+    :returns: tuple of lists of the paths of changed and removed files, or
+        ``None`` if all files were tagged
     """
-    file_o = None
-    mapped = None
+    options = {'cmd': cmd, 'opts': opts or [], 'recursive': recursive,
+               'hashed': hashed}
+    manifest = read_manifest(tag_file)
+    # scanned before running ctags, so files saved meanwhile are tagged again
+    files = scan_source_files(
+        cwd, find_source_files(cwd, recursive, opts, tag_file))
 
-    def __init__(self, path, column):
-        """
-        Initialise object.
+    if (manifest is None or manifest['options'] != options or
+            manifest['tag_file'] != stat_file(tag_file) or
+            not os.path.exists(tag_file + '_sorted_by_file')):
+        if hashed:
+            for path, entry in files.items():
+                entry[2] = hash_file(os.path.join(cwd, path))
 
-        The file indicated by ``path`` must be sorted by values in the column
-        indicated by ``column``.
+        build_ctags_parallel(cmd, cwd, sorted(files), tag_file, opts, jobs,
+                             run_size, stream=True)
+        write_manifest(tag_file, options, files)
+        return None
 
-        :param path: path to a tag file
-        :param column: column to search on
+    changed, removed = diff_manifest(manifest['files'], files, cwd)
 
-        :returns: None
-        """
-        self.path = path
-        self.column = column
+    if changed or removed:
+        tmp_dir = tempfile.mkdtemp(prefix='ctags_incremental_')
 
-    def __getitem__(self, index):
-        """
-        Provide sequence-type interface to tag file.
-        """
-        self.mapped.seek(index)
-        result = self.mapped.readline()
+        try:
+            changed_tag_file = os.path.join(tmp_dir, 'tags')
+            build_ctags_parallel(cmd, cwd, changed, changed_tag_file, opts,
+                                 jobs)
+            splice_tag_files(tag_file, changed_tag_file, changed + removed,
+                             get_sort_mode(opts), run_size)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        if index != 0:  # handle first line
-            result = self.mapped.readline()  # get a complete line
+    write_manifest(tag_file, options, files)
 
-        result = result.strip()
+    return changed, removed
 
-        return Tag(result, self.column)
+def scan_source_files(cwd, files):
+    """
+    Record the modification time and size of source files.
 
-    def __len__(self):
-        """
-        Get size of tag file in bytes.
-        """
-        return len(self.mapped)
+    :param cwd: directory the paths are relative to
+    :param files: list of paths of source files, relative to ``cwd``
 
-    def __enter__(self):
-        """
-        Open file on enter when using ``with`` keyword.
+    :returns: dict of paths to ``[mtime, size, hash]`` lists, with no hash
+    """
+    result = {}
+
+    for path in files:
+        stat = stat_file(os.path.join(cwd, path))
+        if stat:  # deleted while scanning
+            result[path] = stat + [None]
+
+    return result
+
+def stat_file(path):
+    """
+    Get the modification time and size of a file.
+
+    :param path: path to file
+
+    :returns: ``[mtime, size]`` list, or ``None`` if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def hash_file(path):
+    """
+    Hash the contents of a file.
+
+    :param path: path to file
+
+    :returns: hex digest of the contents, or ``None`` if the file cannot be
+        read
+    """
+    digest = hashlib.sha1()
+
+    try:
+        with open(path, 'rb') as file_:
+            for chunk in iter(lambda: file_.read(1 << 16), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+
+    return digest.hexdigest()
+
+def diff_manifest(old, new, cwd):
+    """
+    Compare recorded source files with their current state.
+
+    Files whose modification time or size differ are changed, unless their
+    recorded contents hash is unchanged. The hashes of files in ``new`` are
+    filled in from ``old``, or computed, when ``old`` has a hash.
+
+    :param old: dict of paths to ``[mtime, size, hash]`` lists, as recorded
+    :param new: dict of paths to ``[mtime, size, hash]`` lists, as scanned
+    :param cwd: directory the paths are relative to
+
+    :returns: tuple of sorted lists of paths of changed (including new) and
+        removed files
+    """
+    changed = []
+
+    for path in sorted(new):
+        entry = new[path]
+        recorded = old.get(path)
+
+        if recorded and recorded[:2] == entry[:2]:
+            entry[2] = recorded[2]
+            continue
+
+        if recorded and recorded[2]:
+            entry[2] = hash_file(os.path.join(cwd, path))
+            if entry[2] == recorded[2]:  # touched, not modified
+                continue
+
+        changed.append(path)
+
+    removed = sorted(path for path in old if path not in new)
+
+    return changed, removed
+
+def read_manifest(tag_file):
+    """
+    Read the manifest of source files recorded for a tag file.
+
+    :param tag_file: path of the tag file
+
+    :returns: manifest dict, or ``None`` if there is no valid manifest
+    """
+    try:
+        with open(tag_file + MANIFEST_SUFFIX) as file_:
+            manifest = json.load(file_)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if (not isinstance(manifest, dict) or
+            manifest.get('version') != MANIFEST_VERSION):
+        return None
+
+    return manifest
+
+def write_manifest(tag_file, options, files):
+    """
+    Write the manifest of source files for a tag file.
+
+    :param tag_file: path of the tag file, which must already be written
+    :param options: dict of the options the tag file was built with
+    :param files: dict of paths to ``[mtime, size, hash]`` lists
+
+    :returns: None
+    """
+    manifest = {'version': MANIFEST_VERSION, 'options': options,
+                'tag_file': stat_file(tag_file), 'files': files}
+
+    with open(tag_file + MANIFEST_SUFFIX, 'w') as file_:
+        json.dump(manifest, file_)
+
+def splice_tag_files(tag_file, changed_tag_file, paths, sort_mode=SORT_YES,
+                     run_size=None):
+    """
+    Replace the tags for some source files in a tag file.
+
+    The tag file, its re-sorted copy and their indexes are all rewritten.
+
+    :param tag_file: path of the tag file to update
+    :param changed_tag_file: path of a tag file with the new tags
+    :param paths: list of paths of the source files whose tags are replaced
+    :param sort_mode: how the tag files are sorted. See ``merge_tag_lines``
+    :param run_size: see ``write_tag_files``
+
+    :returns: None
+    """
+    paths = set(path.encode('utf-8') for path in paths)
+    tmp_tag_file = tag_file + '.tmp'
+
+    def kept(file_):
+        for line in file_:
+            if (line.startswith(b'!_') or
+                    line.split(b'\t', 2)[FILENAME] not in paths):
+                yield line
+
+    with open(tag_file, 'rb') as file_:
+        with open(changed_tag_file, 'rb') as changed_file:
+            write_tag_files(merge_tag_lines([kept(file_), changed_file],
+                                            sort_mode),
+                            tmp_tag_file, run_size, sort_mode)
+
+    for src, dst in zip(get_tag_file_paths(tmp_tag_file),
+                        get_tag_file_paths(tag_file)):
+        replace_file(src, dst)
+
+def get_tag_file_paths(tag_file):
+    """
+    Get the paths of a tag file, its re-sorted copy and their indexes.
+
+    :param tag_file: path of a tag file
+
+    :returns: list of paths, starting with ``tag_file``
+    """
+    sorted_tag_file = tag_file + '_sorted_by_file'
+    return [tag_file, tag_file + LINE_INDEX_SUFFIX,
+            suffix_index_path(tag_file, SYMBOL),
+            sorted_tag_file, sorted_tag_file + LINE_INDEX_SUFFIX,
+            suffix_index_path(sorted_tag_file, FILENAME)] + [
+        tag_file + suffix for suffix in (
+            TRIGRAM_INDEX_SUFFIX, FOLD_INDEX_SUFFIX, COMPLETION_INDEX_SUFFIX,
+            ABBREVIATION_INDEX_SUFFIX, BLOOM_FILTER_SUFFIX)]
+
+def replace_file(src, dst):
+    """
+    Rename a file, replacing any existing file.
+
+    :param src: path of file to rename
+    :param dst: new path of file
+
+    :returns: None
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:  # python 2, where ``rename`` fails on Windows if ``dst`` exists
+        if os.name != 'posix' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+def find_source_files(path, recursive=False, opts=None, tag_file=None):
+    """
+    Find the files to generate tags for in a directory.
+
+    Files and directories matching the ``--exclude`` patterns of ``opts``
+    are skipped, as ctags skips them when searching directories itself, as
+    are the tag file and the files built alongside it.
+
+    :param path: path to a directory
+    :param recursive: search subdirectories too, skipping ``IGNORED_DIRS``
+    :param opts: list of additional options to pass to the ctags executable
+    :param tag_file: path of the tag file being built, if any
+
+    :returns: sorted list of paths to files, relative to ``path``
+    """
+    patterns = get_exclude_patterns(opts, path)
+    built = set()
+
+    if tag_file:  # including the temporary files written while splicing
+        built.update(os.path.normpath(file_path) for file_path in chain(
+            get_tag_file_paths(tag_file),
+            get_tag_file_paths(tag_file + '.tmp'),
+            [tag_file + MANIFEST_SUFFIX]))
+
+    def included(relpath):
+        name = os.path.basename(relpath)
+        return (os.path.normpath(os.path.join(path, relpath)) not in built and
+                not any(fnmatch.fnmatch(name, pattern) or
+                        fnmatch.fnmatch(relpath, pattern)
+                        for pattern in patterns))
+
+    if not recursive:  # the files a shell glob of ``path/*`` matches
+        return sorted(name for name in os.listdir(path)
+                      if not name.startswith('.') and
+                      os.path.isfile(os.path.join(path, name)) and
+                      included(name))
+
+    result = []
+
+    for root, dirs, files in os.walk(path):
+        relroot = os.path.relpath(root, path)
+        dirs[:] = sorted(
+            name for name in dirs if name not in IGNORED_DIRS and
+            included(os.path.normpath(os.path.join(relroot, name))))
+        for name in sorted(files):
+            relpath = os.path.normpath(os.path.join(relroot, name))
+            if included(relpath):
+                result.append(relpath)
+
+    return result
+
+def get_exclude_patterns(opts, cwd='.'):
+    """
+    Get the patterns of the ``--exclude`` options passed to ctags.
+
+    Patterns starting with ``@`` name a file listing patterns, one per line,
+    as for ctags.
+
+    :param opts: list of additional options to pass to the ctags executable
+    :param cwd: directory ctags is executed in
+
+    :returns: list of ``fnmatch`` patterns
+    """
+    patterns = []
+
+    for opt in opts or []:
+        if not opt.startswith('--exclude='):
+            continue
+        pattern = opt[len('--exclude='):].strip('\'"')
+        if not pattern.startswith('@'):
+            patterns.append(pattern)
+            continue
+        try:
+            with open(os.path.join(cwd, pattern[1:])) as file_:
+                patterns.extend(line.strip() for line in file_
+                                if line.strip())
+        except (IOError, OSError):  # let ctags report it
+            pass
+
+    return patterns
+
+def shard_files(files, count, cwd='.'):
+    """
+    Split a list of files into shards of roughly equal total size.
+
+    Files are assigned largest first to the smallest shard so far.
+
+    :param files: list of paths of files, relative to ``cwd``
+    :param count: number of shards
+    :param cwd: directory the paths are relative to
+
+    :returns: list of ``count`` lists of paths, each in the original order
+    """
+    sizes = {}
+
+    for index, path in enumerate(files):
+        try:
+            sizes[index] = os.path.getsize(os.path.join(cwd, path))
+        except OSError:  # let ctags report it
+            sizes[index] = 0
+
+    heap = [(0, shard) for shard in range(count)]
+    shards = [[] for _ in range(count)]
+
+    for index in sorted(sizes, key=lambda index: -sizes[index]):
+        size, shard = heapq.heappop(heap)
+        shards[shard].append(index)
+        heapq.heappush(heap, (size + sizes[index], shard))
+
+    return [[files[index] for index in sorted(shard)] for shard in shards]
+
+def get_sort_mode(opts):
+    """
+    Get the sort mode ctags will use given a list of options.
+
+    :param opts: list of additional options to pass to the ctags executable
+
+    :returns: one of ``SORT_NO``, ``SORT_YES`` or ``SORT_FOLDCASE``
+    """
+    mode = SORT_YES
+
+    for opt in opts or []:
+        if opt.startswith('--sort='):
+            mode = opt[len('--sort='):]
+        elif opt == '-u':
+            mode = SORT_NO
+
+    return mode if mode in (SORT_NO, SORT_FOLDCASE) else SORT_YES
+
+def merge_tag_files(tag_files, tag_file, sort_mode=SORT_YES):
+    """
+    Merge a number of sorted tag files into one.
+
+    :param tag_files: list of paths to the tag files to merge
+    :param tag_file: path of the merged tag file
+    :param sort_mode: how the tag files are sorted. See ``merge_tag_lines``
+
+    :returns: None
+    """
+    files = [open(path, 'rb') for path in tag_files]
+
+    try:
+        with open(tag_file, 'wb') as file_:
+            file_.writelines(merge_tag_lines(files, sort_mode))
+    finally:
+        for file_ in files:
+            file_.close()
+
+def merge_tag_lines(files, sort_mode=SORT_YES):
+    """
+    Merge the lines of a number of sorted tag files.
+
+    Pseudo-tag (``!_TAG_``) header lines are yielded once, followed by the
+    tags from all files merged in the order given by ``sort_mode``.
+
+    :param files: list of tag files, opened in binary mode
+    :param sort_mode: how the tag files are sorted; one of ``SORT_NO``,
+        ``SORT_YES`` or ``SORT_FOLDCASE``
+
+    :returns: generator of tag lines, as bytes
+    """
+    headers, bodies = [], []
+
+    for file_ in files:
+        first = []
+        for line in file_:
+            if not line.startswith(b'!_'):
+                first.append(line)
+                break
+            if line not in headers:
+                headers.append(line)
+        bodies.append(chain(first, file_))
+
+    if sort_mode == SORT_NO:
+        lines = chain(*bodies)
+    else:
+        if sort_mode == SORT_YES:
+            key = lambda line: line.rstrip(b'\r\n')
+        else:
+            key = lambda line: line.rstrip(b'\r\n').upper()
+        lines = (line for _, line in heapq.merge(
+            *[((key(line), line) for line in body) for body in bodies]))
+        headers.sort()
+
+    for line in headers:
+        yield line
+    for line in lines:
+        yield line
+
+def resort_ctags(tag_file, run_size=None):
+    """
+    Rearrange ctags file for speed.
+
+    Resorts (re-sort) a CTag file in order of file. This improves searching
+    performance when searching tags by file as a binary search can be used.
+
+    The algorithm works as so:
+
+        For each line in the tag file
+            Read the file name (``file_name``) the tag belongs to
+            If not exists, create an empty array and store in the
+                dictionary with the file name as key
+            Save the line to this list
+        Create a new ``[tagfile]_sorted_by_file`` file
+        For each key in the sorted dictionary
+            For each line in the list indicated by the key
+                Split the line on tab character
+                Remove the prepending ``.\\`` from the ``file_name`` part of
+                    the                   tag
+                Join the line again and write the ``sorted_by_file`` file
+
+    This holds the entire tag file in memory. If ``run_size`` is given,
+    ``resort_ctags_external`` is used instead.
+
+    :param tag_file: The location of the tagfile to be sorted
+    :param run_size: if given, sort using bounded memory, holding roughly
+        at most this many bytes of tag lines in memory at once. Each line is
+        counted as its length plus that of its file name plus
+        ``SORT_RUN_OVERHEAD``. See ``sort_lines_by_file``
+
+    :returns: None, or statistics if ``run_size`` is given
+    """
+    if run_size:
+        return resort_ctags_external(tag_file, run_size)
+
+    keys = {}
+
+    with codecs.open(tag_file, encoding='utf-8', errors='replace') as file_:
+        for line in file_:
+            keys.setdefault(line.split('\t')[FILENAME], []).append(line)
+
+    with codecs.open(tag_file+'_sorted_by_file', 'w', encoding='utf-8',
+                     errors='replace') as file_:
+        for k in sorted(keys):
+            for line in keys[k]:
+                file_.write(strip_filename_prefix(line))
+
+def resort_ctags_external(tag_file, run_size):
+    """
+    Rearrange ctags file for speed, using bounded memory.
+
+    Produces a ``[tagfile]_sorted_by_file`` file identical to that of
+    ``resort_ctags``, for tag files too large to hold in memory. This is an
+    external merge sort:
+
+        Read the tag file in runs of up to ``run_size`` bytes of memory
+        Sort each run by file name, then by position in the tag file, and
+            write it to a temporary file
+        Merge the sorted runs using ``heapq.merge``, writing each line to
+            the ``sorted_by_file`` file as ``resort_ctags`` does
+
+    If the whole tag file fits in one run, it is sorted in memory without
+    writing a temporary file.
+
+    :param tag_file: The location of the tagfile to be sorted
+    :param run_size: approximate maximum memory, in bytes, used to sort a
+        run. See ``sort_lines_by_file``
+
+    :returns: dict of statistics: the number of ``lines`` and ``runs``, the
+        ``size`` of the tag file in characters and the ``seconds`` taken
+    """
+    start = time.time()
+    stats = {}
+
+    with codecs.open(tag_file, encoding='utf-8', errors='replace') as file_:
+        with codecs.open(tag_file+'_sorted_by_file', 'w', encoding='utf-8',
+                         errors='replace') as sorted_file:
+            for line in sort_lines_by_file(file_, run_size, stats):
+                sorted_file.write(strip_filename_prefix(line))
+
+    stats['seconds'] = time.time() - start
+
+    return stats
+
+def sort_lines_by_file(lines, run_size=None, stats=None):
+    """
+    Sort tag lines by file name, keeping the order of lines for each file.
+
+    Without a ``run_size``, all lines are held in memory, as in
+    ``resort_ctags``. Otherwise an external merge sort is used, as in
+    ``resort_ctags_external``.
+
+    :param lines: iterable of tag lines
+    :param run_size: if given, the approximate maximum memory, in bytes, used
+        to sort a run. Each line counts as the length of the line and of its
+        file name plus ``SORT_RUN_OVERHEAD``, so about a fifth of
+        ``run_size`` is tag file text for typical lines. If all lines fit in
+        one run, they are sorted in memory without a temporary file.
+        Otherwise the runs are merged through read buffers sharing
+        ``run_size`` bytes, of at least ``SORT_RUN_MIN_BUFFER`` each
+    :param stats: if given, a dict updated with the number of ``lines`` and
+        ``runs`` and the ``size`` of the lines in characters
+
+    :returns: generator of sorted tag lines
+    """
+    if not run_size:
+        keys = {}
+
+        for line in lines:
+            keys.setdefault(line.split('\t')[FILENAME], []).append(line)
+
+        for k in sorted(keys):
+            for line in keys[k]:
+                yield line
+        return
+
+    position = size = 0
+
+    with ExternalSort(run_size) as sorter:
+        for line in lines:
+            file_name = line.split('\t')[FILENAME]
+            # position in file keeps lines for the same file in order
+            sorter.add((file_name, position, line),
+                       len(line) + len(file_name))
+            position += 1
+            size += len(line)
+
+        if stats is not None:
+            stats.update(lines=position, runs=sorter.runs, size=size)
+
+        for _, _, line in sorter:
+            yield line
+
+class ExternalSort(object):
+    """
+    Model items being sorted using bounded memory.
+
+    Items are added in runs of up to ``run_size`` bytes. Each full run is
+    sorted and written to a temporary file, and the runs are merged once all
+    items are added. If all items fit in one run, they are sorted in memory
+    without a temporary file.
+    """
+
+    def __init__(self, run_size=None):
+        """
+        Initialise object.
+
+        :param run_size: if given, the approximate maximum memory, in bytes,
+            used to sort a run. Otherwise all items are sorted in memory.
+            While merged, the runs are read through buffers sharing
+            ``run_size`` bytes, of at least ``SORT_RUN_MIN_BUFFER`` each
+
+        :returns: None
+        """
+        self.run_size = run_size
+        self.run = []
+        self.run_bytes = 0
+        self.run_files = []
+        self.readers = []
+
+    def __enter__(self):
+        """
+        Return self when using ``with`` keyword.
+        """
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """
+        Remove the run files on exit when using ``with`` keyword.
+        """
+        self.close()
+
+    @property
+    def runs(self):
+        """
+        Number of runs of items added.
+        """
+        return len(self.run_files) + (1 if self.run else 0)
+
+    def add(self, item, size=0):
+        """
+        Add an item to sort.
+
+        :param item: tuple of values ``marshal`` can write
+        :param size: size of the values of the item in bytes, to which
+            ``SORT_RUN_OVERHEAD`` is added
+
+        :returns: None
+        """
+        self.run.append(item)
+        self.run_bytes += size + SORT_RUN_OVERHEAD
+        if self.run_size and self.run_bytes >= self.run_size:
+            self.run_files.append(write_sort_run(self.run))
+            self.run, self.run_bytes = [], 0
+
+    def __iter__(self):
+        """
+        Iterate over the items added, in order.
+        """
+        if not self.run_files:
+            run, self.run = self.run, []
+            run.sort()
+            return iter(run)
+
+        if self.run:
+            self.run_files.append(write_sort_run(self.run))
+            self.run, self.run_bytes = [], 0
+
+        # the runs share the memory of one run while merged
+        buffer_size = max(SORT_RUN_MIN_BUFFER,
+                          self.run_size // len(self.run_files))
+        self.readers = [read_sort_run(path, buffer_size)
+                        for path in self.run_files]
+
+        return heapq.merge(*self.readers)
+
+    def close(self):
+        """
+        Close the runs being merged and remove their files.
+        """
+        for reader in self.readers:
+            reader.close()
+        for path in self.run_files:
+            os.remove(path)
+        self.run, self.run_files, self.readers = [], [], []
+
+def write_sort_run(run):
+    """
+    Sort a run of items and write it to a temporary file.
+
+    :param run: list of tuples, such as ``(file_name, position, line)``
+
+    :returns: path to the temporary file
+    """
+    run.sort()
+
+    handle, path = tempfile.mkstemp(prefix='ctags_run_')
+
+    with os.fdopen(handle, 'wb') as file_:
+        for item in run:
+            marshal.dump(item, file_)
+
+    return path
+
+def read_sort_run(path, buffer_size=-1):
+    """
+    Read back a run of items written by ``write_sort_run``.
+
+    :param path: path to the temporary file
+    :param buffer_size: size of the read buffer in bytes, or -1 for the
+        default
+
+    :returns: generator of tuples
+    """
+    with open(path, 'rb', buffer_size) as file_:
+        while True:
+            try:
+                item = marshal.load(file_)
+            except EOFError:
+                return
+            yield item
+
+def strip_filename_prefix(line):
+    """
+    Remove the prepending ``.\\`` from the ``file_name`` part of a tag line.
+
+    :param line: a tag line
+
+    :returns: updated tag line
+    """
+    split = line.split('\t')
+    split[FILENAME] = split[FILENAME].lstrip('.\\')
+    return '\t'.join(split)
+
+def build_line_index(tag_file):
+    """
+    Build a line-offset index for a tag file.
+
+    Writes a companion ``[tag_file].idx`` file containing the byte offset at
+    which each line of the tag file starts, followed by the size of the tag
+    file. This allows ``TagFile`` to bisect over line numbers rather than
+    bytes, reading each probed line exactly once.
+
+    :param tag_file: The location of the tagfile to be indexed
+
+    :returns: path to the index file
+    """
+    index_file = tag_file + LINE_INDEX_SUFFIX
+    offset = 0
+
+    with open(tag_file, 'rb') as file_:
+        with open(index_file, 'wb') as index:
+            index.write(LINE_INDEX_MAGIC)
+            for line in file_:
+                index.write(LINE_INDEX_ENTRY.pack(offset))
+                offset += len(line)
+            index.write(LINE_INDEX_ENTRY.pack(offset))  # sentinel
+
+    return index_file
+
+def build_suffix_index(tag_file, column=FILENAME, run_size=None):
+    """
+    Build a suffix index for a column of a tag file.
+
+    Writes a companion ``[tag_file].sfx[column]`` file containing the byte
+    offset at which each line of the tag file starts, ordered by the value
+    of ``column`` reversed. Lines with a given suffix in that column are
+    then adjacent, so ``TagFile.search_by_suffix`` can bisect for them.
+
+    :param tag_file: The location of the tagfile to be indexed
+    :param column: column to index
+    :param run_size: if given, sort using bounded memory. See
+        ``ExternalSort``
+
+    :returns: path to the index file
+    """
+    offset = 0
+
+    with ExternalSort(run_size) as entries:
+        with open(tag_file, 'rb') as file_:
+            for line in file_:
+                key = suffix_key(line, column)
+                entries.add((key, offset), len(key))
+                offset += len(line)
+
+        return write_suffix_index(tag_file, column, entries, offset)
+
+def write_suffix_index(tag_file, column, entries, size):
+    """
+    Write a suffix index for a column of a tag file.
+
+    :param tag_file: The location of the indexed tagfile
+    :param column: indexed column
+    :param entries: ``ExternalSort`` of ``(suffix_key, offset)`` tuples, one
+        per line
+    :param size: size of the tag file in bytes
+
+    :returns: path to the index file
+    """
+    return write_sorted_index(suffix_index_path(tag_file, column),
+                              SUFFIX_INDEX_MAGIC, entries, size)
+
+def write_sorted_index(index_file, magic, entries, size):
+    """
+    Write an index of the lines of a tag file, sorted by a key.
+
+    :param index_file: path of the index file
+    :param magic: magic bytes identifying the kind of index
+    :param entries: ``ExternalSort`` of ``(key, offset)`` tuples, one per
+        line
+    :param size: size of the tag file in bytes
+
+    :returns: path to the index file
+    """
+    with open(index_file, 'wb') as index:
+        index.write(magic)
+        for _, offset in entries:
+            index.write(LINE_INDEX_ENTRY.pack(offset))
+        index.write(LINE_INDEX_ENTRY.pack(size))  # sentinel
+
+    return index_file
+
+def suffix_index_path(tag_file, column):
+    """
+    Get the path of the suffix index for a column of a tag file.
+    """
+    return '{0}{1}{2}'.format(tag_file, SUFFIX_INDEX_SUFFIX, column)
+
+def suffix_key(line, column):
+    """
+    Get the value of a column of a tag line, reversed, to sort by suffix.
+
+    :param line: tag line, as bytes
+    :param column: column to get
+
+    :returns: reversed column value, as bytes
+    """
+    return column_key(line, column)[::-1]
+
+def build_fold_index(tag_file, run_size=None):
+    """
+    Build a fold index of the symbols of a tag file.
+
+    Writes a companion ``[tag_file].fold`` file containing the byte offset
+    at which each line of the tag file starts, ordered by the symbol
+    uppercased, as if sorted by ``ctags --sort=foldcase``. This allows
+    ``TagFile.search_ignore_case`` to bisect for symbols ignoring case.
+
+    Tag files already sorted with ``--sort=foldcase`` are bisected as is, so
+    are not indexed, and any index left from an earlier build is removed.
+
+    :param tag_file: The location of the tagfile to be indexed
+    :param run_size: if given, sort using bounded memory. See
+        ``ExternalSort``
+
+    :returns: path to the index file, or None if not indexed
+    """
+    index_file = tag_file + FOLD_INDEX_SUFFIX
+    offset = 0
+
+    with ExternalSort(run_size) as entries:
+        with open(tag_file, 'rb') as file_:
+            headers, _ = read_tag_headers(file_)
+            if (TAG_FILE_SORTED.get(headers.get('TAG_FILE_SORTED')) ==
+                    SORT_FOLDCASE):
+                if os.path.exists(index_file):
+                    os.remove(index_file)
+                return None
+
+            file_.seek(0)
+            for line in file_:
+                key = fold_key(line, SYMBOL)
+                entries.add((key, offset), len(key))
+                offset += len(line)
+
+        return write_sorted_index(index_file, FOLD_INDEX_MAGIC, entries,
+                                  offset)
+
+def fold_key(line, column):
+    """
+    Get the value of a column of a tag line, uppercased, to sort ignoring
+    case.
+
+    :param line: tag line, as bytes
+    :param column: column to get
+
+    :returns: uppercased column value, as bytes
+    """
+    return column_key(line, column).upper()
+
+def column_key(line, column):
+    """
+    Get the value of a column of a tag line.
+
+    :param line: tag line, as bytes
+    :param column: column to get
+
+    :returns: column value, as bytes
+    """
+    split = line.rstrip(b'\r\n').split(b'\t', column + 1)
+    if len(split) <= column:
+        return b''
+    return split[column]
+
+def read_tag_headers(mapped):
+    """
+    Read the pseudo-tags at the start of a tag file.
+
+    Pseudo-tags are lines like ``!_TAG_FILE_SORTED<tab>1<tab>/comment/``,
+    giving the format of the tag file, how it is sorted and the program that
+    built it.
+
+    :param mapped: memory mapped tag file
+
+    :returns: tuple of dict of pseudo-tag names, without the leading ``!_``,
+        to values, and the size of the pseudo-tags in bytes
+    """
+    headers = {}
+    size = 0
+    mapped.seek(0)
+
+    for line in iter(mapped.readline, b''):
+        if not line.startswith(b'!_'):
+            break
+        size += len(line)
+        split = line.rstrip(b'\r\n').split(b'\t')
+        if len(split) > 1:
+            name = split[0][2:].decode('utf-8', 'replace')
+            headers.setdefault(name, split[1].decode('utf-8', 'replace'))
+
+    return headers, size
+
+def get_search_strategy(sort_mode, fold_index=False):
+    """
+    Choose how to search a tag file for tags.
+
+    Tag files sorted by ctags are bisected, either as is or ignoring case,
+    according to ``sort_mode``. Unsorted tag files are bisected using their
+    fold index, if they have one, or else searched linearly.
+
+    :param sort_mode: how the searched column of the tag file is sorted
+    :param fold_index: if the tag file has a fold index
+
+    :returns: one of ``SEARCH_BISECT``, ``SEARCH_FOLDCASE``,
+        ``SEARCH_INDEXED`` or ``SEARCH_LINEAR``
+    """
+    if sort_mode == SORT_YES:
+        return SEARCH_BISECT
+    if sort_mode == SORT_FOLDCASE:
+        return SEARCH_FOLDCASE
+    if fold_index:
+        return SEARCH_INDEXED
+    return SEARCH_LINEAR
+
+def search_tag_files(paths, search, jobs=4, timeout=None):
+    """
+    Search a number of tag files concurrently.
+
+    Each path is passed to ``search`` in one of up to ``jobs`` threads. With
+    a ``timeout``, files still being searched once it has passed are
+    ignored, unless no file has found anything by then, in which case the
+    first file to do so wins.
+
+    :param paths: list of paths to tag files
+    :param search: function taking a path and returning its results, or a
+        false value if it has none
+    :param jobs: maximum number of threads
+    :param timeout: latency budget in seconds, or None to wait for every
+        file
+
+    :returns: list of ``(path, results)`` tuples of the files with results
+        found in time, in the order of ``paths``. Raises the first error of
+        ``search`` if no file has results
+    """
+    pending = queue.Queue()
+    done = queue.Queue()
+
+    for index, path in enumerate(paths):
+        pending.put((index, path))
+
+    def run():
+        while True:
+            try:
+                index, path = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                done.put((index, path, search(path), None))
+            except Exception as e:
+                done.put((index, path, None, e))
+
+    for _ in range(min(jobs, len(paths))):
+        thread = threading.Thread(target=run)
+        thread.daemon = True  # may outlive the budget
+        thread.start()
+
+    deadline = None if timeout is None else time.time() + timeout
+    results, errors = [], []
+    finished = 0
+
+    while finished < len(paths):
+        wait = None
+        if deadline is not None:
+            wait = max(0, deadline - time.time())
+            if not wait:
+                if results:
+                    break
+                wait = None  # first file with results wins
+        try:
+            index, path, result, error = done.get(True, wait)
+        except queue.Empty:
+            continue  # past the deadline, so check again
+        finished += 1
+        if error is not None:
+            errors.append(error)
+        elif result:
+            results.append((index, path, result))
+            if deadline is not None and time.time() >= deadline:
+                break
+
+    while True:  # leave files not yet started
+        try:
+            pending.get_nowait()
+        except queue.Empty:
+            break
+
+    if errors and not results:
+        raise errors[0]
+
+    return [(path, result) for _, path, result in sorted(results)]
+
+def build_trigram_index(tag_file):
+    """
+    Build a trigram index of the symbols of a tag file.
+
+    Writes a companion ``[tag_file].tri`` file mapping each trigram of the
+    lowercased symbols to the runs of lines with a symbol containing it.
+    ``TagFile.search_by_substring`` intersects these to find the symbols
+    containing a string without reading every line.
+
+    :param tag_file: The location of the tagfile to be indexed
+
+    :returns: path to the index file
+    """
+    builder = TrigramIndexBuilder()
+    offset = 0
+
+    with open(tag_file, 'rb') as file_:
+        for line in file_:
+            builder.add(line, offset)
+            offset += len(line)
+
+    return builder.write(tag_file, offset)
+
+def build_completion_index(tag_file):
+    """
+    Build a completion index of the symbols of a tag file.
+
+    Writes a companion ``[tag_file].cmp`` file listing each distinct symbol
+    of the tag file once, ordered by the symbol lowercased. The symbols
+    starting with a prefix, ignoring case, are then adjacent, so
+    ``CompletionIndex.complete`` finds them with two bisects.
+
+    Also writes a companion ``[tag_file].abv`` file listing the symbols of
+    two or more words by their abbreviation, so symbols can be completed
+    from their initials the same way. See ``get_abbreviation``. Finally,
+    writes a companion ``[tag_file].blm`` bloom filter of the symbols. See
+    ``may_contain_symbol``.
+
+    :param tag_file: The location of the tagfile to be indexed
+
+    :returns: path to the completion index file
+    """
+    builder = CompletionIndexBuilder()
+    offset = 0
+
+    with open(tag_file, 'rb') as file_:
+        for line in file_:
+            builder.add(line)
+            offset += len(line)
+
+    return builder.write(tag_file, offset)
+
+def completion_key(symbol):
+    """
+    Get the key of a symbol in a completion index.
+
+    :param symbol: symbol, as text
+
+    :returns: lowercased symbol, as bytes
+    """
+    return symbol.lower().encode('utf-8')
+
+def get_abbreviation(symbol):
+    """
+    Get the abbreviation of a symbol.
+
+    This is the first letter of each word of the symbol, lowercased. Words
+    are split at camel humps and underscores, so both ``getDisplayName``
+    and ``get_display_name`` are abbreviated ``gdn``.
+
+    :param symbol: symbol, as text
+
+    :returns: abbreviation, or None if the symbol has fewer than two words
+    """
+    words = SYMBOL_WORDS_RE.findall(symbol)
+
+    if len(words) < 2:  # completed by prefix anyway
+        return None
+
+    return ''.join(word[0] for word in words).lower()
+
+def get_bloom_bits(key, bits, hashes):
+    """
+    Get the bits of a bloom filter set for a symbol.
+
+    :param key: lowercased symbol, as bytes
+    :param bits: number of bits of the filter
+    :param hashes: number of hashes per symbol
+
+    :returns: list of bit numbers
+    """
+    first, second = struct.unpack('<QQ', hashlib.md5(key).digest())
+    return [(first + index * second) % bits for index in range(hashes)]
+
+def may_contain_symbol(tag_file, symbol):
+    """
+    Check if a tag file may contain a symbol, using its bloom filter.
+
+    This is much cheaper than opening and searching the tag file, so tag
+    files which cannot contain a symbol can be skipped.
+
+    :param tag_file: path to a tag file
+    :param symbol: symbol to check for, matched ignoring case
+
+    :returns: False if the tag file does not contain the symbol, True if it
+        may, or if it has no usable bloom filter
+    """
+    try:
+        size = os.path.getsize(tag_file)
+    except OSError:  # no tag file, so leave it to the caller
+        return True
+
+    bloom_filter = BloomFilter.load(tag_file, size)
+
+    if bloom_filter is None:
+        return True
+
+    try:
+        return symbol in bloom_filter
+    finally:
+        bloom_filter.close()
+
+def write_completion_index(index_file, magic, entries, size):
+    """
+    Write a completion index of the symbols of a tag file.
+
+    :param index_file: path of the index file
+    :param magic: magic bytes identifying the kind of index
+    :param entries: list of entries, each a line of a key, a tab and a
+        symbol, as bytes
+    :param size: size of the tag file in bytes
+
+    :returns: path to the index file
+    """
+    entries.sort()
+
+    # written aside then renamed, as it may be built while being searched
+    with open(index_file + '.tmp', 'wb') as index:
+        index.write(magic)
+        index.write(COMPLETION_INDEX_HEADER.pack(len(entries), size))
+        start = 0
+        for entry in entries:
+            index.write(LINE_INDEX_ENTRY.pack(start))
+            start += len(entry)
+        index.write(LINE_INDEX_ENTRY.pack(start))  # sentinel
+        for entry in entries:
+            index.write(entry)
+    replace_file(index_file + '.tmp', index_file)
+
+    return index_file
+
+def estimate_tags_size(tags, samples=TAGS_SIZE_SAMPLES):
+    """
+    Estimate the memory used by parsed tags.
+
+    The tags of up to ``samples`` keys are measured, and the result scaled
+    up to all the keys by their number of tags or, for ``CachedTags``, by
+    the size of their serialized tags.
+
+    :param tags: parsed tags, as returned by ``parse_tag_lines``
+    :param samples: number of keys to measure
+
+    :returns: approximate size, in bytes
+    """
+    keys = list(tags)
+    size = sys.getsizeof(tags)
+
+    if not keys:
+        return size
+
+    if isinstance(tags, CachedTags):
+        size += len(tags.data)
+
+        def weight(key):
+            start, end = tags.spans[key]
+            return end - start
+    else:
+        def weight(key):
+            return len(tags[key])
+
+    sample = keys[::max(1, len(keys) // samples)]
+    measured = sum(sys.getsizeof(key) + sys.getsizeof(tags[key]) +
+                   sum(estimate_tag_size(tag) for tag in tags[key])
+                   for key in sample)
+    sampled = sum(weight(key) for key in sample)
+
+    if not sampled:
+        return size + measured * len(keys) // len(sample)
+
+    return size + measured * sum(weight(key) for key in keys) // sampled
+
+def estimate_tag_size(tag):
+    """
+    Estimate the memory used by a parsed tag.
+
+    :param tag: ``TagElements`` or ``CompactTagElements``
+
+    :returns: approximate size, in bytes
+    """
+    if isinstance(tag, CompactTagElements):
+        # file names, types and fields are interned, so mostly shared
+        return (sys.getsizeof(tag) + sys.getsizeof(tag.symbol) +
+                sys.getsizeof(tag.ex_command) + sys.getsizeof(tag._fields))
+
+    return sys.getsizeof(tag) + sum(sys.getsizeof(value)
+                                    for value in tag.values())
+
+def get_trigrams(string):
+    """
+    Get the set of trigrams of a string.
+
+    :param string: lowercased symbol, as bytes
+
+    :returns: set of trigrams, as bytes
+    """
+    return set(string[i:i + 3] for i in range(len(string) - 2))
+
+def match_substring(symbol, key, grams, fuzzy=False):
+    """
+    Match a symbol against a substring search.
+
+    :param symbol: symbol, as bytes
+    :param key: lowercased string searched for, as bytes
+    :param grams: trigrams of ``key``
+    :param fuzzy: match symbols with similar trigrams to ``key``, rather than
+        only those containing it
+
+    :returns: similarity score from 0 to 1, or ``None`` if not matched
+    """
+    symbol = symbol.lower()
+
+    if not fuzzy or not grams:
+        return 1.0 if key in symbol else None
+
+    symbol_grams = get_trigrams(symbol)
+    score = (2.0 * len(grams & symbol_grams) /
+             (len(grams) + len(symbol_grams)))
+
+    return score if score >= FUZZY_THRESHOLD else None
+
+#
+# Models
+#
+
+class TagElements(dict):
+    """
+    Model the entries of a tag file.
+    """
+    def __init__(self, *args, **kw):
+        """Initialise Tag object"""
+        dict.__init__(self, *args, **kw)
+        self.__dict__ = self
+
+class LazyTagElements(TagElements):
+    """
+    Model the entries of a tag file, processing them on demand.
+
+    Behaves like a ``TagElements`` built by ``post_process_tag``, but only
+    the ``symbol``, ``filename`` and ``type`` elements are extracted up front.
+    The raw line is kept along with the offsets of the remaining elements,
+    and the unescaped ``ex_command``, the ``fields`` and their parsed
+    elements, and the ``tag_path`` are each computed on first access.
+    """
+    __slots__ = ('_line', '_spans', '_pending')
+
+    def __init__(self, line, spans):
+        """
+        Initialise object.
+
+        :param line: a tag line, without line endings
+        :param spans: offsets of the tag elements in ``line``, as returned by
+            ``locate_tag_line``
+
+        :returns: None
+        """
+        symbol, filename, _, type_, _ = spans
+
+        dict.__init__(self, symbol=line[symbol[0]:symbol[1]],
+                      filename=line[filename[0]:filename[1]],
+                      type=line[type_[0]:type_[1]])
+        object.__setattr__(self, '_line', line)
+        object.__setattr__(self, '_spans', spans)
+        object.__setattr__(self, '_pending',
+                           set(('ex_command', 'fields', 'tag_path')))
+
+    def _process(self, key):
+        """
+        Process the elements needed to provide ``key``.
+        """
+        pending = self._pending
+
+        if key == 'ex_command':
+            if 'ex_command' in pending:
+                pending.discard('ex_command')
+                start, end = self._spans[2]
+                dict.__setitem__(self, 'ex_command', process_ex_cmd(
+                    {'ex_command': self._line[start:end]}))
+            return
+
+        if 'fields' in pending:  # fields are needed by the tag path too
+            pending.discard('fields')
+            span = self._spans[4]
+            fields = self._line[span[0]:span[1]] if span else None
+            dict.__setitem__(self, 'fields', fields)
+            dict.update(self, process_fields({'fields': fields}))
+
+        if key == 'tag_path' and 'tag_path' in pending:
+            pending.discard('tag_path')
+            dict.update(self, create_tag_path(self))
+
+    def materialize(self):
+        """
+        Process all remaining elements.
+
+        :returns: self
+        """
+        for key in ('ex_command', 'tag_path'):
+            self._process(key)
+        return self
+
+    def __missing__(self, key):
+        if self._pending:
+            self._process(key)
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):  # never an element
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __contains__(self, key):
+        if self._pending and not dict.__contains__(self, key):
+            self._process(key)
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # operations on the whole dict need every element
+
+    def __iter__(self):
+        return dict.__iter__(self.materialize())
+
+    def __len__(self):
+        return dict.__len__(self.materialize())
+
+    def __eq__(self, other):
+        return dict.__eq__(self.materialize(), other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return dict.__repr__(self.materialize())
+
+    def __reduce__(self):
+        return (TagElements, (dict(self), ))
+
+    def keys(self):
+        return dict.keys(self.materialize())
+
+    def values(self):
+        return dict.values(self.materialize())
+
+    def items(self):
+        return dict.items(self.materialize())
+
+    def copy(self):
+        return dict.copy(self.materialize())
+
+class CompactTagElements(object):
+    """
+    Model the entries of a tag file, using as little memory as possible.
+
+    Behaves like a ``TagElements`` for attribute, item and ``get`` access,
+    but stores elements in slots rather than a dict. Repeated values, such
+    as file names, types and field keys and values (i.e. languages and scope
+    names), are interned so they are shared between tags, and the
+    ``field_keys`` and ``tag_path`` elements are computed when accessed.
+    """
+    __slots__ = ('symbol', 'filename', 'ex_command', 'type', '_fields')
+
+    def __init__(self, tag):
+        """
+        Initialise object.
+
+        :param tag: dict containing the tag, as returned by
+            ``post_process_tag``
+
+        :returns: None
+        """
+        self.symbol = tag['symbol']
+        self.filename = intern(tag['filename'])
+        self.ex_command = tag['ex_command']
+        self.type = intern(tag['type'])
+
+        fields = tag.get('fields')
+        if fields:  # store as flat tuple of interned keys and values
+            self._fields = tuple(
+                intern(item) for field in fields.split('\t')
+                for item in field.split(':', 1))
+        else:
+            self._fields = fields
+
+    @classmethod
+    def from_tuple(cls, elements):
+        """
+        Create a tag from the elements returned by ``to_tuple``.
+
+        :param elements: tuple of elements
+
+        :returns: ``CompactTagElements``
+        """
+        tag = cls.__new__(cls)
+        tag.symbol, filename, tag.ex_command, type_, fields = elements
+        tag.filename = intern(filename)
+        tag.type = intern(type_)
+        if fields:
+            tag._fields = tuple(intern(item) for item in fields)
+        else:
+            tag._fields = fields
+        return tag
+
+    def to_tuple(self):
+        """
+        Get the elements of the tag as a tuple, to serialize it.
+        """
+        return (self.symbol, self.filename, self.ex_command, self.type,
+                self._fields)
+
+    def _field(self, key):
+        """
+        Get the value of the field ``key``, or None if not present.
+        """
+        fields = self._fields
+        if fields:
+            # search backwards, as later fields override earlier ones
+            for index in range(len(fields) - 2, -1, -2):
+                if fields[index] == key:
+                    return fields[index + 1]
+        return None
+
+    @property
+    def fields(self):
+        """
+        Get the fields string.
+        """
+        if not self._fields:
+            return self._fields
+        return '\t'.join(
+            ':'.join(self._fields[index:index + 2])
+            for index in range(0, len(self._fields), 2))
+
+    @property
+    def field_keys(self):
+        """
+        Get a sorted list of field keys.
+        """
+        if not self._fields:
+            raise AttributeError('field_keys')
+        return sorted(set(self._fields[::2]))
+
+    @property
+    def tag_path(self):
+        """
+        Get the tag path. See ``create_tag_path``.
+        """
+        return create_tag_path(self)['tag_path']
+
+    def __getattr__(self, name):
+        if name.startswith('_'):  # never an element
+            raise AttributeError(name)
+        value = self._field(name)
+        if value is None:
+            raise AttributeError(name)
+        return value
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        keys = ['symbol', 'filename', 'ex_command', 'type', 'fields',
+                'tag_path']
+        if self._fields:
+            keys.append('field_keys')
+            keys.extend(self.field_keys)
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class Tag(object):
+    """
+    Model a tag.
+
+    This exists mainly to enable different types of sorting.
+    """
+    def __init__(self, line, column=0, fold=False):
+        if isinstance(line, bytes):  # python 3 compatibility
+            line = line.decode('utf-8', 'replace')
+        self.line = line
+        self.column = column
+        self.fold = fold  # compare uppercased, as in foldcase sorted files
+
+    def key(self):
+        key = self.line.split('\t')[self.column]
+        return key.upper() if self.fold else key
+
+    # an empty tag is read past the end of the tag file, so sorts last
+
+    def __lt__(self, other):
+        return bool(self.line) and self.key() < other
+
+    def __gt__(self, other):
+        return not self.line or self.key() > other
+
+    def __getitem__(self, index):
+        return self.line.split('\t')[index]
+
+    def __len__(self):
+        return len(self.line.split('\t'))
+
+class LineIndex(object):
+    """
+    Model a line-offset index of a tag file.
+
+    Provides a read-only sequence of the byte offsets at which each line of a
+    tag file starts. The index file is memory mapped, so opening an index is
+    cheap regardless of the size of the tag file.
+    """
+    file_o = None
+    mapped = None
+    magic = LINE_INDEX_MAGIC
+
+    def __init__(self, path):
+        """
+        Initialise object.
+
+        :param path: path to an index file, as built by ``build_line_index``
+
+        :returns: None
+        """
+        self.path = path
+
+    def __getitem__(self, index):
+        """
+        Get the offset of the start of line ``index``.
+        """
+        if index < 0:
+            index += len(self)
+        return LINE_INDEX_ENTRY.unpack_from(
+            self.mapped, len(self.magic) +
+            index * LINE_INDEX_ENTRY.size)[0]
+
+    def __len__(self):
+        """
+        Get number of lines in the indexed tag file.
+        """
+        entries = ((len(self.mapped) - len(self.magic)) //
+                   LINE_INDEX_ENTRY.size)
+        return entries - 1  # ignore the sentinel
+
+    @property
+    def size(self):
+        """
+        Get size of the indexed tag file in bytes.
+        """
+        return self[len(self)]
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the index for a tag file, if one exists and is up to date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``LineIndex`` or None if no usable index exists
+        """
+        return cls.load_path(tag_file + LINE_INDEX_SUFFIX, tag_file, size)
+
+    @classmethod
+    def load_path(cls, path, tag_file, size):
+        """
+        Open an index file for a tag file, if it is up to date.
+
+        :param path: path to the index file
+        :param tag_file: path to the indexed tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened index or None if the index is not usable
+        """
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(tag_file):
+                return None  # stale
+        except OSError:  # no index
+            return None
+
+        index = cls(path)
+
+        try:
+            index.open()
+        except (IOError, OSError, ValueError, struct.error):  # unreadable
+            index.close()
+            return None
+
+        if (index.mapped[:len(cls.magic)] != cls.magic or
+                len(index) < 0 or index.size != size):
+            index.close()
+            return None
+
+        return index
+
+    def open(self):
+        """
+        Open file.
+        """
+        self.file_o = open(self.path, 'rb')
+        self.mapped = mmap.mmap(self.file_o.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+
+    def close(self):
+        """
+        Close file.
+        """
+        if self.mapped is not None:
+            self.mapped.close()
+        if self.file_o is not None:
+            self.file_o.close()
+
+class SuffixIndex(LineIndex):
+    """
+    Model a suffix index of a tag file.
+
+    Provides a read-only sequence of the byte offsets at which each line of a
+    tag file starts, ordered by the reversed value of a column of the line.
+    See ``build_suffix_index``.
+    """
+    magic = SUFFIX_INDEX_MAGIC
+
+    @classmethod
+    def load(cls, tag_file, size, column=FILENAME):
+        """
+        Open the suffix index for a tag file, if one exists and is up to date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+        :param column: indexed column
+
+        :returns: opened ``SuffixIndex`` or None if no usable index exists
+        """
+        return cls.load_path(suffix_index_path(tag_file, column), tag_file,
+                             size)
+
+class FoldIndex(LineIndex):
+    """
+    Model a fold index of the symbols of a tag file.
+
+    Provides a read-only sequence of the byte offsets at which each line of a
+    tag file starts, ordered by the symbol uppercased. See
+    ``build_fold_index``.
+    """
+    magic = FOLD_INDEX_MAGIC
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the fold index for a tag file, if one exists and is up to date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``FoldIndex`` or None if no usable index exists
+        """
+        return cls.load_path(tag_file + FOLD_INDEX_SUFFIX, tag_file, size)
+
+class TrigramIndex(LineIndex):
+    """
+    Model a trigram index of the symbols of a tag file.
+
+    Provides a read-only sequence of the byte offsets at which each run of
+    lines with the same symbol starts, and the postings of runs with a
+    symbol containing a trigram. See ``build_trigram_index``.
+    """
+    magic = TRIGRAM_INDEX_MAGIC
+    runs = 0
+    grams = 0
+
+    def __getitem__(self, index):
+        """
+        Get the offset of the start of run ``index``.
+        """
+        if index < 0:
+            index += len(self)
+        return LINE_INDEX_ENTRY.unpack_from(
+            self.mapped, len(self.magic) + TRIGRAM_INDEX_HEADER.size +
+            index * LINE_INDEX_ENTRY.size)[0]
+
+    def __len__(self):
+        """
+        Get number of runs of lines with the same symbol.
+        """
+        return self.runs
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the trigram index for a tag file, if one exists and is up to
+        date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``TrigramIndex`` or None if no usable index exists
+        """
+        return cls.load_path(tag_file + TRIGRAM_INDEX_SUFFIX, tag_file, size)
+
+    def open(self):
+        """
+        Open file.
+        """
+        LineIndex.open(self)
+        self.runs, self.grams = TRIGRAM_INDEX_HEADER.unpack_from(
+            self.mapped, len(self.magic))
+        self.grams_start = (len(self.magic) + TRIGRAM_INDEX_HEADER.size +
+                            (self.runs + 1) * LINE_INDEX_ENTRY.size)
+        self.postings_start = (self.grams_start +
+                               self.grams * TRIGRAM_INDEX_GRAM.size)
+
+    def postings(self, gram):
+        """
+        Get the runs with a symbol containing a trigram.
+
+        :param gram: trigram of a lowercased symbol, as bytes
+
+        :returns: sorted tuple of run numbers
+        """
+        left, right = 0, self.grams
+
+        while left < right:
+            middle = (left + right) // 2
+            entry = TRIGRAM_INDEX_GRAM.unpack_from(
+                self.mapped,
+                self.grams_start + middle * TRIGRAM_INDEX_GRAM.size)
+            if entry[0] < gram:
+                left = middle + 1
+            elif entry[0] > gram:
+                right = middle
+            else:
+                return struct.unpack_from(
+                    '<{0}I'.format(entry[2]), self.mapped,
+                    self.postings_start +
+                    entry[1] * TRIGRAM_INDEX_POSTING.size)
+
+        return ()
+
+class TrigramIndexBuilder(object):
+    """
+    Model a trigram index being built from the lines of a tag file.
+    """
+
+    def __init__(self):
+        """
+        Initialise object.
+
+        :returns: None
+        """
+        self.offsets = []
+        self.postings = {}
+        self.symbol = None
+
+    def add(self, line, offset):
+        """
+        Add a line of the tag file.
+
+        :param line: tag line, as bytes
+        :param offset: offset of the start of the line in the tag file
+
+        :returns: None
+        """
+        if line.startswith(b'!_'):  # pseudo-tags are not symbols
+            return
+
+        symbol = line.split(b'\t', 1)[SYMBOL]
+
+        if symbol == self.symbol:  # same run
+            return
+
+        self.symbol = symbol
+        run = len(self.offsets)
+        self.offsets.append(offset)
+
+        for gram in get_trigrams(symbol.lower()):
+            self.postings.setdefault(gram, []).append(run)
+
+    def write(self, tag_file, size):
+        """
+        Write the index for a tag file.
+
+        :param tag_file: The location of the indexed tagfile
+        :param size: size of the tag file in bytes
+
+        :returns: path to the index file
+        """
+        index_file = tag_file + TRIGRAM_INDEX_SUFFIX
+        grams = sorted(self.postings)
+
+        with open(index_file, 'wb') as index:
+            index.write(TRIGRAM_INDEX_MAGIC)
+            index.write(TRIGRAM_INDEX_HEADER.pack(len(self.offsets),
+                                                  len(grams)))
+            for offset in self.offsets:
+                index.write(LINE_INDEX_ENTRY.pack(offset))
+            index.write(LINE_INDEX_ENTRY.pack(size))  # sentinel
+
+            start = 0
+            for gram in grams:
+                count = len(self.postings[gram])
+                index.write(TRIGRAM_INDEX_GRAM.pack(gram, start, count))
+                start += count
+
+            for gram in grams:
+                runs = self.postings[gram]
+                index.write(struct.pack('<{0}I'.format(len(runs)), *runs))
+
+        return index_file
+
+class CompletionIndex(LineIndex):
+    """
+    Model a completion index of the symbols of a tag file.
+
+    Provides a read-only sequence of the distinct symbols of a tag file,
+    ordered by the symbol lowercased. See ``build_completion_index``.
+    """
+    magic = COMPLETION_INDEX_MAGIC
+    symbols = 0
+    tag_file_size = 0
+
+    def __getitem__(self, index):
+        """
+        Get the entry ``index``, as bytes.
+        """
+        if index < 0:
+            index += len(self)
+        start, end = struct.unpack_from(
+            '<2Q', self.mapped, len(self.magic) +
+            COMPLETION_INDEX_HEADER.size + index * LINE_INDEX_ENTRY.size)
+        return self.mapped[self.entries_start + start:
+                           self.entries_start + end]
+
+    def __len__(self):
+        """
+        Get number of distinct symbols.
+        """
+        return self.symbols
+
+    @property
+    def size(self):
+        """
+        Get size of the indexed tag file in bytes.
+        """
+        return self.tag_file_size
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the completion index for a tag file, if one exists and is up to
+        date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``CompletionIndex`` or None if no usable index
+            exists
+        """
+        return cls.load_path(tag_file + COMPLETION_INDEX_SUFFIX, tag_file,
+                             size)
+
+    def open(self):
+        """
+        Open file.
+        """
+        LineIndex.open(self)
+        self.symbols, self.tag_file_size = COMPLETION_INDEX_HEADER.unpack_from(
+            self.mapped, len(self.magic))
+        self.entries_start = (len(self.magic) + COMPLETION_INDEX_HEADER.size +
+                              (self.symbols + 1) * LINE_INDEX_ENTRY.size)
+
+    def bisect(self, key):
+        """
+        Find the first entry with a lowercased symbol not less than ``key``.
+
+        :param key: lowercased symbol, as bytes
+
+        :returns: index of the entry
+        """
+        left, right = 0, len(self)
+
+        while left < right:
+            middle = (left + right) // 2
+            if self[middle].split(b'\t', 1)[0] < key:
+                left = middle + 1
+            else:
+                right = middle
+
+        return left
+
+    def complete(self, prefix, limit=None):
+        """
+        Get the symbols starting with a prefix, ignoring case.
+
+        :param prefix: prefix of the symbols to get
+        :param limit: maximum number of symbols, or None for all
+
+        :returns: list of symbols, ordered ignoring case
+        """
+        return [symbol for _, symbol in self.complete_keys(prefix, limit)]
+
+    def complete_keys(self, prefix, limit=None):
+        """
+        Get the symbols starting with a prefix, ignoring case, with their
+        keys.
+
+        :param prefix: prefix of the symbols to get
+        :param limit: maximum number of symbols, or None for all
+
+        :returns: list of ``(key, symbol)`` tuples, ordered by key
+        """
+        key = completion_key(prefix)
+        start = self.bisect(key)
+        # no UTF-8 encoded text contains ``0xff``, so this is past every
+        # symbol starting with ``key``
+        end = self.bisect(key + b'\xff')
+
+        if limit is not None:
+            end = min(end, start + limit)
+        if start >= end:
+            return []
+
+        # entries are contiguous, so read them all at once
+        first, last = (self.entries_start + LINE_INDEX_ENTRY.unpack_from(
+            self.mapped, len(self.magic) + COMPLETION_INDEX_HEADER.size +
+            index * LINE_INDEX_ENTRY.size)[0] for index in (start, end))
+        entries = self.mapped[first:last].decode('utf-8', 'replace')
+
+        return [tuple(entry.split('\t', 1))
+                for entry in entries.split('\n')[:-1]]
+
+class AbbreviationIndex(CompletionIndex):
+    """
+    Model an abbreviation index of the symbols of a tag file.
+
+    Provides a read-only sequence of the symbols of two or more words of a
+    tag file, ordered by their abbreviation. See ``get_abbreviation``.
+    """
+    magic = ABBREVIATION_INDEX_MAGIC
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the abbreviation index for a tag file, if one exists and is up
+        to date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``AbbreviationIndex`` or None if no usable index
+            exists
+        """
+        return cls.load_path(tag_file + ABBREVIATION_INDEX_SUFFIX, tag_file,
+                             size)
+
+class BloomFilter(LineIndex):
+    """
+    Model a bloom filter of the symbols of a tag file.
+
+    See ``may_contain_symbol``.
+    """
+    magic = BLOOM_FILTER_MAGIC
+    bits = 0
+    hashes = 0
+    tag_file_size = 0
+
+    def __contains__(self, symbol):
+        """
+        Check if the filter may contain a symbol, ignoring case.
+        """
+        start = len(self.magic) + BLOOM_FILTER_HEADER.size
+
+        for bit in get_bloom_bits(completion_key(symbol), self.bits,
+                                  self.hashes):
+            offset = start + bit // 8
+            if not bytearray(self.mapped[offset:offset + 1])[0] & (
+                    1 << bit % 8):
+                return False
+
+        return True
+
+    def __len__(self):
+        """
+        Get number of bits.
+        """
+        return self.bits
+
+    @property
+    def size(self):
+        """
+        Get size of the tag file in bytes.
+        """
+        return self.tag_file_size
+
+    @classmethod
+    def load(cls, tag_file, size):
+        """
+        Open the bloom filter for a tag file, if one exists and is up to
+        date.
+
+        :param tag_file: path to a tag file
+        :param size: current size of the tag file in bytes
+
+        :returns: opened ``BloomFilter`` or None if no usable filter exists
+        """
+        return cls.load_path(tag_file + BLOOM_FILTER_SUFFIX, tag_file, size)
+
+    def open(self):
+        """
+        Open file.
+        """
+        LineIndex.open(self)
+        self.tag_file_size, self.bits, self.hashes = (
+            BLOOM_FILTER_HEADER.unpack_from(self.mapped, len(self.magic)))
+        if (not self.bits or len(self.mapped) < len(self.magic) +
+                BLOOM_FILTER_HEADER.size + (self.bits + 7) // 8):
+            raise ValueError('truncated bloom filter')
+
+class CompletionIndexBuilder(object):
+    """
+    Model a completion index being built from the lines of a tag file.
+    """
+
+    def __init__(self):
+        """
+        Initialise object.
+
+        :returns: None
+        """
+        self.symbols = set()
+
+    def add(self, line):
+        """
+        Add a line of the tag file.
+
+        :param line: tag line, as bytes
+
+        :returns: None
+        """
+        if line.startswith(b'!_'):  # pseudo-tags are not symbols
+            return
+
+        self.symbols.add(column_key(line, SYMBOL))
+
+    def write(self, tag_file, size):
+        """
+        Write the completion and abbreviation indexes and the bloom filter
+        for a tag file.
+
+        :param tag_file: The location of the indexed tagfile
+        :param size: size of the tag file in bytes
+
+        :returns: path to the completion index file
+        """
+        entries = []
+        abbreviations = []
+
+        for symbol in self.symbols:
+            text = symbol.decode('utf-8', 'replace')
+            entries.append(completion_key(text) + b'\t' + symbol + b'\n')
+            abbreviation = get_abbreviation(text)
+            if abbreviation is not None:
+                abbreviations.append(abbreviation.encode('utf-8') + b'\t' +
+                                     symbol + b'\n')
+
+        write_completion_index(tag_file + ABBREVIATION_INDEX_SUFFIX,
+                               ABBREVIATION_INDEX_MAGIC, abbreviations, size)
+        self.write_bloom_filter(tag_file, size)
+        return write_completion_index(tag_file + COMPLETION_INDEX_SUFFIX,
+                                      COMPLETION_INDEX_MAGIC, entries, size)
+
+    def write_bloom_filter(self, tag_file, size):
+        """
+        Write the bloom filter for a tag file.
+
+        :param tag_file: The location of the indexed tagfile
+        :param size: size of the tag file in bytes
+
+        :returns: path to the bloom filter file
+        """
+        index_file = tag_file + BLOOM_FILTER_SUFFIX
+        bits = max(64, len(self.symbols) * BLOOM_FILTER_BITS)
+        array = bytearray((bits + 7) // 8)
+
+        for symbol in self.symbols:
+            key = completion_key(symbol.decode('utf-8', 'replace'))
+            for bit in get_bloom_bits(key, bits, BLOOM_FILTER_HASHES):
+                array[bit // 8] |= 1 << bit % 8
+
+        with open(index_file + '.tmp', 'wb') as index:
+            index.write(BLOOM_FILTER_MAGIC)
+            index.write(BLOOM_FILTER_HEADER.pack(size, bits,
+                                                 BLOOM_FILTER_HASHES))
+            index.write(bytes(array))
+        replace_file(index_file + '.tmp', index_file)
+
+        return index_file
+
+class TagFileWriter(object):
+    """
+    Model a tag file being written, along with its line-offset index.
+
+    Writing a tag file this way gives the same index as ``build_line_index``
+    without having to read the tag file back. Likewise for the suffix index
+    of ``build_suffix_index``, if a ``suffix_column`` is given, for the
+    trigram index of ``build_trigram_index``, if ``trigrams`` is set, for
+    the fold index of ``build_fold_index``, if ``fold`` is set, and for the
+    completion index of ``build_completion_index``, if ``completions`` is
+    set.
+    """
+    file_o = None
+    index_o = None
+
+    def __init__(self, path, suffix_column=None, trigrams=False, fold=False,
+                 completions=False, run_size=None):
+        """
+        Initialise object.
+
+        :param path: path to the tag file to write
+        :param suffix_column: column to build a suffix index for, if any
+        :param trigrams: build a trigram index of the symbols
+        :param fold: build a fold index of the symbols
+        :param completions: build a completion index of the symbols
+        :param run_size: if given, sort the suffix and fold indexes using
+            bounded memory. See ``ExternalSort``
+
+        :returns: None
+        """
+        self.path = path
+        self.offset = 0
+        self.suffix_column = suffix_column
+        self.suffix_entries = ExternalSort(run_size)
+        self.trigrams = TrigramIndexBuilder() if trigrams else None
+        self.fold_entries = ExternalSort(run_size) if fold else None
+        self.completions = CompletionIndexBuilder() if completions else None
+
+    def __enter__(self):
+        """
+        Open file on enter when using ``with`` keyword.
+        """
+        self.open()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """
+        Close file on exit when using ``with`` keyword.
+        """
+        self.close()
+
+    def open(self):
+        """
+        Open file and index.
+        """
+        self.file_o = open(self.path, 'wb')
+        self.index_o = open(self.path + LINE_INDEX_SUFFIX, 'wb')
+        self.index_o.write(LINE_INDEX_MAGIC)
+
+    def write(self, line):
+        """
+        Write a line, including its line ending, to the tag file.
+        """
+        self.index_o.write(LINE_INDEX_ENTRY.pack(self.offset))
+        if self.suffix_column is not None:
+            key = suffix_key(line, self.suffix_column)
+            self.suffix_entries.add((key, self.offset), len(key))
+        if self.trigrams is not None:
+            self.trigrams.add(line, self.offset)
+        if self.fold_entries is not None:
+            key = fold_key(line, SYMBOL)
+            self.fold_entries.add((key, self.offset), len(key))
+        if self.completions is not None:
+            self.completions.add(line)
+        self.file_o.write(line)
+        self.offset += len(line)
+
+    def close(self):
+        """
+        Close file and index.
+
+        The indexes are closed last so they are not older than the tag file.
+        """
+        self.file_o.close()
+        self.index_o.write(LINE_INDEX_ENTRY.pack(self.offset))  # sentinel
+        self.index_o.close()
+
+        if self.suffix_column is not None:
+            write_suffix_index(self.path, self.suffix_column,
+                               self.suffix_entries, self.offset)
+        self.suffix_entries.close()
+
+        if self.trigrams is not None:
+            self.trigrams.write(self.path, self.offset)
+            self.trigrams = None
+
+        if self.fold_entries is not None:
+            write_sorted_index(self.path + FOLD_INDEX_SUFFIX,
+                               FOLD_INDEX_MAGIC, self.fold_entries,
+                               self.offset)
+            self.fold_entries.close()
+            self.fold_entries = None
+
+        if self.completions is not None:
+            self.completions.write(self.path, self.offset)
+            self.completions = None
+
+class TagFile(object):
+    """
+    Model a tag file.
+
+    This doesn't actually hold a entire tag file, due in part to the sheer
+    size of some tag files (> 100 MB files are possible). Instead, it acts
+    as a 'wrapper' of sorts around a file, providing functionality like
+    searching for a retrieving tags, finding tags based on given criteria
+    (prefix, suffix, exact), getting the directory of a tag and so forth.
+    """
+    file_o = None
+    mapped = None
+    line_index = None
+    suffix_index = None
+    trigram_index = None
+    fold_index = None
+    completion_index = None
+    abbreviation_index = None
+    headers = None
+    headers_size = 0
+    sort_mode = SORT_YES
+    strategy = SEARCH_BISECT
+
+    def __init__(self, path, column):
+        """
+        Initialise object.
+
+        The file indicated by ``path`` must be sorted by values in the column
+        indicated by ``column``.
+
+        :param path: path to a tag file
+        :param column: column to search on
+
+        :returns: None
+        """
+        self.path = path
+        self.column = column
+
+    def __getitem__(self, index):
+        """
+        Provide sequence-type interface to tag file.
+
+        If the tag file has a line index, ``index`` is a line number.
+        Otherwise it is a byte offset, and the first complete line starting
+        at or after that offset is returned.
+        """
+        fold = self.sort_mode == SORT_FOLDCASE
+
+        if self.line_index is not None:
+            self.mapped.seek(self.line_index[index])
+            return Tag(self.mapped.readline().strip(), self.column, fold)
+
+        if index == 0:  # handle first line
+            self.mapped.seek(0)
+        else:
+            # step back a byte so a line starting exactly at ``index`` is
+            # not skipped when discarding the partial line
+            self.mapped.seek(index - 1)
+            self.mapped.readline()
+
+        result = self.mapped.readline().strip()
+
+        return Tag(result, self.column, fold)
+
+    def __len__(self):
+        """
+        Get number of lines in tag file, or size in bytes if not indexed.
+        """
+        if self.line_index is not None:
+            return len(self.line_index)
+        return len(self.mapped)
+
+    def __enter__(self):
+        """
+        Open file on enter when using ``with`` keyword.
         """
         self.open()
         return self
@@ -479,83 +3334,1365 @@ class TagFile(object):
         self.file_o = codecs.open(self.path, 'r+b', encoding='ascii')
         self.mapped = mmap.mmap(self.file_o.fileno(), 0,
                                 access=mmap.ACCESS_READ)
+        self.line_index = LineIndex.load(self.path, len(self.mapped))
+        self.suffix_index = SuffixIndex.load(self.path, len(self.mapped),
+                                             self.column)
+        if self.column == SYMBOL:
+            self.trigram_index = TrigramIndex.load(self.path,
+                                                   len(self.mapped))
+            self.fold_index = FoldIndex.load(self.path, len(self.mapped))
+            self.completion_index = CompletionIndex.load(self.path,
+                                                         len(self.mapped))
+            self.abbreviation_index = AbbreviationIndex.load(
+                self.path, len(self.mapped))
+
+        # kept with the open file, so pooled handles read them only once
+        self.headers, self.headers_size = read_tag_headers(self.mapped)
+        if self.column == SYMBOL:
+            # other columns are sorted by ``resort_ctags``, whatever the
+            # header says
+            self.sort_mode = TAG_FILE_SORTED.get(
+                self.headers.get('TAG_FILE_SORTED'), SORT_YES)
+        self.strategy = get_search_strategy(self.sort_mode,
+                                            self.fold_index is not None)
+        self.mapped.seek(0)
+
+    @property
+    def format(self):
+        """
+        Get the format of the tag file, from ``!_TAG_FILE_FORMAT``.
+        """
+        return int(self.headers.get('TAG_FILE_FORMAT', 2))
+
+    @property
+    def program_version(self):
+        """
+        Get the version of ctags which built the tag file, from
+        ``!_TAG_PROGRAM_VERSION``, if known.
+        """
+        return self.headers.get('TAG_PROGRAM_VERSION')
 
     def close(self):
         """
         Close file.
         """
+        if self.line_index is not None:
+            self.line_index.close()
+            self.line_index = None
+        if self.suffix_index is not None:
+            self.suffix_index.close()
+            self.suffix_index = None
+        if self.trigram_index is not None:
+            self.trigram_index.close()
+            self.trigram_index = None
+        if self.fold_index is not None:
+            self.fold_index.close()
+            self.fold_index = None
+        if self.completion_index is not None:
+            self.completion_index.close()
+            self.completion_index = None
+        if self.abbreviation_index is not None:
+            self.abbreviation_index.close()
+            self.abbreviation_index = None
         self.mapped.close()
         self.file_o.close()
 
     def search(self, exact_match=True, *tags):
         """
-        Search for one or more tags in the tag file.
+        Search for one or more tags in the tag file.
+
+        Search a tag file for given tags using the strategy chosen for its
+        sort order. See ``get_search_strategy``.
+
+        :param exact_match: if search should be an exact or partial match
+
+        :returns: matching tags
+        """
+        if not tags:
+            self.mapped.seek(self.headers_size)  # skip pseudo-tags
+            while self.mapped.tell() < self.mapped.size():
+                result = Tag(self.mapped.readline().strip(), self.column)
+                yield(result)
+            return
+
+        for key in tags:
+            if self.strategy == SEARCH_BISECT:
+                results = self.search_sorted(key, exact_match)
+            elif self.strategy == SEARCH_FOLDCASE:
+                results = self.search_sorted(key, exact_match, True, True)
+            else:
+                if self.strategy == SEARCH_INDEXED:
+                    results = self.search_fold_index(key, exact_match)
+                else:
+                    results = self.search_linear(key, exact_match)
+                # filter by case, if matched without
+                results = (result for result in results
+                           if (result[result.column] == key if exact_match
+                               else result[result.column].startswith(key)))
+
+            for result in results:
+                yield(result)
+
+    def search_many(self, tags, exact_match=True):
+        """
+        Search for many tags in the tag file at once.
+
+        The tags are sorted and deduplicated, then searched for in order. In
+        a sorted tag file, each search gallops forward from where the last
+        one ended before bisecting, so each region of the file is read
+        roughly once however many tags there are. An unsorted tag file
+        without a fold index is read once for all tags.
+
+        :param tags: iterable of tags to search for
+        :param exact_match: if search should be an exact or partial match
+
+        :returns: dict of each tag found to a list of matching tags, in the
+            order of the tag file
+        """
+        keys = dict((tag.encode('utf-8'), tag) for tag in set(tags))
+        results = {}
+
+        if self.strategy == SEARCH_LINEAR:
+            self.mapped.seek(self.headers_size)  # skip pseudo-tags
+            for line in iter(self.mapped.readline, b''):
+                value = column_key(line, self.column)
+                if exact_match:
+                    matched = [keys[value]] if value in keys else ()
+                else:
+                    matched = [keys[value[:end]]
+                               for end in range(len(value) + 1)
+                               if value[:end] in keys]
+                for tag in matched:
+                    results.setdefault(tag, []).append(
+                        Tag(line.strip(), self.column))
+            return results
+
+        if self.strategy == SEARCH_INDEXED:
+            for tag in sorted(keys.values()):
+                matches = list(self.search(exact_match, tag))
+                if matches:
+                    results[tag] = matches
+            return results
+
+        fold = self.strategy == SEARCH_FOLDCASE
+        position = 0
+
+        for key in sorted(keys, key=lambda key: key.upper() if fold else key):
+            position = self.gallop(key.upper() if fold else key, position,
+                                   fold)
+            matches = list(self.read_matches(self.line_start(position), key,
+                                             exact_match, fold, fold))
+            if matches:
+                results[keys[key]] = matches
+
+        return results
+
+    def search_prefix(self, prefix, limit=None, distinct_symbols_only=False):
+        """
+        Search for tags starting with a prefix, stopping early.
+
+        Unlike ``search(False, prefix)``, at most ``limit`` results are read,
+        so short prefixes stay cheap. In a sorted tag file, distinct symbols
+        are counted without reading their lines: by the distance between
+        the first and last line in the line index, if there is one, or else
+        by counting line endings.
+
+        :param prefix: prefix of the tags to search for
+        :param limit: maximum number of results, or None for all
+        :param distinct_symbols_only: return each distinct symbol and its
+            number of tags, rather than the tags themselves
+
+        :returns: list of up to ``limit`` matching tags, or of
+            ``(symbol, count)`` tuples if ``distinct_symbols_only``, in the
+            order of the tag file
+        """
+        if not distinct_symbols_only:
+            return list(islice(self.search(False, prefix), limit))
+
+        if self.strategy not in (SEARCH_BISECT, SEARCH_FOLDCASE):
+            counts, symbols = {}, []
+            for result in self.search(False, prefix):
+                symbol = result[result.column]
+                if symbol not in counts:
+                    counts[symbol] = 0
+                    symbols.append(symbol)
+                counts[symbol] += 1
+            return [(symbol, counts[symbol]) for symbol in symbols[:limit]]
+
+        key = prefix.encode('utf-8')
+        fold = self.strategy == SEARCH_FOLDCASE
+        folded = key.upper() if fold else key
+        position = self.bisect(folded, fold=fold)
+        results = []
+
+        while limit is None or len(results) < limit:
+            start = self.line_start(position)
+            value = self.column_at(start)
+            if value is None:
+                break
+            if fold:
+                value = value.upper()
+            if not value.startswith(folded):
+                break
+
+            # the smallest value after ``value`` is ``value`` then a null
+            end = self.gallop(value + b'\0', position, fold)
+            stop = self.line_start(end)
+
+            if value.startswith(b'!_') and start < self.headers_size:
+                pass  # skip pseudo-tags
+            elif fold:  # symbols differing only in case may be interleaved
+                counts, symbols = {}, []
+                offset = start
+                while offset < stop:
+                    symbol = self.column_at(offset)
+                    _, offset = self.read_line(offset)
+                    if not symbol.startswith(key):
+                        continue
+                    if symbol not in counts:
+                        counts[symbol] = 0
+                        symbols.append(symbol)
+                    counts[symbol] += 1
+                results.extend((symbol.decode('utf-8', 'replace'),
+                                counts[symbol]) for symbol in symbols)
+            elif self.line_index is not None:
+                results.append((value.decode('utf-8', 'replace'),
+                                end - position))
+            else:
+                count = self.mapped[start:stop].count(b'\n')
+                if self.mapped[stop - 1:stop] != b'\n':  # no final newline
+                    count += 1
+                results.append((value.decode('utf-8', 'replace'), count))
+
+            position = end
+
+        return results[:limit]
+
+    def search_completions(self, prefix, limit=None):
+        """
+        Get the distinct symbols starting with a prefix, ignoring case.
+
+        Uses the completion index if the tag file has one, so only the
+        returned symbols are read. Otherwise the matching tags are searched
+        for and deduplicated.
+
+        :param prefix: prefix of the symbols to get
+        :param limit: maximum number of symbols, or None for all
+
+        :returns: list of symbols, ordered ignoring case
+        """
+        if self.completion_index is not None:
+            return self.completion_index.complete(prefix, limit)
+
+        symbols = set(result[result.column] for result in
+                      self.search_ignore_case(False, prefix))
+        symbols = sorted(symbols, key=lambda symbol: (
+            completion_key(symbol), symbol.encode('utf-8')))
+
+        return symbols[:limit]
+
+    def search_abbreviations(self, abbreviation, limit=None):
+        """
+        Get the distinct symbols with an abbreviation starting with the
+        given text, ignoring case.
+
+        Uses the abbreviation index if the tag file has one. Otherwise this
+        is a linear search, which is slow.
+
+        :param abbreviation: start of the abbreviation of the symbols to get,
+            such as ``gDN`` for ``getDisplayName``. See ``get_abbreviation``
+        :param limit: maximum number of symbols, or None for all
+
+        :returns: list of symbols, ordered by abbreviation
+        """
+        if self.abbreviation_index is not None:
+            return self.abbreviation_index.complete(abbreviation, limit)
+
+        key = abbreviation.lower()
+        symbols = set()
+
+        for result in self.search():
+            symbol = result[result.column]
+            if (get_abbreviation(symbol) or '').startswith(key):
+                symbols.add(symbol)
+
+        symbols = sorted(symbols, key=lambda symbol: (
+            get_abbreviation(symbol), symbol.encode('utf-8')))
+
+        return symbols[:limit]
+
+    def search_by_abbreviation(self, abbreviation):
+        """
+        Search for tags with a symbol abbreviated as the given text.
+
+        :param abbreviation: start of the abbreviation of the symbols to
+            search for. See ``search_abbreviations``
+
+        :returns: matching tags, ordered by abbreviation
+        """
+        for symbol in self.search_abbreviations(abbreviation):
+            for result in self.search(True, symbol):
+                yield result
+
+    def search_sorted(self, key, exact_match=True, fold=False,
+                      match_case=False):
+        """
+        Bisect the tag file for a tag and read the matching lines.
+
+        :param key: tag to search for
+        :param exact_match: if search should be an exact or partial match
+        :param fold: if the tag file is sorted, and should be matched,
+            ignoring case
+        :param match_case: if matches ignoring case should then be filtered
+            by case
+
+        :returns: matching tags
+        """
+        key = key.encode('utf-8')
+        position = self.bisect(key.upper() if fold else key, fold=fold)
+
+        return self.read_matches(self.line_start(position), key, exact_match,
+                                 fold, match_case)
+
+    def read_matches(self, offset, key, exact_match=True, fold=False,
+                     match_case=False):
+        """
+        Read the lines matching a tag, from the first possible match on.
+
+        :param offset: offset of the start of the first line to read
+        :param key: tag to match, as bytes
+        :param exact_match: if search should be an exact or partial match
+        :param fold: if the lines should be matched ignoring case
+        :param match_case: if matches ignoring case should then be filtered
+            by case
+
+        :returns: matching tags
+        """
+        folded = key.upper() if fold else key
+
+        while True:
+            value = self.column_at(offset)
+            if value is None:
+                break
+            if fold:
+                value, case_value = value.upper(), value
+            if not (value == folded if exact_match else
+                    value.startswith(folded)):
+                break
+            line, offset = self.read_line(offset)
+            if line.startswith(b'!_'):  # skip pseudo-tags
+                continue
+            if fold and match_case and not (
+                    case_value == key if exact_match else
+                    case_value.startswith(key)):
+                continue
+            yield Tag(line.strip(), self.column)
+
+    def bisect(self, key, low=0, high=None, fold=False):
+        """
+        Bisect the tag file for a tag, comparing bytes.
+
+        Equivalent to ``bisect.bisect_left(self, key, low, high)``, but reads
+        only the searched column of each probed line, without decoding it.
+
+        :param key: tag to search for, as bytes, uppercased if ``fold``
+        :param low: first position to consider
+        :param high: position after the last position to consider
+        :param fold: compare ignoring case
+
+        :returns: position of the first line not less than ``key``
+        """
+        if high is None:
+            high = len(self)
+
+        while low < high:
+            middle = (low + high) // 2
+            if self.less_than(middle, key, fold):
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def gallop(self, key, start=0, fold=False):
+        """
+        Search forward from a position in the tag file for a tag.
+
+        Probes positions at exponentially increasing distances from
+        ``start`` until one is not less than ``key``, then bisects between
+        the last two probes. Finding a tag near ``start`` is cheaper than
+        bisecting the whole file.
+
+        :param key: tag to search for, as bytes, uppercased if ``fold``
+        :param start: position known not to be after the tag
+        :param fold: compare ignoring case
+
+        :returns: position of the first line not less than ``key``, as for
+            ``bisect``
+        """
+        size = len(self)
+        low, step = start, 1
+
+        while start + step < size and self.less_than(start + step, key,
+                                                     fold):
+            low = start + step
+            step *= 2
+
+        return self.bisect(key, low, min(start + step, size), fold)
+
+    def less_than(self, position, key, fold=False):
+        """
+        Check if the line at a position sorts before a tag.
+
+        :param position: line number if the tag file has a line index, else
+            byte offset
+        :param key: tag, as bytes, uppercased if ``fold``
+        :param fold: compare ignoring case
+
+        :returns: True if the line sorts before ``key``. A position past the
+            last line sorts last
+        """
+        value = self.column_at(self.line_start(position))
+        if value is None:
+            return False
+        return (value.upper() if fold else value) < key
+
+    def line_start(self, position):
+        """
+        Get the offset of the line at a position.
+
+        :param position: line number if the tag file has a line index, else
+            byte offset, in which case the first line starting at or after
+            ``position`` is used
+
+        :returns: offset of the start of the line
+        """
+        if self.line_index is not None:
+            if position >= len(self.line_index):
+                return len(self.mapped)
+            return self.line_index[position]
+
+        if position == 0:
+            return 0
+
+        # step back a byte so a line starting exactly at ``position`` is used
+        end = self.mapped.find(b'\n', position - 1)
+        return len(self.mapped) if end == -1 else end + 1
+
+    def column_at(self, offset):
+        """
+        Get the searched column of the line at an offset, without decoding.
+
+        :param offset: offset of the start of the line
+
+        :returns: column value, as bytes, or None past the last line
+        """
+        mapped = self.mapped
+
+        if offset >= len(mapped):
+            return None
+
+        end = mapped.find(b'\n', offset)
+        if end == -1:
+            end = len(mapped)
+
+        for _ in range(self.column):
+            tab = mapped.find(b'\t', offset, end)
+            if tab == -1:
+                return b''
+            offset = tab + 1
+
+        tab = mapped.find(b'\t', offset, end)
+        return mapped[offset:end if tab == -1 else tab].rstrip(b'\r')
+
+    def read_line(self, offset):
+        """
+        Read the line at an offset.
+
+        :param offset: offset of the start of the line
+
+        :returns: tuple of the line, as bytes, and the offset of the next line
+        """
+        end = self.mapped.find(b'\n', offset)
+        end = len(self.mapped) if end == -1 else end + 1
+        return self.mapped[offset:end], end
+
+    def search_ignore_case(self, exact_match=True, *tags):
+        """
+        Search for one or more tags in the tag file, ignoring case.
+
+        Tag files sorted with ``--sort=foldcase`` are searched using a binary
+        search, as are other tag files with a fold index. Otherwise this is a
+        linear search, which is slow.
+
+        :param exact_match: if search should be an exact or partial match
+
+        :returns: matching tags
+        """
+        if not tags:
+            for result in self.search(exact_match):
+                yield(result)
+            return
+
+        for key in tags:
+            if self.strategy == SEARCH_FOLDCASE:
+                results = self.search_sorted(key, exact_match, True)
+            elif self.fold_index is not None:
+                results = self.search_fold_index(key, exact_match)
+            else:
+                results = self.search_linear(key, exact_match, True)
+
+            for result in results:
+                yield(result)
+
+    def search_fold_index(self, key, exact_match=True):
+        """
+        Bisect the fold index for a tag and read the matching lines, ignoring
+        case.
+
+        :param key: tag to search for
+        :param exact_match: if search should be an exact or partial match
+
+        :returns: matching tags
+        """
+        key = key.encode('utf-8').upper()
+        index = self.fold_index
+        key_func = lambda line: fold_key(line, self.column)
+
+        for position in range(self.bisect_index(index, key, key_func),
+                              len(index)):
+            line = self.line_at(index[position])
+            value = key_func(line)
+            if not (value == key if exact_match else value.startswith(key)):
+                break
+            if index[position] >= self.headers_size:  # skip pseudo-tags
+                yield Tag(line.strip(), self.column)
+
+    def search_linear(self, key, exact_match=True, ignore_case=False):
+        """
+        Read every line of the tag file for a tag.
 
-        Search a tag file for given tags using a binary search.
+        This works whatever the sort order of the tag file, but is slow.
 
+        :param key: tag to search for
         :param exact_match: if search should be an exact or partial match
+        :param ignore_case: if the tag should be matched ignoring case
 
         :returns: matching tags
         """
-        if not tags:
-            while self.mapped.tell() < self.mapped.size():
-                result = Tag(self.mapped.readline().strip(), self.column)
-                yield(result)
-            return
+        key = key.encode('utf-8')
+        if ignore_case:
+            key = key.upper()
+        key_func = fold_key if ignore_case else column_key
 
-        for key in tags:
-            left_index = bisect.bisect_left(self, key)
-            if exact_match:
-                result = self[left_index]
-                while result.line and result[result.column] == key:
-                    yield(result)
-                    result = Tag(self.mapped.readline().strip(), self.column)
+        self.mapped.seek(self.headers_size)  # skip pseudo-tags
+        for line in iter(self.mapped.readline, b''):
+            value = key_func(line, self.column)
+            if value == key if exact_match else value.startswith(key):
+                yield Tag(line.strip(), self.column)
+
+    def bisect_index(self, index, key, key_func):
+        """
+        Bisect an index of lines sorted by a key.
+
+        :param index: sequence of offsets of lines, sorted by ``key_func``
+        :param key: key to search for
+        :param key_func: function to get the key of a line
+
+        :returns: first position in ``index`` of a line with a key not less
+            than ``key``
+        """
+        left, right = 0, len(index)
+
+        while left < right:
+            middle = (left + right) // 2
+            if key_func(self.line_at(index[middle])) < key:
+                left = middle + 1
             else:
-                result = self[left_index]
-                while result.line and result[result.column].startswith(key):
-                    yield(result)
-                    result = Tag(self.mapped.readline().strip(), self.column)
+                right = middle
+
+        return left
+
+    def line_at(self, offset):
+        """
+        Read the line starting at ``offset``.
+        """
+        self.mapped.seek(offset)
+        return self.mapped.readline()
 
     def search_by_suffix(self, suffix):
         """
         Search for one or more tags with the given suffix in the tag file.
 
-        Search a tag file for given tags with the given suffix, using a linear
-        search. Note that this linear search requires the entire file be
+        Search a tag file for given tags with the given suffix. If the tag
+        file has a suffix index for the column, this is a binary search.
+        Otherwise it is a linear search, which requires the entire file be
         searched making it slow. Hence, it should be avoided if possible.
 
+        Either way, tags are returned in the order of the tag file.
+
         :param suffix: suffix to search for
 
         :returns: matching tags
         """
-        for line in self.file_o:
-            if line.split('\t')[self.column].endswith(suffix):
-                yield Tag(line)
-            else:
-                continue
+        key = suffix.encode('utf-8')[::-1]
+
+        if self.suffix_index is None:
+            self.mapped.seek(self.headers_size)  # skip pseudo-tags
+            for line in iter(self.mapped.readline, b''):
+                if suffix_key(line, self.column).startswith(key):
+                    yield Tag(line.strip(), self.column)
+            return
+
+        index = self.suffix_index
+        key_func = lambda line: suffix_key(line, self.column)
+        offsets = []
+
+        for position in range(self.bisect_index(index, key, key_func),
+                              len(index)):
+            if not key_func(self.line_at(index[position])).startswith(key):
+                break
+            offsets.append(index[position])
+
+        for offset in sorted(offsets):
+            if offset >= self.headers_size:  # skip pseudo-tags
+                self.mapped.seek(offset)
+                yield Tag(self.mapped.readline().strip(), self.column)
+
+    def search_by_substring(self, text, fuzzy=False):
+        """
+        Search for tags with a symbol containing the given text.
+
+        Matching ignores case. If the tag file has a trigram index, only the
+        symbols containing all trigrams of ``text`` are read. Otherwise this
+        is a linear search, which is slow.
+
+        :param text: text to search for
+        :param fuzzy: match symbols with similar trigrams to ``text``, rather
+            than only those containing it
+
+        :returns: matching tags, ordered by similarity if ``fuzzy``, then by
+            position in the tag file
+        """
+        key = text.encode('utf-8').lower()
+        grams = get_trigrams(key)
+        index = self.trigram_index
+
+        if index is None:
+            self.mapped.seek(0)
+            matches = []
+            for line in iter(self.mapped.readline, b''):
+                if line.startswith(b'!_'):
+                    continue
+                score = match_substring(line.split(b'\t', 1)[SYMBOL], key,
+                                        grams, fuzzy)
+                if score is not None:
+                    matches.append((-score, len(matches), line.strip()))
+            for _, _, line in sorted(matches):
+                yield Tag(line, self.column)
+            return
+
+        if not grams:  # too short to index
+            candidates = range(len(index))
+        elif fuzzy:
+            counts = {}
+            for gram in grams:
+                for run in index.postings(gram):
+                    counts[run] = counts.get(run, 0) + 1
+            # fewest shared trigrams a symbol can have and still be similar
+            least = FUZZY_THRESHOLD * len(grams) / (2 - FUZZY_THRESHOLD)
+            candidates = sorted(run for run, count in counts.items()
+                                if count >= least)
+        else:
+            postings = sorted((index.postings(gram) for gram in grams),
+                              key=len)
+            candidates = set(postings[0])
+            for runs in postings[1:]:
+                candidates.intersection_update(runs)
+            candidates = sorted(candidates)
+
+        matches = []
+
+        for run in candidates:  # verify against the tag file
+            self.mapped.seek(index[run])
+            line = self.mapped.readline()
+            symbol = line.split(b'\t', 1)[SYMBOL]
+            score = match_substring(symbol, key, grams, fuzzy)
+            if score is not None:
+                matches.append((-score, run, symbol))
 
-    def tag_class(self):
+        for _, run, symbol in sorted(matches):
+            self.mapped.seek(index[run])
+            for line in iter(self.mapped.readline, b''):
+                if line.split(b'\t', 1)[SYMBOL] != symbol:
+                    break
+                yield Tag(line.strip(), self.column)
+
+    def tag_class(self, compact=False):
         """
         Default class to wrap tag in.
 
         Allows wrapping of a parsed tag dict in a class, so elements can be
         accessed as class variables (i.e. ``class.variable``, rather than
         ``dict['variable'])
+
+        :param compact: use ``CompactTagElements``, which is slower to build
+            but smaller, for tags that are to be kept around. Otherwise use
+            ``LazyTagElements``
         """
-        return type('TagElements', (TagElements,), dict(root_dir=self.dir))
+        if compact:
+            return type('TagElements', (CompactTagElements,),
+                        dict(root_dir=self.dir, __slots__=()))
+        return type('TagElements', (LazyTagElements,),
+                    dict(root_dir=self.dir))
 
     def get_tags_dict(self, *tags, **kw):
         """
         Return the tags from a tag file as a dict.
         """
         filters = kw.get('filters', [])
-        return parse_tag_lines(self.search(True, *tags),
-                               tag_class=self.tag_class(), filters=filters)
+        tag_class = self.tag_class(kw.get('compact', False))
+        if kw.get('ignore_case', False):
+            lines = self.search_ignore_case(True, *tags)
+        elif len(tags) > 1:
+            lines = chain.from_iterable(self.search_many(tags).values())
+        else:
+            lines = self.search(True, *tags)
+        return parse_tag_lines(lines, tag_class=tag_class, filters=filters)
 
     def get_tags_dict_by_suffix(self, suffix, **kw):
         """
         Return the tags with the given suffix of a tag file as a dict.
         """
         filters = kw.get('filters', [])
+        tag_class = self.tag_class(kw.get('compact', False))
         return parse_tag_lines(self.search_by_suffix(suffix),
-                               tag_class=self.tag_class(), filters=filters)
+                               tag_class=tag_class, filters=filters)
+
+    def get_tags_dict_by_substring(self, text, **kw):
+        """
+        Return the tags with a symbol containing the given text of a tag file
+        as a dict.
+        """
+        filters = kw.get('filters', [])
+        tag_class = self.tag_class(kw.get('compact', False))
+        return parse_tag_lines(
+            self.search_by_substring(text, kw.get('fuzzy', False)),
+            tag_class=tag_class, filters=filters)
+
+    def get_tags_dict_by_abbreviation(self, abbreviation, **kw):
+        """
+        Return the tags with a symbol abbreviated as the given text of a tag
+        file as a dict.
+        """
+        filters = kw.get('filters', [])
+        tag_class = self.tag_class(kw.get('compact', False))
+        return parse_tag_lines(self.search_by_abbreviation(abbreviation),
+                               tag_class=tag_class, filters=filters)
+
+class TagFilePool(object):
+    """
+    Model a pool of open tag files, shared between searches.
+
+    Opening a tag file maps it into memory and loads its line index, which
+    is wasted work if the file has not changed since the last search. The
+    pool keeps up to ``max_size`` tag files open, closing the least
+    recently used, and closes tag files left unused for ``max_idle``
+    seconds, so they are not kept mapped while they may be rebuilt. A tag
+    file is reopened if the inode, modification time or size of it or its
+    indexes have changed, such as when it has been rebuilt.
+
+    Each open tag file is used by one search at a time; concurrent searches
+    of the same file get separate handles.
+    """
+
+    def __init__(self, max_size=8, max_idle=TAG_FILE_POOL_MAX_IDLE):
+        """
+        Initialise object.
+
+        :param max_size: maximum number of idle tag files to keep open
+        :param max_idle: seconds to keep an idle tag file open, or None to
+            keep it open until evicted or invalidated
+
+        :returns: None
+        """
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.timer = None  # closes tag files idle for ``max_idle``
+        self.idle = {}  # (path, column): (tag file, stamp, time released)
+        self.order = []  # keys of ``idle``, least recently used first
+        self.borrowed = {}  # id(tag file): (key, stamp, generation)
+        self.generation = 0
+
+    def __len__(self):
+        """
+        Get number of idle tag files.
+        """
+        return len(self.idle)
+
+    @staticmethod
+    def stamp(path, column):
+        """
+        Get the state of a tag file and its indexes, to detect changes.
+
+        :param path: path to a tag file
+        :param column: column to search on
+
+        :returns: tuple of inode, modification time and size of each file
+        """
+        result = ()
+
+        for file_path in (path, path + LINE_INDEX_SUFFIX,
+                          suffix_index_path(path, column),
+                          path + TRIGRAM_INDEX_SUFFIX,
+                          path + FOLD_INDEX_SUFFIX,
+                          path + COMPLETION_INDEX_SUFFIX,
+                          path + ABBREVIATION_INDEX_SUFFIX):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                result += (None, None, None)
+            else:
+                result += (stat.st_ino, stat.st_mtime, stat.st_size)
+
+        return result
+
+    @contextmanager
+    def open(self, path, column):
+        """
+        Get an open tag file from the pool when using ``with`` keyword.
+
+        :param path: path to a tag file
+        :param column: column to search on
+
+        :returns: open ``TagFile``, returned to the pool on exit
+        """
+        tag_file = self.acquire(path, column)
+        try:
+            yield tag_file
+        finally:
+            self.release(tag_file)
+
+    def acquire(self, path, column):
+        """
+        Get an open tag file, reusing one from the pool if it is current.
+
+        Each tag file acquired must be passed to ``release`` when done.
+
+        :param path: path to a tag file
+        :param column: column to search on
+
+        :returns: open ``TagFile``
+        """
+        key = (path, column)
+        stamp = self.stamp(path, column)
+
+        with self.lock:
+            entry = self.idle.pop(key, None)
+            if entry:
+                self.order.remove(key)
+            generation = self.generation
+
+        if entry and entry[1] == stamp:
+            tag_file = entry[0]
+            tag_file.mapped.seek(0)  # searches start at the current position
+            tag_file.file_o.seek(0)
+        else:
+            if entry:
+                entry[0].close()
+            tag_file = TagFile(path, column)
+            tag_file.open()
+
+        with self.lock:
+            self.borrowed[id(tag_file)] = (key, stamp, generation)
+
+        return tag_file
+
+    def release(self, tag_file):
+        """
+        Return a tag file to the pool.
+
+        The tag file is closed instead if it was invalidated while in use, or
+        if another handle for the same file was returned first.
+
+        :param tag_file: ``TagFile`` from ``acquire``
+
+        :returns: None
+        """
+        evicted = []
+
+        with self.lock:
+            key, stamp, generation = self.borrowed.pop(id(tag_file))
+            if generation != self.generation or key in self.idle:
+                evicted.append(tag_file)
+            else:
+                self.idle[key] = (tag_file, stamp, time.time())
+                self.order.append(key)
+                while len(self.order) > self.max_size:
+                    evicted.append(self.idle.pop(self.order.pop(0))[0])
+                if self.max_idle is not None and self.timer is None:
+                    self.schedule(self.max_idle)
+
+        for tag_file in evicted:
+            tag_file.close()
+
+    def schedule(self, delay):
+        """
+        Close the tag files idle for ``max_idle`` after a delay.
+
+        Must be called with ``lock`` held.
+
+        :param delay: seconds to wait
+
+        :returns: None
+        """
+        self.timer = threading.Timer(delay, self.expire)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def expire(self):
+        """
+        Close the tag files idle for ``max_idle`` seconds or more.
+
+        :returns: None
+        """
+        now = time.time()
+
+        with self.lock:
+            keys = [key for key in self.order
+                    if now - self.idle[key][2] >= self.max_idle]
+            for key in keys:
+                self.order.remove(key)
+            evicted = [self.idle.pop(key)[0] for key in keys]
+
+            self.timer = None
+            if self.order:  # least recently used first
+                self.schedule(max(0, self.idle[self.order[0]][2] +
+                                  self.max_idle - now))
+
+        for tag_file in evicted:
+            tag_file.close()
+
+    def invalidate(self, path=None):
+        """
+        Close pooled handles for a tag file, such as after rebuilding it.
+
+        Handles in use are closed when they are released.
+
+        :param path: path to a tag file, or ``None`` for all tag files
+
+        :returns: None
+        """
+        with self.lock:
+            self.generation += 1
+            keys = [key for key in self.order
+                    if path is None or key[0] == path]
+            for key in keys:
+                self.order.remove(key)
+            evicted = [self.idle.pop(key)[0] for key in keys]
+
+        for tag_file in evicted:
+            tag_file.close()
+
+class CachedTags(object):
+    """
+    Model the parsed tags of a ``ParsedTagCache`` entry.
+
+    Behaves like the dict returned by ``parse_tag_lines``, but the tags of
+    each key are only deserialized when first accessed.
+    """
+
+    def __init__(self, data, start, spans, compact=False, root_dir=None):
+        """
+        Initialise object.
+
+        :param data: entry, as bytes
+        :param start: offset of the tags in ``data``
+        :param spans: dict of keys to the start and end of their tags,
+            relative to ``start``
+        :param compact: if the tags are ``CompactTagElements``, rather than
+            ``TagElements``
+        :param root_dir: directory of the tag file the tags were parsed
+            from, as given by ``TagFile.tag_class``, if any
+
+        :returns: None
+        """
+        self.data = data
+        self.start = start
+        self.spans = spans
+        self.compact = compact
+        self.loaded = {}
+
+        if compact:
+            self.tag_class = CompactTagElements
+        else:
+            self.tag_class = TagElements
+        if root_dir is not None:  # as ``TagFile.tag_class``
+            attrs = dict(root_dir=root_dir)
+            if compact:
+                attrs['__slots__'] = ()
+            self.tag_class = type('TagElements', (self.tag_class, ), attrs)
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            start, end = self.spans[key]
+            elements = marshal.loads(
+                self.data[self.start + start:self.start + end])
+            if self.compact:
+                tags = [self.tag_class.from_tuple(tag) for tag in elements]
+            else:
+                tags = [self.tag_class(tag) for tag in elements]
+            self.loaded[key] = tags
+        return self.loaded[key]
+
+    def __contains__(self, key):
+        return key in self.spans
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def get(self, key, default=None):
+        if key not in self.spans:
+            return default
+        return self[key]
+
+    def keys(self):
+        return list(self.spans)
+
+    def items(self):
+        return [(key, self[key]) for key in self.spans]
+
+    def values(self):
+        return [self[key] for key in self.spans]
+
+class ParsedTagCache(object):
+    """
+    Model an on-disk cache of parsed tags.
+
+    Parsing a large tag file is slow, so the tags parsed for a query of a
+    tag file, such as all the tags of a file, are kept in a file in
+    ``directory``. Entries are keyed by the path, size and modification time
+    of the tag file, the query and ``PARSER_VERSION``, so they are never
+    used once the tag file or the parser changes. The least recently used
+    entries are removed once the cache is larger than ``max_size`` bytes.
+    """
+
+    def __init__(self, directory, max_size=PARSED_TAG_CACHE_SIZE):
+        """
+        Initialise object.
+
+        :param directory: directory to keep entries in
+        :param max_size: maximum size of the entries, in bytes
+
+        :returns: None
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, tag_file, query):
+        """
+        Get the path of the entry for a query of a tag file.
+
+        :param tag_file: path to a tag file
+        :param query: value identifying the parsed tags, made of strings,
+            numbers, tuples and lists
+
+        :returns: path to the entry, or None if the tag file does not exist
+        """
+        try:
+            stat = os.stat(tag_file)
+        except OSError:
+            return None
+
+        # marshal formats differ between python versions
+        key = repr((PARSER_VERSION, sys.version_info[:2],
+                    os.path.abspath(tag_file), stat.st_size, stat.st_mtime,
+                    query))
+
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get_tags(self, tag_file, query, parse):
+        """
+        Get parsed tags from the cache, parsing them if not cached.
+
+        :param tag_file: path to a tag file
+        :param query: see ``entry_path``
+        :param parse: function returning the parsed tags, as returned by
+            ``parse_tag_lines``, if they are not cached
+
+        :returns: the parsed tags
+        """
+        path = self.entry_path(tag_file, query)
+
+        if path is not None:
+            tags = self.load(path)
+            if tags is not None:
+                return tags
+
+        tags = parse()
+
+        if path is not None:
+            self.save(path, tags)
+
+        return tags
+
+    def load(self, path):
+        """
+        Load an entry.
+
+        :param path: path to the entry
+
+        :returns: ``CachedTags``, or None if there is no usable entry
+        """
+        try:
+            with open(path, 'rb') as file_:
+                data = file_.read()
+            start = len(PARSED_TAG_CACHE_MAGIC) + PARSED_TAG_CACHE_HEADER.size
+            if data[:len(PARSED_TAG_CACHE_MAGIC)] != PARSED_TAG_CACHE_MAGIC:
+                return None
+            size = PARSED_TAG_CACHE_HEADER.unpack_from(
+                data, len(PARSED_TAG_CACHE_MAGIC))[0]
+            compact, root_dir, spans = marshal.loads(
+                data[start:start + size])
+        except (IOError, OSError, EOFError, TypeError, ValueError,
+                struct.error):  # missing or unreadable
+            return None
+
+        try:
+            os.utime(path, None)  # now most recently used
+        except OSError:
+            pass
+
+        return CachedTags(data, start + size, spans, compact, root_dir)
+
+    def save(self, path, tags):
+        """
+        Save an entry, then remove the least recently used entries if the
+        cache is too large.
+
+        :param path: path to the entry
+        :param tags: parsed tags, as returned by ``parse_tag_lines``
+
+        :returns: None
+        """
+        first = next((tags[key][0] for key in tags if tags[key]), None)
+        compact = isinstance(first, CompactTagElements)
+        # kept with the entry, as it is an attribute of the tag class
+        root_dir = getattr(type(first), 'root_dir', None)
+        spans = {}
+        blobs = []
+        offset = 0
+
+        for key in tags:
+            if compact:
+                elements = [tag.to_tuple() for tag in tags[key]]
+            else:
+                elements = [dict(tag.items()) for tag in tags[key]]
+            blob = marshal.dumps(elements)
+            spans[key] = (offset, offset + len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+
+        header = marshal.dumps((compact, root_dir, spans))
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            handle, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                                suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file_:
+                file_.write(PARSED_TAG_CACHE_MAGIC)
+                file_.write(PARSED_TAG_CACHE_HEADER.pack(len(header)))
+                file_.write(header)
+                for blob in blobs:
+                    file_.write(blob)
+            replace_file(tmp_path, path)
+        except (IOError, OSError):  # not cached, but still parsed
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is no larger
+        than ``max_size``.
+
+        :returns: None
+        """
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed meanwhile
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+            total += stat.st_size
+
+        for _, path, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+class TagsCache(object):
+    """
+    Model a bounded in-memory cache of parsed tags.
+
+    Each entry is checked against the inode, modification time and size of
+    the tag file it was parsed from when it is used, so entries are dropped
+    once the tag file is rebuilt, however it was rebuilt. Entries are
+    evicted least recently used first once their estimated size is larger
+    than ``max_size`` bytes. See ``estimate_tags_size``.
+    """
+
+    def __init__(self, max_size=TAGS_CACHE_SIZE):
+        """
+        Initialise object.
+
+        :param max_size: memory budget, in bytes
+
+        :returns: None
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}  # key: (tags, tag file, stamp, size)
+        self.order = []  # keys of ``entries``, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """
+        Get number of entries.
+        """
+        return len(self.entries)
+
+    @staticmethod
+    def stamp(tag_file):
+        """
+        Get the state of a tag file, to detect changes.
+
+        :param tag_file: path to a tag file
+
+        :returns: tuple of inode, modification time and size, or None if the
+            tag file does not exist
+        """
+        try:
+            stat = os.stat(tag_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    def get(self, key, tag_file):
+        """
+        Get the tags cached for a key, if still valid.
+
+        :param key: key of the entry
+        :param tag_file: path to the tag file the tags were parsed from
+
+        :returns: the cached tags, or None if not cached or stale
+        """
+        stamp = self.stamp(tag_file)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] != tag_file or entry[2] != stamp:
+                self.remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.order.remove(key)
+            self.order.append(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, tag_file, tags):
+        """
+        Cache the tags for a key, evicting others if over budget.
+
+        Tags larger than the budget on their own are not cached.
+
+        :param key: key of the entry
+        :param tag_file: path to the tag file the tags were parsed from
+        :param tags: parsed tags
+
+        :returns: None
+        """
+        stamp = self.stamp(tag_file)
+        size = estimate_tags_size(tags)
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if stamp is None or size > self.max_size:
+                return
+            self.entries[key] = (tags, tag_file, stamp, size)
+            self.order.append(key)
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until within budget. Must be
+        called holding ``lock``.
+
+        :returns: None
+        """
+        while self.size > self.max_size and self.order:
+            self.remove(self.order[0])
+            self.evictions += 1
+
+    def remove(self, key):
+        """
+        Remove an entry. Must be called holding ``lock``.
+
+        :param key: key of the entry
+
+        :returns: None
+        """
+        self.size -= self.entries.pop(key)[3]
+        self.order.remove(key)
+
+    def invalidate(self, tag_file=None):
+        """
+        Remove the entries for a tag file, such as after rebuilding it.
+
+        :param tag_file: path to a tag file, or ``None`` for all tag files
+
+        :returns: None
+        """
+        with self.lock:
+            for key in [key for key in self.order
+                        if tag_file is None or
+                        self.entries[key][1] == tag_file]:
+                self.remove(key)
+
+    def stats(self):
+        """
+        Get statistics of the cache.
+
+        :returns: dict of the number of entries, their estimated size, the
+            budget, and the number of hits, misses, stale entries dropped
+            and entries evicted
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'size': self.size,
+                    'max_size': self.max_size, 'hits': self.hits,
+                    'misses': self.misses, 'stale': self.stale,
+                    'evictions': self.evictions}
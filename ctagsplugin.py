@@ -2,6 +2,7 @@
 A ctags plugin for Sublime Text 2/3.
 """
 
+import bisect
 import functools
 from functools import reduce
 import codecs
@@ -11,12 +12,13 @@ import os
 import pprint
 import re
 import string
+import tempfile
 import threading
 import subprocess
 
 from itertools import chain
 from operator import itemgetter as iget
-from collections import defaultdict, deque
+from collections import deque
 
 try:
     import sublime
@@ -34,8 +36,9 @@ except ImportError:  # running tests
     sys.modules['sublime_plugin'] = sublime_plugin
 
 import ctags
-from ctags import (FILENAME, parse_tag_lines, PATH_ORDER, SYMBOL,
-                   TagElements, TagFile)
+from ctags import (CompactTagElements, FILENAME, parse_tag_lines,
+                   ParsedTagCache, PATH_ORDER, SYMBOL, TagElements,
+                   TagFilePool, TagsCache)
 from helpers.edit import Edit
 
 from helpers.common import *
@@ -56,6 +59,11 @@ ENTITY_SCOPE = 'entity.name.function, entity.name.type, meta.toc-list'
 
 RUBY_SPECIAL_ENDINGS = r'\?|!'
 
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# sorts after any character of a word, to bisect past words with a prefix
+WORD_END = u'\uffff'
+
 ON_LOAD = sublime_plugin.all_callbacks['on_load']
 
 
@@ -380,7 +388,8 @@ def format_tag_for_quickopen(tag, show_path=True):
     :returns: formatted tag
     """
     format_ = []
-    tag = ctags.TagElements(tag)
+    if not isinstance(tag, (TagElements, CompactTagElements)):
+        tag = TagElements(tag)
     f = ''
 
     for field in getattr(tag, 'field_keys', []):
@@ -538,9 +547,13 @@ def show_build_panel(view):
             recursive = setting('recursive')
             tag_file = setting('tag_file')
             opts = setting('opts')
+            jobs = setting('build_jobs', 1)
+            stream = setting('build_stream', False)
+            incremental = setting('build_incremental', False)
 
             rebuild_tags = RebuildTags(False)
-            rebuild_tags.build_ctags(paths, command, tag_file, recursive, opts)
+            rebuild_tags.build_ctags(paths, command, tag_file, recursive, opts,
+                                     jobs, stream, incremental)
 
     view.window().show_quick_panel(display, on_select)
 
@@ -609,21 +622,115 @@ def check_if_building(self, **args):
 
 # Goto definition under cursor commands
 
+tag_files = TagFilePool()
+
+
+def search_tags_file(tags_file, symbol, filters=None, ignore_case=False,
+                     partial=False):
+    """
+    Search a tag file for the definitions of a symbol.
+
+    :param tags_file: path to a tag file
+    :param symbol: symbol to search for
+    :param filters: filters to apply to the tags
+    :param ignore_case: match the symbol ignoring case
+    :param partial: fall back to symbols abbreviated as, containing, then
+        similar to, the symbol
+
+    :returns: tuple of how closely the tags match, from 0 for the symbol
+        itself, and dict of tags, or None if nothing matches
+    """
+    # skip tag files which cannot contain the symbol, unless falling back
+    # to partial matches
+    if not (partial or ctags.may_contain_symbol(tags_file, symbol)):
+        return None
+
+    with tag_files.open(tags_file, SYMBOL) as tagfile:
+        searches = [functools.partial(tagfile.get_tags_dict, symbol,
+                                      ignore_case=ignore_case)]
+        if partial:
+            searches.extend([
+                functools.partial(tagfile.get_tags_dict_by_abbreviation,
+                                  symbol),
+                functools.partial(tagfile.get_tags_dict_by_substring,
+                                  symbol),
+                functools.partial(tagfile.get_tags_dict_by_substring,
+                                  symbol, fuzzy=True)])
+
+        for level, search in enumerate(searches):
+            tags = search(filters=filters)
+            if tags:
+                return level, tags
+
+    return None
+
+
+def merge_tags(results):
+    """
+    Merge the tags found in a number of tag files.
+
+    Only the closest matches are kept, so partial matches in one tag file
+    do not hide the symbol itself in another. Tags found in more than one
+    tag file, such as for a library also tagged in a project, are kept
+    once, from the first tag file.
+
+    :param results: list of results of ``search_tags_file``, in the order of
+        the tag files
+
+    :returns: dict of tags
+    """
+    if not results:
+        return {}
+
+    best = min(level for level, _ in results)
+    merged, seen = {}, set()
+
+    for level, tags in results:
+        if level != best:
+            continue
+        for key in tags:
+            for tag in tags[key]:
+                ident = (os.path.normpath(os.path.join(
+                    tag.root_dir, tag.filename)), tag.ex_command, tag.symbol)
+                if ident in seen:
+                    continue
+                seen.add(ident)
+                merged.setdefault(key, []).append(tag)
+
+    return merged
+
+
 class JumpToDefinition:
     """
     Provider for NavigateToDefinition and SearchForDefinition commands.
     """
     @staticmethod
-    def run(symbol, region, sym_line, mbrParts, view, tags_file):
+    def run(symbol, region, sym_line, mbrParts, view, tags_file,
+            partial=False):
         # print('JumpToDefinition')
 
-        tags = {}
-        for tags_file in get_alternate_tags_paths(view, tags_file):
-            with TagFile(tags_file, SYMBOL) as tagfile:
-                tags = tagfile.get_tags_dict(
-                    symbol, filters=compile_filters(view))
-            if tags:
-                break
+        ignore_case = setting('ignore_case', False)
+        filters = compile_filters(view)
+        tags_files = get_alternate_tags_paths(view, tags_file)
+
+        def search(path):
+            return search_tags_file(path, symbol, filters, ignore_case,
+                                    partial)
+
+        if setting('search_all_tag_files', True):
+            timeout = setting('search_timeout', 0)
+            results = [result for _, result in ctags.search_tag_files(
+                tags_files, search, setting('search_jobs', 4),
+                timeout / 1000.0 if timeout else None)]
+        else:  # stop at the first tag file with results
+            results = []
+            for path in tags_files:
+                result = search(path)
+                if result:
+                    results.append(result)
+                    break
+
+        tags = merge_tags(results)
 
         if not tags:
             return status_message('Can\'t find "%s"' % symbol)
@@ -632,7 +739,10 @@ class JumpToDefinition:
 
         @prepare_for_quickpanel()
         def sorted_tags():
-            taglist = tags.get(symbol, [])
+            if not (partial or ignore_case):
+                taglist = tags.get(symbol, [])
+            else:
+                taglist = [tag for key in sorted(tags) for tag in tags[key]]
             p_tags = rankmgr.sort_tags(taglist)
             if not p_tags:
                 status_message('Can\'t find "%s"' % symbol)
@@ -714,7 +824,8 @@ class SearchForDefinition(sublime_plugin.WindowCommand):
             status_message('Can\'t find any relevant tags file')
             return
 
-        result = JumpToDefinition.run(symbol, None, "", [], view, tags_file)
+        result = JumpToDefinition.run(symbol, None, "", [], view, tags_file,
+                                      partial=True)
         show_tag_panel(view, result, True)
 
     def on_change(self, text):
@@ -725,7 +836,33 @@ class SearchForDefinition(sublime_plugin.WindowCommand):
 
 # Show Symbol commands
 
-tags_cache = defaultdict(dict)
+tags_cache = TagsCache()
+
+parsed_tag_cache = None
+
+
+def get_parsed_tag_cache():
+    """
+    Get the on-disk cache of parsed tags, creating it on first use.
+
+    :returns: ``ParsedTagCache``, or None if disabled
+    """
+    global parsed_tag_cache
+
+    size = setting('parsed_tags_cache_size', 256)
+    if not size:
+        return None
+
+    if parsed_tag_cache is None:
+        if hasattr(sublime, 'cache_path'):  # ST3
+            directory = os.path.join(sublime.cache_path(), 'CTags')
+        else:
+            directory = os.path.join(tempfile.gettempdir(), 'CTags')
+        parsed_tag_cache = ParsedTagCache(directory)
+
+    parsed_tag_cache.max_size = size * 1024 * 1024
+
+    return parsed_tag_cache
 
 
 class ShowSymbols(sublime_plugin.TextCommand):
@@ -761,25 +898,38 @@ class ShowSymbols(sublime_plugin.TextCommand):
         base_path = get_common_ancestor_folder(
             view.file_name(), view.window().folders())
 
+        filters = compile_filters(view)
+
         def get_tags():
-            with TagFile(tags_file, FILENAME) as tagfile:
+            # symbols are cached, so keep them compact
+            with tag_files.open(tags_file, FILENAME) as tagfile:
                 if lang:
                     return tagfile.get_tags_dict_by_suffix(
-                        suffix, filters=compile_filters(view))
+                        suffix, filters=filters, compact=True)
                 elif multi:
                     return tagfile.get_tags_dict(
-                        filters=compile_filters(view))
+                        filters=filters, compact=True)
                 else:
                     return tagfile.get_tags_dict(
-                        *files, filters=compile_filters(view))
+                        *files, filters=filters, compact=True)
 
-        if key in tags_cache[base_path]:
+        tags_cache.max_size = setting('symbols_cache_size', 64) * 1024 * 1024
+        cache_key = (base_path, args.get('type'), key)
+        tags = tags_cache.get(cache_key, tags_file)
+
+        if tags is not None:
             print('loading symbols from cache')
-            tags = tags_cache[base_path][key]
         else:
-            print('loading symbols from file')
-            tags = get_tags()
-            tags_cache[base_path][key] = tags
+            cache = get_parsed_tag_cache()
+            if cache is None:
+                print('loading symbols from file')
+                tags = get_tags()
+            else:
+                print('loading symbols from file or disk cache')
+                query = (args.get('type'), key,
+                         [sorted(filt.items()) for filt in filters])
+                tags = cache.get_tags(tags_file, query, get_tags)
+            tags_cache.put(cache_key, tags_file, tags)
 
         print(('loaded [%d] symbols' % len(tags)))
 
@@ -802,6 +952,32 @@ class ShowSymbols(sublime_plugin.TextCommand):
 
         return sorted_tags
 
+
+class ShowCacheStats(sublime_plugin.WindowCommand):
+    """
+    Provider for the ``show_cache_stats`` command.
+
+    Command prints the hit and miss counts and memory usage of the symbols
+    cache, for debugging.
+    """
+
+    def run(self):
+        stats = tags_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        message = ('CTags symbols cache: {entries} entries, {size:.1f} of '
+                   '{max_size:.1f}MB, {hits} hits, {misses} misses '
+                   '({stale} stale), {evictions} evicted'.format(
+                       entries=stats['entries'],
+                       size=stats['size'] / (1024.0 * 1024.0),
+                       max_size=stats['max_size'] / (1024.0 * 1024.0),
+                       hits=stats['hits'], misses=stats['misses'],
+                       stale=stats['stale'], evictions=stats['evictions']))
+
+        print(message)
+        if lookups:
+            print('hit rate: {0:.0%}'.format(float(stats['hits']) / lookups))
+        status_message(message)
+
 # Rebuild CTags commands
 
 
@@ -821,15 +997,21 @@ class RebuildTags(sublime_plugin.TextCommand):
         recursive = setting('recursive')
         opts = setting('opts')
         tag_file = setting('tag_file')
+        jobs = setting('build_jobs', 1)
+        stream = setting('build_stream', False)
+        incremental = setting('build_incremental', False)
+        run_size = (setting('build_sort_memory', 0) or 0) << 20
 
         if 'dirs' in args and args['dirs']:
             paths.extend(args['dirs'])
-            self.build_ctags(paths, command, tag_file, recursive, opts)
+            self.build_ctags(paths, command, tag_file, recursive, opts, jobs,
+                             stream, incremental, run_size)
         elif 'files' in args and args['files']:
             paths.extend(args['files'])
             # build ctags and ignore recursive flag - we clearly only want
             # to build them for a file
-            self.build_ctags(paths, command, tag_file, False, opts)
+            self.build_ctags(paths, command, tag_file, False, opts,
+                             stream=stream, run_size=run_size)
         elif (self.view.file_name() is None and
                 len(self.view.window().folders()) <= 0):
             status_message('Cannot build CTags: No file or folder open.')
@@ -838,7 +1020,8 @@ class RebuildTags(sublime_plugin.TextCommand):
             show_build_panel(self.view)
 
     @threaded(msg='Already running CTags!')
-    def build_ctags(self, paths, command, tag_file, recursive, opts):
+    def build_ctags(self, paths, command, tag_file, recursive, opts, jobs=1,
+                    stream=False, incremental=False, run_size=None):
         """
         Build tags for the open file or folder(s).
 
@@ -849,6 +1032,14 @@ class RebuildTags(sublime_plugin.TextCommand):
             given by path. This overrides filename specified by ``path``
         :param opts: list of additional parameters to pass to the ``ctags``
             executable
+        :param jobs: number of ``ctags`` processes to run in parallel for
+            each folder, or 0 for one per CPU
+        :param stream: write the tag file and its indexes from the output of
+            ``ctags`` in a single pass
+        :param incremental: only tag files changed since the last build of
+            each folder; ``'hash'`` to compare file contents too
+        :param run_size: if given, the memory in bytes to sort the tag file
+            by filename with. See ``ctags.resort_ctags``
 
         :returns: None
         """
@@ -863,15 +1054,25 @@ class RebuildTags(sublime_plugin.TextCommand):
             print(('Finished building %s' % tag_file))
             in_main(lambda: status_message('Finished building {0}'
                                            .format(tag_file)))()
-            in_main(lambda: tags_cache[os.path.dirname(tag_file)].clear())()
+            in_main(lambda: tags_cache.invalidate(
+                tag_file + '_sorted_by_file'))()
+            in_main(lambda: tag_files.invalidate(tag_file))()
+            in_main(lambda: tag_files.invalidate(
+                tag_file + '_sorted_by_file'))()
 
         for path in paths:
             tags_building(path)
+            # mapped tag files can't be replaced on Windows
+            tag_files.invalidate()
 
             try:
                 result = ctags.build_ctags(path=path, tag_file=tag_file,
                                            recursive=recursive, opts=opts,
-                                           cmd=command)
+                                           cmd=command, jobs=jobs,
+                                           stream=stream,
+                                           run_size=run_size or None,
+                                           incremental=bool(incremental),
+                                           manifest_hash=incremental == 'hash')
             except IOError as e:
                 error_message(e.strerror)
                 return
@@ -892,19 +1093,436 @@ class RebuildTags(sublime_plugin.TextCommand):
 
             tags_built(result)
 
-        GetAllCTagsList.ctags_list = []  # clear the cached ctags list
-
 # Autocomplete commands
 
 
-class GetAllCTagsList():
+class ViewWords(object):
+    """
+    Index the distinct words of a view, for completions.
+    """
+
+    def __init__(self):
+        """
+        Initialise object.
+
+        :returns: None
+        """
+        self.change_count = None
+        self.size = 0
+        self.rows = 0
+        self.pending = []  # rows of words left for later
+        self.words = []  # sorted ``(lowercased word, word)`` tuples
+        self.stale = False  # may have words since removed from the view
+
+    def scan(self, view):
+        """
+        Index all the words of a view.
+
+        :param view: view to index
+
+        :returns: None
+        """
+        text = view.substr(sublime.Region(0, view.size()))
+        self.words = sorted(set((word.lower(), word)
+                                for word in WORD_RE.findall(text)))
+        self.change_count = view.change_count()
+        self.size = view.size()
+        self.rows = view.rowcol(self.size)[0]
+        self.pending = []
+        self.stale = False
+
+    def add(self, view):
+        """
+        Index the words of the lines of a view being edited.
+
+        These are the lines at each cursor, the line inserted before each
+        cursor, if a line was inserted, and the lines of the words left for
+        later at the last update, such as the line the cursor just left. The
+        word at each cursor is being typed, so is left for later in turn.
+
+        :param view: modified view
+
+        :returns: True if indexed, or False if the change may span more
+            lines, so the view must be indexed again
+        """
+        size = view.size()
+        rows = view.rowcol(size)[0]
+        added = rows - self.rows
+
+        if abs(added) > 1:  # lines pasted or deleted
+            return False
+
+        lines = set()
+        for row in self.pending:  # moved down or up if a line was added
+            lines.update((row, row + added))
+        cursors = [region.b for region in view.sel()]
+        for cursor in cursors:
+            row = view.rowcol(cursor)[0]
+            lines.update(range(row - max(added, 0), row + 1))
+
+        lines = [view.line(view.text_point(row, 0))
+                 for row in sorted(lines) if 0 <= row <= rows]
+
+        # text inserted elsewhere, as when replacing a multi-line selection
+        if size - self.size > sum(line.end() - line.begin() + 1
+                                       for line in lines):
+            return False
+
+        for line in lines:
+            self.add_line(view, line, cursors)
+
+        self.change_count = view.change_count()
+        self.size = size
+        self.rows = rows
+        self.pending = sorted(set(view.rowcol(cursor)[0]
+                                  for cursor in cursors))
+        self.stale = True
+
+        return True
+
+    def add_line(self, view, line, cursors=()):
+        """
+        Index the words of a line of a view.
+
+        :param view: view of the line
+        :param line: region of the line
+        :param cursors: points of the words to leave for later
+
+        :returns: None
+        """
+        for match in WORD_RE.finditer(view.substr(line)):
+            if any(line.a + match.start() <= cursor <= line.a + match.end()
+                   for cursor in cursors):
+                continue
+            word = match.group()
+            entry = (word.lower(), word)
+            index = bisect.bisect_left(self.words, entry)
+            if index == len(self.words) or self.words[index] != entry:
+                self.words.insert(index, entry)
+
+    def flush(self, view):
+        """
+        Index the words left for later, once the view is no longer typed in.
+
+        :param view: view to index
+
+        :returns: None
+        """
+        if not self.pending or self.change_count != view.change_count():
+            return  # nothing left, or indexed again when next used
+
+        for row in self.pending:
+            if 0 <= row <= self.rows:
+                self.add_line(view, view.line(view.text_point(row, 0)))
+
+        self.pending = []
+
+    def complete(self, prefix):
+        """
+        Get the words starting with a prefix, ignoring case.
+
+        :param prefix: lowercased prefix
+
+        :returns: list of words
+        """
+        start = bisect.bisect_left(self.words, (prefix, ))
+        end = bisect.bisect_left(self.words, (prefix + WORD_END, ), start)
+        return [word for _, word in self.words[start:end]]
+
+
+class BufferCompletions(object):
+    """
+    Cache the words of open views, for completions.
+
+    Each view is indexed once, then kept up to date from modification
+    events, so completing only queries the indexes. A view whose change
+    count does not match its index, as when a change was missed, or which
+    was changed by more than a line at a time, is indexed again. Words
+    deleted from a view may still be completed until it is next activated
+    or saved. The words being typed in a view are indexed once another view
+    is used.
+    """
+
+    def __init__(self):
+        """
+        Initialise object.
+
+        :returns: None
+        """
+        self.views = {}
+        self.idle = set()  # views no longer typed in, to flush when used
+
+    def get(self, view):
+        """
+        Get the index of a view, indexing it if it has changed.
+
+        :param view: view to index
+
+        :returns: ``ViewWords`` for the view
+        """
+        words = self.views.get(view.id())
+
+        if words is None:
+            words = self.views[view.id()] = ViewWords()
+        if words.change_count != view.change_count():
+            words.scan(view)
+        elif view.id() in self.idle:
+            words.flush(view)
+        self.idle.discard(view.id())
+
+        return words
+
+    def modified(self, view):
+        """
+        Update the index of a view after a change.
+
+        :param view: modified view
+
+        :returns: None
+        """
+        words = self.views.get(view.id())
+
+        # a single change since indexed, so only the edited lines differ
+        if (words is not None and words.change_count is not None and
+                view.change_count() == words.change_count + 1):
+            if not words.add(view):
+                words.scan(view)
+
+    def refresh(self, view):
+        """
+        Index a view again if it may have words since removed.
+
+        Other views are no longer typed in, so their words left for later
+        are indexed too.
+
+        :param view: view to index
+
+        :returns: None
+        """
+        words = self.views.get(view.id())
+
+        if words is not None and words.stale:
+            words.scan(view)
+
+        self.idle.update(self.views)
+        self.idle.discard(view.id())
+
+    def flush(self, view):
+        """
+        Index the words left for later in a view no longer typed in.
+
+        :param view: view to index
+
+        :returns: None
+        """
+        self.idle.discard(view.id())
+        words = self.views.get(view.id())
+
+        if words is not None:
+            words.flush(view)
+
+    def discard(self, view):
+        """
+        Forget the index of a closed view.
+
+        :param view: closed view
+
+        :returns: None
+        """
+        self.views.pop(view.id(), None)
+        self.idle.discard(view.id())
+
+    def complete(self, views, prefix, current=None):
+        """
+        Get the words of some views starting with a prefix, ignoring case.
+
+        :param views: views to search
+        :param prefix: lowercased prefix
+        :param current: view being typed in, if any. The words left for
+            later in the other views are indexed
+
+        :returns: set of words
+        """
+        results = set()
+
+        for view in views:
+            words = self.get(view)
+            if current is not None and view.id() != current.id():
+                words.flush(view)
+            results.update(words.complete(prefix))
+
+        return results
+
+buffer_completions = BufferCompletions()
+
+
+def build_completion_index(tags_path):
+    """
+    Build the completion index of a tag file in the background.
+
+    Each version of a tag file is indexed at most once, so a failed build
+    is not retried until the tag file changes.
+
+    :param tags_path: path to a tag file
+
+    :returns: the thread building the index, or None if not building it
+    """
+    try:
+        stat = os.stat(tags_path)
+    except OSError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    with completion_index_lock:
+        if completion_index_builds.get(tags_path) == stamp:
+            return None  # built, building or failed
+        completion_index_builds[tags_path] = stamp
+
+    def run():
+        try:
+            # mapped indexes can't be replaced on Windows
+            tag_files.invalidate(tags_path)
+            ctags.build_completion_index(tags_path)
+        except (IOError, OSError) as e:
+            print('Failed to index {0} for completions: {1}'.format(
+                tags_path, e))
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+completion_index_builds = {}  # tag file: stamp of the tag file indexed
+completion_index_lock = threading.Lock()
+
+
+def search_completions(tags_path, prefix):
+    """
+    Get the symbols of a tag file completing a prefix, ignoring case.
+
+    These are the symbols starting with the prefix, then those with an
+    abbreviation starting with it, such as ``getDisplayName`` for ``gDN``.
+    Tag files without a completion index are indexed in the background,
+    and complete nothing until then.
+
+    :param tags_path: path to a tag file
+    :param prefix: lowercased prefix
+
+    :returns: list of symbols
+    """
+    return merge_completions(*search_completion_matches(tags_path, prefix))
+
+
+def search_completion_matches(tags_path, prefix):
+    """
+    Get the symbols of a tag file matching a prefix, by name and by
+    abbreviation, ignoring case.
+
+    :param tags_path: path to a tag file
+    :param prefix: lowercased prefix
+
+    :returns: tuple of the list of ``(lowercased symbol, symbol)`` tuples of
+        the symbols starting with the prefix, and of the list of
+        ``(abbreviation, symbol)`` tuples of those with an abbreviation
+        starting with it, each sorted, both empty until the tag file is
+        indexed
+    """
+    # the pool reopens the tag file once it has been indexed
+    with tag_files.open(tags_path, SYMBOL) as tagfile:
+        if (tagfile.completion_index is not None and
+                tagfile.abbreviation_index is not None):
+            return (tagfile.completion_index.complete_keys(prefix),
+                    tagfile.abbreviation_index.complete_keys(prefix))
+
+    # built by an older version, so left to the buffer completions until
+    # indexed rather than scanned on every keystroke
+    build_completion_index(tags_path)
+    return [], []
+
+
+def merge_completions(names, abbreviations):
+    """
+    Merge the symbols matching a prefix by name and by abbreviation.
+
+    :param names: ``(lowercased symbol, symbol)`` tuples of the symbols
+        starting with the prefix
+    :param abbreviations: ``(abbreviation, symbol)`` tuples of the symbols
+        with an abbreviation starting with the prefix
+
+    :returns: list of symbols, those matched by name first
+    """
+    symbols = [symbol for _, symbol in names]
+    found = set(symbols)
+    symbols.extend(symbol for _, symbol in abbreviations
+                   if symbol not in found)
+    return symbols
+
+
+class CompletionSession(object):
     """
-    Cache all the ctags list.
+    Cache the symbols completing the last prefix typed.
+
+    As a word is typed, each prefix extends the last, so its symbols are
+    found by narrowing the last symbols rather than searching the tag file
+    again. The symbols matched by name are kept sorted by name lowercased,
+    and those matched by abbreviation sorted by abbreviation, as the tag
+    file indexes return them, so narrowing bisects each list for the new
+    prefix. The cache is reset by any other prefix, or if the tag file or
+    its indexes change.
     """
-    ctags_list = []
 
-    def __init__(self, list):
-        self.ctags_list = list
+    def __init__(self):
+        """
+        Initialise object.
+
+        :returns: None
+        """
+        self.stamp = None
+        self.prefix = None
+        self.names = []  # sorted ``(lowercased symbol, symbol)`` tuples
+        self.abbreviations = []  # sorted ``(abbreviation, symbol)`` tuples
+
+    def complete(self, tags_path, prefix):
+        """
+        Get the symbols of a tag file completing a prefix, ignoring case.
+
+        :param tags_path: path to a tag file
+        :param prefix: lowercased prefix
+
+        :returns: list of symbols. See ``search_completions``
+        """
+        stamp = (tags_path, TagFilePool.stamp(tags_path, SYMBOL))
+
+        if (stamp == self.stamp and self.prefix is not None and
+                prefix.startswith(self.prefix)):
+            names = narrow_completions(self.names, prefix)
+            abbreviations = narrow_completions(self.abbreviations, prefix)
+        else:
+            # stamped before searching, so indexing meanwhile searches again
+            names, abbreviations = search_completion_matches(tags_path,
+                                                             prefix)
+
+        self.stamp, self.prefix = stamp, prefix
+        self.names, self.abbreviations = names, abbreviations
+
+        return merge_completions(names, abbreviations)
+
+
+def narrow_completions(entries, prefix):
+    """
+    Get the entries with a key starting with a prefix.
+
+    :param entries: sorted list of ``(key, symbol)`` tuples
+    :param prefix: lowercased prefix
+
+    :returns: list of the matching entries, in order
+    """
+    start = bisect.bisect_left(entries, (prefix, ))
+    end = bisect.bisect_left(entries, (prefix + WORD_END, ), start)
+    return entries[start:end]
+
+completion_session = CompletionSession()
 
 
 class CTagsAutoComplete(sublime_plugin.EventListener):
@@ -914,44 +1532,35 @@ class CTagsAutoComplete(sublime_plugin.EventListener):
             prefix = prefix.strip().lower()
             tags_path = view.window().folders()[0] + '/' + setting('tag_file')
 
-            sub_results = [v.extract_completions(prefix)
-                           for v in sublime.active_window().views()]
-            sub_results = [(item, item) for sublist in sub_results
-                           for item in sublist]  # flatten
+            # check if a project is open and the tags file exists
+            if not (view.window().folders() and os.path.exists(tags_path)):
+                return []
 
-            if GetAllCTagsList.ctags_list:
-                results = [sublist for sublist in GetAllCTagsList.ctags_list
-                           if sublist[0].lower().startswith(prefix)]
-                results = sorted(set(results).union(set(sub_results)))
+            sub_results = buffer_completions.complete(
+                sublime.active_window().views(), prefix, view)
+            sub_results = [(item, item) for item in sub_results]
 
-                return results
-            else:
-                tags = []
+            symbols = completion_session.complete(tags_path, prefix)
 
-                # check if a project is open and the tags file exists
-                if not (view.window().folders() and os.path.exists(tags_path)):
-                    return tags
+            results = [(symbol, symbol) for symbol in symbols]
+            results = sorted(set(results).union(set(sub_results)))
 
-                if sublime.platform() == "windows":
-                    prefix = ""
-                else:
-                    prefix = "\\"
+            return results
 
-                f = os.popen(
-                    "awk \"{ print " + prefix + "$1 }\" \"" + tags_path + "\"")
+    def on_modified(self, view):
+        buffer_completions.modified(view)
 
-                for i in f.readlines():
-                    tags.append([i.strip()])
+    def on_activated(self, view):
+        buffer_completions.refresh(view)
 
-                tags = [(item, item) for sublist in tags
-                        for item in sublist]  # flatten
-                tags = sorted(set(tags))  # make unique
-                GetAllCTagsList.ctags_list = tags
-                results = [sublist for sublist in GetAllCTagsList.ctags_list
-                           if sublist[0].lower().startswith(prefix)]
-                results = sorted(set(results).union(set(sub_results)))
+    def on_deactivated(self, view):
+        buffer_completions.flush(view)
 
-                return results
+    def on_post_save(self, view):
+        buffer_completions.refresh(view)
+
+    def on_close(self, view):
+        buffer_completions.discard(view)
 
 # Test CTags commands
 
@@ -975,8 +1584,15 @@ class TestCtags(sublime_plugin.TextCommand):
         tag_file = find_tags_relative_to(
             view.file_name(), setting('tag_file'))
 
-        with codecs.open(tag_file, encoding='utf-8') as tf:
-            tags = parse_tag_lines(tf, tag_class=TagElements)
+        def parse():
+            with codecs.open(tag_file, encoding='utf-8') as tf:
+                return parse_tag_lines(tf, tag_class=TagElements)
+
+        cache = get_parsed_tag_cache()
+        if cache is None:
+            tags = parse()
+        else:
+            tags = cache.get_tags(tag_file, 'test', parse)
 
         print('Starting Test')
 
@@ -201,7 +201,7 @@ class RankMgr:
         # Type definition Rank
         rank += self.get_type_rank(tag)
 
-        rel_path = tag.tag_path[0]
+        rel_path = tag.filename  # same as tag.tag_path[0]
         # Same file and this.method() ranking
         rank += self.get_samefile_rank(rel_path, mbrParts)
 
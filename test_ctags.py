@@ -7,7 +7,9 @@ Unit tests for 'ctags.py'.
 import os
 import sys
 import tempfile
+import time
 import codecs
+import shutil
 from subprocess import CalledProcessError
 
 if sys.version_info < (2, 7):
@@ -150,6 +152,26 @@ class CTagsTest(unittest.TestCase):
 
         return path
 
+    def build_tag_file(self, lines):
+        """
+        Build a tag file directly from a list of tag lines.
+
+        :param lines: list of tag lines, without line endings
+
+        :returns: Path to the tag file
+        """
+        path = ''
+
+        with tempfile.NamedTemporaryFile(delete=False) as temp:
+            try:
+                path = temp.name  # store name for later use
+                temp.writelines(
+                    [(line + '\n').encode('utf-8') for line in lines])
+            finally:
+                temp.close()
+
+        return path
+
     #
     # Test functions
     #
@@ -266,6 +288,408 @@ class CTagsTest(unittest.TestCase):
                 os.remove(path)  # clean up
                 os.remove(tag_file)
 
+    def test_build_ctags__parallel(self):
+        """
+        Test parallel execution of ctags gives the same tags as one process.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        paths = [self.build_python_file__extended() for _ in range(3)]
+        paths.append(self.build_java_file())
+
+        try:
+            for path in paths:
+                shutil.move(path, tmp_dir)
+
+            tag_file = ctags.build_ctags(path=tmp_dir, recursive=True)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                expected = output.readlines()
+
+            tag_file = ctags.build_ctags(
+                path=tmp_dir, recursive=True, jobs=2)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                result = output.readlines()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        def tags(lines):
+            return [line for line in lines if not line.startswith('!_')]
+
+        self.assertEqual(tags(result), tags(expected))
+        self.assertTrue(len(tags(result)) > 4)
+        self.assertEqual(len(result) - len(tags(result)),
+                         len(expected) - len(tags(expected)))
+
+    def test_build_ctags__parallel_exclude(self):
+        """
+        Test parallel execution of ctags skips excluded files and the files
+        of an earlier build.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        vendor_dir = os.path.join(tmp_dir, 'vendor')
+        paths = [self.build_python_file__extended() for _ in range(2)]
+        listed = []
+
+        def build_ctags_parallel(cmd, cwd, files, *args, **kwargs):
+            listed.extend(files)
+            return original(cmd, cwd, files, *args, **kwargs)
+
+        original = ctags.build_ctags_parallel
+        ctags.build_ctags_parallel = build_ctags_parallel
+
+        try:
+            os.mkdir(vendor_dir)
+            shutil.move(paths[0], tmp_dir)
+            shutil.move(paths[1], vendor_dir)
+
+            opts = ['--exclude=vendor']
+            tag_file = ctags.build_ctags(path=tmp_dir, recursive=True,
+                                         opts=opts)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                expected = output.readlines()
+
+            tag_file = ctags.build_ctags(path=tmp_dir, recursive=True,
+                                         opts=opts, jobs=2)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                result = output.readlines()
+        finally:
+            ctags.build_ctags_parallel = original
+            shutil.rmtree(tmp_dir)
+
+        def tags(lines):
+            return [line for line in lines if not line.startswith('!_')]
+
+        self.assertEqual(listed, [os.path.basename(paths[0])])
+        self.assertEqual(tags(result), tags(expected))
+        self.assertFalse(any('vendor' in line for line in result))
+
+    def test_build_ctags__parallel_files(self):
+        """
+        Test parallel execution of ctags names files as one process does
+        when not recursive.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        paths = [self.build_python_file__extended() for _ in range(3)]
+        paths.append(self.build_java_file())
+
+        def build(jobs):
+            tag_file = ctags.build_ctags(path=tmp_dir, jobs=jobs)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                lines = [line for line in output if not line.startswith('!_')]
+            for path in ctags.get_tag_file_paths(tag_file):
+                os.remove(path)
+            return lines
+
+        try:
+            for path in paths:
+                shutil.move(path, tmp_dir)
+            shutil.copy(self.build_python_file(),
+                        os.path.join(tmp_dir, '.hidden.py'))
+
+            expected = build(1)
+            self.assertTrue(len(expected) > 4)
+            for jobs in (2, 3):
+                self.assertEqual(build(jobs), expected)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_build_ctags__stream(self):
+        """
+        Test streaming ctags output writes the same files and indexes.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        paths = [self.build_python_file__extended() for _ in range(3)]
+        paths.append(self.build_java_file())
+
+        def read(tag_file):
+            result = []
+            for path in (tag_file, tag_file + '_sorted_by_file'):
+                with open(path, 'rb') as file_:
+                    lines = file_.readlines()
+                index = ctags.LineIndex.load(path, os.path.getsize(path))
+                self.assertIsNotNone(index)
+                self.assertEqual(len(index), len(lines))
+                index.close()
+                result.append(lines)
+            for path in (
+                    ctags.suffix_index_path(tag_file, ctags.SYMBOL),
+                    ctags.suffix_index_path(tag_file + '_sorted_by_file',
+                                            ctags.FILENAME)):
+                with open(path, 'rb') as f:
+                    result.append(f.read())
+            for suffix in (ctags.TRIGRAM_INDEX_SUFFIX,
+                           ctags.COMPLETION_INDEX_SUFFIX,
+                           ctags.ABBREVIATION_INDEX_SUFFIX,
+                           ctags.BLOOM_FILTER_SUFFIX):
+                with open(tag_file + suffix, 'rb') as f:
+                    result.append(f.read())
+            return result
+
+        try:
+            for path in paths:
+                shutil.move(path, tmp_dir)
+
+            expected = read(ctags.build_ctags(path=tmp_dir, recursive=True))
+
+            for jobs in (1, 2):
+                for run_size in (None, 64):
+                    result = read(ctags.build_ctags(
+                        path=tmp_dir, recursive=True, jobs=jobs,
+                        run_size=run_size, stream=True))
+                    self.assertEqual(result, expected)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_build_ctags__incremental(self):
+        """
+        Test incremental builds only tag changed files, giving the same tags
+        as a full build.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        paths = [self.build_python_file__extended() for _ in range(3)]
+        paths.append(self.build_java_file())
+
+        def tags(tag_file):
+            with open(tag_file, 'rb') as file_:
+                return [line for line in file_ if not line.startswith(b'!_')]
+
+        try:
+            for path in paths:
+                shutil.move(path, tmp_dir)
+            names = sorted(name for name in os.listdir(tmp_dir)
+                           if name.endswith('.py'))
+            # named like the tag file, but a source file all the same
+            shutil.copy(self.build_python_file(),
+                        os.path.join(tmp_dir, 'tags.py'))
+            tag_file = os.path.join(tmp_dir, 'tags')
+
+            self.assertIsNone(ctags.build_ctags_incremental(
+                ['ctags'], tmp_dir, tag_file))
+            self.assertTrue(any(line.split(b'\t')[ctags.FILENAME] ==
+                                b'tags.py' for line in tags(tag_file)))
+            self.assertEqual(ctags.build_ctags_incremental(
+                ['ctags'], tmp_dir, tag_file), ([], []))
+
+            os.remove(os.path.join(tmp_dir, names[0]))
+            with open(os.path.join(tmp_dir, names[1]), 'a') as file_:
+                file_.write('\ndef added_function():\n    pass\n')
+            shutil.copy(self.build_python_file(),
+                        os.path.join(tmp_dir, 'new.py'))
+
+            changed, removed = ctags.build_ctags_incremental(
+                ['ctags'], tmp_dir, tag_file)
+            self.assertEqual(changed, sorted([names[1], 'new.py']))
+            self.assertEqual(removed, [names[0]])
+            result = tags(tag_file)
+            sorted_by_file = tags(tag_file + '_sorted_by_file')
+
+            os.remove(tag_file + ctags.MANIFEST_SUFFIX)
+            self.assertIsNone(ctags.build_ctags_incremental(
+                ['ctags'], tmp_dir, tag_file))
+            self.assertEqual(result, tags(tag_file))
+            self.assertEqual(sorted_by_file,
+                             tags(tag_file + '_sorted_by_file'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertTrue(any(b'added_function' in line for line in result))
+
+    def test_find_source_files(self):
+        """
+        Test ``find_source_files`` skips excluded files and built files.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        tag_file = os.path.join(tmp_dir, 'tags')
+        names = ['a.py', os.path.join('lib', 'b.py'),
+                 os.path.join('lib', 'c.min.js'),
+                 os.path.join('node_modules', 'd.js'),
+                 os.path.join('.git', 'e.py')]
+
+        try:
+            for name in names + ctags.get_tag_file_paths(tag_file) + [
+                    tag_file + ctags.MANIFEST_SUFFIX]:
+                path = os.path.join(tmp_dir, name)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                open(path, 'w').close()
+            with open(os.path.join(tmp_dir, 'excluded'), 'w') as file_:
+                file_.write('*.min.js\n')
+
+            opts = ['--exclude=node_modules', '--exclude=@excluded']
+            result = ctags.find_source_files(tmp_dir, True, opts, tag_file)
+            files = ctags.find_source_files(tmp_dir, False, opts, tag_file)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(result, ['a.py', 'excluded', names[1]])
+        self.assertEqual(files, ['a.py', 'excluded'])
+    def test_shard_files(self):
+        """
+        Test ``shard_files`` balances shards by file size.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        sizes = {'a': 50, 'b': 10, 'c': 40, 'd': 30, 'e': 20}
+
+        try:
+            for name, size in sizes.items():
+                with open(os.path.join(tmp_dir, name), 'wb') as file_:
+                    file_.write(b'x' * size)
+
+            shards = ctags.shard_files(sorted(sizes), 2, tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(sorted(sum(shards, [])), sorted(sizes))
+        self.assertEqual(
+            sorted(sum(sizes[name] for name in shard) for shard in shards),
+            [70, 80])
+        for shard in shards:
+            self.assertEqual(shard, sorted(shard))
+
+    def test_merge_tag_files(self):
+        """
+        Test ``merge_tag_files`` merges sorted tags and keeps one header.
+        """
+        header = ['!_TAG_FILE_FORMAT\t2\t//', '!_TAG_FILE_SORTED\t1\t//']
+        shards = [
+            header + ['a\ta.py\t1;"\tf', 'a\ta.py\t1;"\tf\tclass:A',
+                      'c\tc.py\t3;"\tf'],
+            header + ['B\tb.py\t2;"\tf'],
+            header]
+        tag_files = [self.build_tag_file(shard) for shard in shards]
+        tag_file = self.build_tag_file([])
+
+        try:
+            ctags.merge_tag_files(tag_files, tag_file)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                result = output.read().splitlines()
+
+            ctags.merge_tag_files(tag_files, tag_file, ctags.SORT_FOLDCASE)
+            with codecs.open(tag_file, encoding='utf-8') as output:
+                folded = output.read().splitlines()
+        finally:
+            for path in tag_files + [tag_file]:
+                os.remove(path)
+
+        self.assertEqual(result, header + sorted(
+            line for shard in shards for line in shard if line not in header))
+        self.assertEqual(folded, header + [
+            'a\ta.py\t1;"\tf', 'a\ta.py\t1;"\tf\tclass:A',
+            'B\tb.py\t2;"\tf', 'c\tc.py\t3;"\tf'])
+
+    # write_tag_files
+
+    def test_write_tag_files__headers(self):
+        """
+        Test ``write_tag_files`` adds pseudo-tags missing from ctags output,
+        and writes the same indexes with bounded memory.
+        """
+        lines = sorted('symbol_{0}\tmodule_{1}.py\t{0};"\tf\n'.format(
+            index, (index * 7) % 13).encode('utf-8') for index in range(200))
+        tmp_dir = tempfile.mkdtemp()
+        tag_file = os.path.join(tmp_dir, 'tags')
+        results = []
+
+        try:
+            for run_size in (None, 1000):
+                ctags.write_tag_files(lines, tag_file, run_size)
+                result = []
+                for path in sorted(os.listdir(tmp_dir)):
+                    with open(os.path.join(tmp_dir, path), 'rb') as file_:
+                        result.append((path, file_.read()))
+                results.append(result)
+
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.sort_mode, ctags.SORT_YES)
+                self.assertEqual(tagfile.format, 2)
+
+            ctags.write_tag_files(lines[:1], tag_file,
+                                  sort_mode=ctags.SORT_FOLDCASE)
+            with open(tag_file, 'rb') as file_:
+                folded = file_.readlines()
+            self.assertFalse(os.path.exists(
+                tag_file + ctags.FOLD_INDEX_SUFFIX))
+
+            ctags.write_tag_files(folded, tag_file)  # headers kept
+            with open(tag_file, 'rb') as file_:
+                self.assertEqual(file_.readlines(), folded)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(results[1], results[0])
+        self.assertIn(ctags.FOLD_INDEX_SUFFIX,
+                      [path[len('tags'):] for path, _ in results[0]])
+        self.assertEqual(folded[1:], [
+            b'!_TAG_FILE_SORTED\t2\t/0=unsorted, 1=sorted, 2=foldcase/\n',
+            lines[0]])
+
+    # resort_ctags
+
+    def test_resort_ctags__external_matches_in_memory(self):
+        """
+        Test ``resort_ctags`` gives the same output with bounded memory.
+        """
+        lines = ['!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted/']
+        for index in range(200):
+            lines.append('symbol_{0}\t{1}module_{2}.py\t{3};"\tf'.format(
+                index, '.\\' if index % 3 else '', (index * 7) % 13, index))
+        lines.append('caf\u00e9\tb\u00e4r.py\t1;"\tv')
+        tag_file = self.build_tag_file(lines)
+        sorted_file = tag_file + '_sorted_by_file'
+
+        try:
+            ctags.resort_ctags(tag_file)
+            with open(sorted_file, 'rb') as file_:
+                expected = file_.read()
+
+            stats = ctags.resort_ctags(tag_file, run_size=500)
+            with open(sorted_file, 'rb') as file_:
+                result = file_.read()
+        finally:
+            os.remove(tag_file)
+            os.remove(sorted_file)
+
+        self.assertEqual(result, expected)
+        self.assertEqual(stats['lines'], len(lines))
+        self.assertTrue(stats['runs'] > 1)
+
+    def test_sort_lines_by_file__single_run_in_memory(self):
+        """
+        Test ``sort_lines_by_file`` writes no run file when lines fit in one.
+        """
+        lines = ['b\tb.py\t1;"\tf', 'a\ta.py\t2;"\tf', 'c\ta.py\t3;"\tf']
+        stats = {}
+        runs = []
+
+        def write_sort_run(run):
+            runs.append(run)
+            return original(run)
+
+        original = ctags.write_sort_run
+        ctags.write_sort_run = write_sort_run
+        try:
+            result = list(ctags.sort_lines_by_file(lines, 1 << 20, stats))
+        finally:
+            ctags.write_sort_run = original
+
+        self.assertEqual(runs, [])
+        self.assertEqual(result, [lines[1], lines[2], lines[0]])
+        self.assertEqual(stats['runs'], 1)
+
+    def test_sort_lines_by_file__run_size_counts_overhead(self):
+        """
+        Test ``sort_lines_by_file`` counts per-line overhead toward a run.
+        """
+        lines = ['s{0}\tf{1}.py\t1;"\tf'.format(index, index % 3)
+                 for index in range(10)]
+        stats = {}
+
+        result = list(ctags.sort_lines_by_file(
+            lines, 2 * ctags.SORT_RUN_OVERHEAD, stats))
+
+        self.assertEqual(result, sorted(
+            lines, key=lambda line: line.split('\t')[ctags.FILENAME]))
+        self.assertEqual(stats['runs'], 5)
+
     # post_process_tag
 
     def test_post_process_tag__line_numbers(self):
@@ -349,6 +773,186 @@ class CTagsTest(unittest.TestCase):
 
         self.assertEqual(result, expected_output)
 
+    # split_tag_path
+
+    def test_split_tag_path__matches_splits(self):
+        """
+        Test ``split_tag_path`` gives the same result as ``splits``.
+        """
+        paths = ['a', 'a.b', 'A::b.c/d', 'a:::b', '::a..b//c:', '']
+
+        for path in paths:
+            self.assertEqual(
+                ctags.split_tag_path(path),
+                list(ctags.splits(path, *ctags.TAG_PATH_SPLITTERS)))
+
+    # split_tag_line
+
+    def test_split_tag_line__matches_regex(self):
+        """
+        Test ``split_tag_line`` gives the same result as ``TAGS_RE``.
+        """
+        lines = [
+            'bar\tbar.c\t/^void bar()$/;"\tf',
+            'foo\tfoo.c\t1;"\td\tfile:',
+            'getSum\tDemoClass.java\t/^\tprivate int getSum(int a, int b) {$/'
+            ';"\tm\tclass:DemoClass\tfile:',
+            'address\ta.py\t/^\taddress = None\t# comment$/;"\tv\tclass:A',
+            'sep\ts.py\t/^x = \';"\\/\'$/;"\tv',
+            'back\tb.rb\t?^def back$?;"\tf',
+            'trail\tt.py\t/^trail$/;"\tf\t',
+            'ns::name\tn.cpp\t12;"\tf\tnamespace:ns\tsignature:(a, b)']
+
+        for line in lines:
+            expected = ctags.TAGS_RE.search(line).groupdict()
+            self.assertEqual(ctags.split_tag_line(line), expected)
+            self.assertEqual(ctags.match_tag_line(line), expected)
+
+    def test_split_tag_line__malformed(self):
+        """
+        Test ``split_tag_line`` leaves malformed lines to ``TAGS_RE``.
+        """
+        lines = [
+            '!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted, 2=foldcase/',
+            'no_ex_command\tfile.py',
+            'bad\tbad.py\tnot a pattern;"\tf',
+            'junk\tfoo\tbar.py\t12;"\tf',
+            '']
+
+        for line in lines:
+            self.assertEqual(ctags.split_tag_line(line), None)
+            search_obj = ctags.TAGS_RE.search(line)
+            self.assertEqual(
+                ctags.match_tag_line(line),
+                search_obj.groupdict() if search_obj else None)
+
+    # parse_tag_lines filters
+
+    def test_parse_tag_lines__filters(self):
+        """
+        Test ``parse_tag_lines`` filters on raw and processed elements.
+        """
+        lines = [
+            'os\ta.py\t/^import os$/;"\ti',
+            'get\ta.py\t/^    def get(self):$/;"\tm\tclass:A',
+            'get\tb.py\t/^    def get(self):$/;"\tm\tclass:B',
+            'put\ttest_b.py\t/^def put():$/;"\tf',
+            'run\tc.py\t/^def run():$/;"\tf']
+        filters = [{'type': '^i$', 'class': '^B$'}, {'filename': '^test_'}]
+
+        for tag_class in (None, ctags.TagElements, ctags.LazyTagElements):
+            result = ctags.parse_tag_lines(
+                lines, tag_class=tag_class, filters=filters)
+
+            self.assertEqual(sorted(result), ['get', 'run'])
+            self.assertEqual(
+                [tag['filename'] for tag in result['get']], ['a.py'])
+
+    def test_parse_tag_lines__filters_before_processing(self):
+        """
+        Test ``parse_tag_lines`` filters out lines before processing them.
+        """
+        # these fields can't be processed, so must be filtered out first
+        lines = ['os\ta.py\t/^import os$/;"\ti\tbad_field']
+
+        result = ctags.parse_tag_lines(lines, filters=[{'type': '^i$'}])
+
+        self.assertEqual(result, {})
+
+    # LazyTagElements
+
+    def test_lazy_tag_elements__matches_post_process_tag(self):
+        """
+        Test ``LazyTagElements`` gives the same elements as eager parsing.
+        """
+        lines = [
+            'getSum\tDemoClass.java\t/^\tprivate int getSum(int a, int b) {$/'
+            ';"\tm\tclass:DemoClass\tfile:',
+            'foo\tfoo.c\t1;"\td\tfile:',
+            'esc\te.py\t/^x = \'\\/\\$\'$/;"\tv',
+            'junk\tfoo\tbar.py\t12;"\tf']  # needs regex fallback
+
+        eager = ctags.parse_tag_lines(lines, tag_class=ctags.TagElements)
+        lazy = ctags.parse_tag_lines(lines, tag_class=ctags.LazyTagElements)
+
+        self.assertEqual(sorted(lazy), sorted(eager))
+
+        for symbol in eager:
+            self.assertEqual(lazy[symbol], eager[symbol])
+            for tag, expected in zip(lazy[symbol], eager[symbol]):
+                self.assertEqual(tag.tag_path, expected.tag_path)
+                self.assertEqual(tag.ex_command, expected.ex_command)
+                self.assertEqual(tag.get('class'), expected.get('class'))
+                self.assertEqual('file' in tag, 'file' in expected)
+
+    def test_lazy_tag_elements__deferred(self):
+        """
+        Test ``LazyTagElements`` only processes elements when accessed.
+        """
+        line = ('getSum\tDemoClass.java\t/^\tint getSum() {$/;"\tm\t'
+                'class:DemoClass\tfile:')
+        tag = ctags.LazyTagElements(line, ctags.locate_tag_line(line))
+
+        self.assertEqual(tag.type, 'm')
+        self.assertEqual(tag.filename, 'DemoClass.java')
+        self.assertEqual(
+            sorted(dict.keys(tag)), ['filename', 'symbol', 'type'])
+
+        self.assertEqual(tag.get('class'), 'DemoClass')
+        self.assertNotIn('tag_path', dict.keys(tag))
+        self.assertNotIn('ex_command', dict.keys(tag))
+
+        self.assertEqual(
+            tag['tag_path'], ('DemoClass.java', 'DemoClass', 'getSum'))
+        self.assertEqual(tag.get('scope', 'none'), 'none')
+        self.assertRaises(AttributeError, getattr, tag, 'scope')
+
+    # CompactTagElements
+
+    def test_compact_tag_elements__matches_post_process_tag(self):
+        """
+        Test ``CompactTagElements`` gives the same elements as a dict.
+        """
+        lines = [
+            'getSum\tDemoClass.java\t/^\tprivate int getSum(int a, int b) {$/'
+            ';"\tm\tclass:DemoClass\tfile:',
+            'foo\tfoo.c\t1;"\td\tfile:',
+            'bar\tfoo.c\t/^void bar()$/;"\tf']
+
+        eager = ctags.parse_tag_lines(lines, tag_class=ctags.TagElements)
+        compact = ctags.parse_tag_lines(
+            lines, tag_class=ctags.CompactTagElements)
+
+        for symbol in eager:
+            self.assertEqual(compact[symbol], eager[symbol])
+            for tag, expected in zip(compact[symbol], eager[symbol]):
+                self.assertEqual(dict(tag.items()), expected)
+                self.assertEqual(tag['tag_path'], expected.tag_path)
+                self.assertEqual(tag.get('class'), expected.get('class'))
+                self.assertEqual(
+                    getattr(tag, 'field_keys', []),
+                    getattr(expected, 'field_keys', []))
+                self.assertEqual('file' in tag, 'file' in expected)
+
+        self.assertRaises(AttributeError, getattr, compact['bar'][0], 'file')
+        self.assertRaises(KeyError, lambda: compact['bar'][0]['file'])
+
+    def test_compact_tag_elements__interned(self):
+        """
+        Test ``CompactTagElements`` shares repeated values between tags.
+        """
+        lines = [
+            'one\t' + 'path/to/file.py\t1;"\tf\tclass:MyClass',
+            'two\t' + 'path/to/file.py\t2;"\tf\tclass:MyClass']
+
+        tags = ctags.parse_tag_lines(
+            lines, tag_class=ctags.CompactTagElements)
+        one, two = tags['one'][0], tags['two'][0]
+
+        self.assertIs(one.filename, two.filename)
+        self.assertIs(one.type, two.type)
+        self.assertIs(getattr(one, 'class'), getattr(two, 'class'))
+
     # Tag class
 
     def test_parse_tag_lines__python(self):
@@ -484,5 +1088,775 @@ class CTagsTest(unittest.TestCase):
         for key in result:  # don't forget - we might have missed something!
             self.assertEqual(expected_outputs[key], result[key])
 
+    # TagFile
+
+    def test_build_line_index(self):
+        """
+        Test ``build_line_index`` records the start of every line.
+        """
+        lines = [
+            'a\ta.py\t1;"\tf',
+            'bb\tb.py\t2;"\tf',
+            'ccc\tc.py\t3;"\tf']
+        tag_file = self.build_tag_file(lines)
+        index_file = ctags.build_line_index(tag_file)
+
+        try:
+            index = ctags.LineIndex.load(tag_file, os.path.getsize(tag_file))
+            self.assertEqual(len(index), 3)
+            self.assertEqual([index[i] for i in range(4)], [0, 13, 27, 42])
+            index.close()
+
+            # an index which doesn't match the tag file is ignored
+            self.assertEqual(ctags.LineIndex.load(tag_file, 100), None)
+        finally:
+            os.remove(tag_file)
+            os.remove(index_file)
+
+    def test_tag_file_search_by_suffix__suffix_index(self):
+        """
+        Test ``TagFile.search_by_suffix`` gives the same results with a
+        suffix index, for both filenames and symbols.
+        """
+        filenames = ['a.py', 'b.c', 'c.py', 'd.py', 'e.h', 'f.py', 'g.pyc']
+        symbols = ['get_name', 'name', 'set_name', 'get_value', 'x']
+        lines = ['{0}\t{1}\t1;"\tf'.format(symbol, filename)
+                 for filename in filenames for symbol in symbols]
+        tag_file = self.build_tag_file(lines)
+        suffixes = {
+            ctags.FILENAME: ['.py', 'py', '.c', '.h', 'c', '.java', '',
+                             'a.py'],
+            ctags.SYMBOL: ['_name', 'name', 'value', 'x', 'y', '']}
+        results = {}
+
+        try:
+            for column in suffixes:
+                with ctags.TagFile(tag_file, column) as tagfile:
+                    self.assertEqual(tagfile.suffix_index, None)
+                    expected = [
+                        [t.line for t in tagfile.search_by_suffix(suffix)]
+                        for suffix in suffixes[column]]
+
+                index_file = ctags.build_suffix_index(tag_file, column)
+
+                with ctags.TagFile(tag_file, column) as tagfile:
+                    self.assertNotEqual(tagfile.suffix_index, None)
+                    results[column] = [
+                        [t.line for t in tagfile.search_by_suffix(suffix)]
+                        for suffix in suffixes[column]]
+
+                os.remove(index_file)
+                self.assertEqual(results[column], expected)
+        finally:
+            os.remove(tag_file)
+
+        result = results[ctags.FILENAME]
+        self.assertEqual(len(result[0]), 20)
+        self.assertEqual(result[5], [])  # .java
+        result = results[ctags.SYMBOL]
+        self.assertEqual(len(result[0]), 14)  # get_name, set_name
+        self.assertEqual(len(result[1]), 21)
+        self.assertEqual(result[4], [])  # y
+
+    def test_build_suffix_index__run_size(self):
+        """
+        Test ``build_suffix_index`` writes the same index with bounded memory.
+        """
+        lines = ['symbol_{0}\tmodule_{1}.py\t{0};"\tf'.format(
+            index, (index * 7) % 13) for index in range(200)]
+        tag_file = self.build_tag_file(lines)
+        results = []
+
+        try:
+            for run_size in (None, 1000):
+                for column in (ctags.FILENAME, ctags.SYMBOL):
+                    index_file = ctags.build_suffix_index(
+                        tag_file, column, run_size)
+                    with open(index_file, 'rb') as file_:
+                        results.append(file_.read())
+                    os.remove(index_file)
+        finally:
+            os.remove(tag_file)
+
+        self.assertEqual(results[2:], results[:2])
+
+    def test_tag_file_search_by_substring__trigram_index(self):
+        """
+        Test ``TagFile.search_by_substring`` gives the same results with a
+        trigram index.
+        """
+        symbols = ['JsonSerializer', 'Serialize', 'deserialize', 'parse',
+                   'serial', 'XmlSerializer', 'Xml_Parser']
+        lines = ['!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted/']
+        lines.extend('{0}\t{1}.py\t1;"\tf'.format(symbol, filename)
+                     for symbol in sorted(symbols) for filename in 'ab')
+        tag_file = self.build_tag_file(lines)
+        queries = [('serializ', False), ('SERIAL', False), ('xml', False),
+                   ('pa', False), ('nothing', False), ('Serialiser', True),
+                   ('XmlParse', True), ('p', True)]
+
+        def search(tagfile):
+            return [[t.line for t in tagfile.search_by_substring(*query)]
+                    for query in queries]
+
+        try:
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.trigram_index, None)
+                expected = search(tagfile)
+
+            index_file = ctags.build_trigram_index(tag_file)
+
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertNotEqual(tagfile.trigram_index, None)
+                result = search(tagfile)
+
+            os.remove(index_file)
+        finally:
+            os.remove(tag_file)
+
+        self.assertEqual(result, expected)
+
+        def symbols_of(lines):
+            return sorted(set(line.split('\t')[0] for line in lines))
+
+        self.assertEqual(symbols_of(result[0]), [
+            'JsonSerializer', 'Serialize', 'XmlSerializer', 'deserialize'])
+        self.assertEqual(len(result[0]), 8)
+        self.assertEqual(symbols_of(result[3]), ['Xml_Parser', 'parse'])
+        self.assertEqual(result[4], [])
+        self.assertEqual(symbols_of(result[5]), [
+            'JsonSerializer', 'Serialize', 'XmlSerializer', 'deserialize',
+            'serial'])
+        self.assertIn('Xml_Parser', symbols_of(result[6]))
+
+    def test_tag_file_search__bytes(self):
+        """
+        Test ``TagFile.search`` compares raw bytes as ``str`` would.
+        """
+        symbols = [
+            u'a', u'b\u00e9', u'b\u00e9b', u'bz', u'c', u'\u00e9t\u00e9']
+        lines = sorted(u'{0}\t{1}.py\t1;"\tf\tline:{2}'.format(
+            symbol, symbol[::-1], 'x' * 4096) for symbol in symbols)
+        tag_file = self.build_tag_file([line + u'\r' for line in lines])
+        queries = symbols + [u'b', u'\u00e9', u'', u'z']
+
+        try:
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                for exact_match in (True, False):
+                    self.assertEqual(
+                        [[t.line for t in tagfile.search(exact_match, query)]
+                         for query in queries],
+                        [[line for line in lines if (
+                            line.split('\t')[0] == query if exact_match else
+                            line.startswith(query))] for query in queries])
+        finally:
+            os.remove(tag_file)
+
+    def test_tag_file_search__foldcase(self):
+        """
+        Test ``TagFile.search`` finds tags in foldcase sorted tag files.
+        """
+        symbols = ['Abc', 'abc', 'ABD', 'b', 'Bc', 'c', 'x_y', 'XY']
+        tags = ['{0}\t{0}.py\t1;"\tf'.format(s) for s in symbols]
+        headers = ['!_TAG_FILE_FORMAT\t2\t/extended format/',
+                   '!_TAG_FILE_SORTED\t{0}\t/0=unsorted, 1=sorted/']
+        sorted_file = self.build_tag_file(
+            [headers[0], headers[1].format(1)] + sorted(tags))
+        folded_file = self.build_tag_file(
+            [headers[0], headers[1].format(2)] +
+            sorted(tags, key=lambda tag: tag.upper()))
+        queries = ['abc', 'Abc', 'ab', 'AB', 'b', 'B', 'x', 'XY', 'z']
+
+        def search(tagfile, exact_match, ignore_case=False):
+            search = (tagfile.search_ignore_case if ignore_case else
+                      tagfile.search)
+            return [sorted(t.line for t in search(exact_match, query))
+                    for query in queries]
+
+        try:
+            for tag_file in (sorted_file, folded_file):
+                with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                    self.assertEqual(
+                        [search(tagfile, exact) for exact in (True, False)],
+                        [[sorted(tag for tag in tags if tag.startswith(
+                            query + '\t' if exact else query))
+                          for query in queries] for exact in (True, False)])
+
+            expected = [[sorted(tag for tag in tags if tag.upper().startswith(
+                query.upper() + '\t' if exact else query.upper()))
+                for query in queries] for exact in (True, False)]
+
+            for tag_file in (sorted_file, folded_file):
+                with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                    self.assertEqual(tagfile.fold_index, None)
+                    self.assertEqual(
+                        [search(tagfile, exact, True)
+                         for exact in (True, False)], expected)
+
+            index_file = ctags.build_fold_index(sorted_file)
+
+            with ctags.TagFile(sorted_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.sort_mode, ctags.SORT_YES)
+                self.assertNotEqual(tagfile.fold_index, None)
+                self.assertEqual(
+                    [search(tagfile, exact, True) for exact in (True, False)],
+                    expected)
+
+            os.remove(index_file)
+        finally:
+            os.remove(sorted_file)
+            os.remove(folded_file)
+
+        self.assertEqual(expected[0][0], sorted(tags[:2]))
+
+    def test_tag_file_search__unsorted(self):
+        """
+        Test ``TagFile`` reads pseudo-tags and searches unsorted tag files.
+        """
+        symbols = ['c', 'Abc', 'x_y', 'abc', 'b', 'ABD', 'abc', 'XY']
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(s, i)
+                for i, s in enumerate(symbols)]
+        tag_file = self.build_tag_file([
+            '!_TAG_FILE_FORMAT\t2\t/extended format/',
+            '!_TAG_FILE_SORTED\t0\t/0=unsorted, 1=sorted, 2=foldcase/',
+            '!_TAG_PROGRAM_VERSION\t5.8\t//'] + tags)
+        queries = ['abc', 'Abc', 'ab', 'AB', 'x', 'XY', 'z', '!_TAG']
+
+        def search(tagfile, exact_match, ignore_case=False):
+            search = (tagfile.search_ignore_case if ignore_case else
+                      tagfile.search)
+            return [sorted(t.line for t in search(exact_match, query))
+                    for query in queries]
+
+        expected = [[sorted(tag for tag in tags if tag.startswith(
+            query + '\t' if exact else query)) for query in queries]
+            for exact in (True, False)]
+
+        try:
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.sort_mode, ctags.SORT_NO)
+                self.assertEqual(tagfile.strategy, ctags.SEARCH_LINEAR)
+                self.assertEqual(tagfile.format, 2)
+                self.assertEqual(tagfile.program_version, '5.8')
+                self.assertEqual(
+                    [search(tagfile, exact) for exact in (True, False)],
+                    expected)
+                self.assertEqual([t.line for t in tagfile.search()], tags)
+
+            index_file = ctags.build_fold_index(tag_file)
+
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.strategy, ctags.SEARCH_INDEXED)
+                self.assertEqual(
+                    [search(tagfile, exact) for exact in (True, False)],
+                    expected)
+                self.assertEqual(
+                    search(tagfile, True, True)[0],
+                    sorted(tag for tag in tags
+                           if tag.upper().startswith('ABC\t')))
+
+            os.remove(index_file)
+        finally:
+            os.remove(tag_file)
+
+        self.assertEqual(len(expected[0][0]), 2)
+        self.assertEqual(expected[1][-1], [])
+
+    def test_build_fold_index(self):
+        """
+        Test ``build_fold_index`` with bounded memory, and on tag files
+        already sorted ignoring case.
+        """
+        header = '!_TAG_FILE_SORTED\t{0}\t/0=unsorted, 1=sorted/'
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(symbol, index)
+                for index, symbol in enumerate(
+                    ['b', 'A', 'c', 'a', 'B'] * 40)]
+        tag_file = self.build_tag_file([header.format(1)] + tags)
+        results = []
+
+        try:
+            for run_size in (None, 1000):
+                index_file = ctags.build_fold_index(tag_file, run_size)
+                with open(index_file, 'rb') as file_:
+                    results.append(file_.read())
+            self.assertEqual(results[1], results[0])
+
+            # sorted ignoring case, so bisected without an index
+            with open(tag_file, 'w') as file_:
+                file_.write('\n'.join([header.format(2)] + sorted(
+                    tags, key=lambda tag: tag.split('\t')[0].upper())))
+            self.assertEqual(ctags.build_fold_index(tag_file), None)
+            self.assertFalse(os.path.exists(index_file))
+        finally:
+            os.remove(tag_file)
+
+    def test_tag_file_search_many(self):
+        """
+        Test ``TagFile.search_many`` finds the same tags as ``search``.
+        """
+        symbols = ['c', 'Abc', 'x_y', 'abc', 'b', 'ABD', 'abc', 'XY', 'a']
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(s, i)
+                for i, s in enumerate(symbols)]
+        header = '!_TAG_FILE_SORTED\t{0}\t/0=unsorted, 1=sorted/'
+        tag_files = [
+            self.build_tag_file([header.format(1)] + sorted(tags)),
+            self.build_tag_file([header.format(2)] + sorted(
+                tags, key=lambda tag: tag.split('\t')[0].upper())),
+            self.build_tag_file([header.format(0)] + tags)]
+        queries = ['abc', 'Abc', 'ab', 'AB', 'a', 'x', 'XY', 'z', 'abc', 'c']
+
+        def search_many(tagfile, exact_match):
+            return dict(
+                (key, [t.line for t in results]) for key, results in
+                tagfile.search_many(queries, exact_match).items())
+
+        def search(tagfile, exact_match):
+            results = {}
+            for query in queries:
+                lines = [t.line for t in tagfile.search(exact_match, query)]
+                if lines:
+                    results[query] = sorted(
+                        lines, key=lambda line: tags.index(line))
+            return results
+
+        try:
+            for tag_file in tag_files:
+                for build_index in (False, ctags.build_line_index,
+                                    ctags.build_fold_index):
+                    if build_index:
+                        build_index(tag_file)
+
+                    with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                        for exact_match in (True, False):
+                            expected = search(tagfile, exact_match)
+                            result = search_many(tagfile, exact_match)
+                            for key in result:  # compare sets of lines
+                                result[key] = sorted(
+                                    result[key],
+                                    key=lambda line: tags.index(line))
+                            self.assertEqual(result, expected)
+                            self.assertEqual(
+                                sorted(expected),
+                                ['AB', 'Abc', 'XY', 'a', 'ab', 'abc', 'c',
+                                 'x'] if not exact_match else
+                                ['Abc', 'XY', 'a', 'abc', 'c'])
+        finally:
+            for tag_file in tag_files:
+                for suffix in ('', ctags.LINE_INDEX_SUFFIX,
+                               ctags.FOLD_INDEX_SUFFIX):
+                    if os.path.exists(tag_file + suffix):
+                        os.remove(tag_file + suffix)
+
+    def test_tag_file_search_prefix(self):
+        """
+        Test ``TagFile.search_prefix`` counts distinct symbols.
+        """
+        symbols = ['c', 'Abc', 'x_y', 'abc', 'b', 'ABD', 'abc', 'XY', 'a',
+                   'ab', 'abc', 'Ab']
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(s, i)
+                for i, s in enumerate(symbols)]
+        header = '!_TAG_FILE_SORTED\t{0}\t/0=unsorted, 1=sorted/'
+        tag_files = [
+            self.build_tag_file([header.format(1)] + sorted(tags)),
+            self.build_tag_file([header.format(2)] + sorted(
+                tags, key=lambda tag: tag.split('\t')[0].upper())),
+            self.build_tag_file([header.format(0)] + tags)]
+        queries = ['a', 'ab', 'A', 'Ab', 'abc', 'x', 'z', '']
+
+        try:
+            for tag_file in tag_files:
+                for build_index in (False, ctags.build_line_index):
+                    if build_index:
+                        build_index(tag_file)
+
+                    with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                        for query in queries:
+                            expected = {}
+                            for t in tagfile.search(False, query):
+                                symbol = t[ctags.SYMBOL]
+                                expected[symbol] = expected.get(symbol, 0) + 1
+                            self.assertEqual(sorted(tagfile.search_prefix(
+                                query, distinct_symbols_only=True)),
+                                sorted(expected.items()))
+                            self.assertEqual(
+                                len(tagfile.search_prefix(query, 2, True)),
+                                min(len(expected), 2))
+                            self.assertEqual(
+                                len(tagfile.search_prefix(query, 3)),
+                                min(sum(expected.values()), 3))
+        finally:
+            for tag_file in tag_files:
+                for suffix in ('', ctags.LINE_INDEX_SUFFIX):
+                    os.remove(tag_file + suffix)
+
+    def test_tag_file_search_completions(self):
+        """
+        Test ``TagFile.search_completions`` with and without an index.
+        """
+        symbols = ['c', 'Abc', 'x_y', 'abc', 'b', 'ABD', 'abc', 'XY', 'a',
+                   'ab', 'abc', 'Ab']
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(s, i)
+                for i, s in enumerate(symbols)]
+        tag_file = self.build_tag_file(
+            ['!_TAG_FILE_SORTED\t1\t/0=unsorted, 1=sorted/'] + sorted(tags))
+        queries = {'a': ['a', 'Ab', 'ab', 'Abc', 'abc', 'ABD'],
+                   'AB': ['Ab', 'ab', 'Abc', 'abc', 'ABD'],
+                   'abc': ['Abc', 'abc'], 'x': ['x_y', 'XY'], 'z': [],
+                   '': ['a', 'Ab', 'ab', 'Abc', 'abc', 'ABD', 'b', 'c',
+                        'x_y', 'XY']}
+
+        try:
+            for build_index in (False, ctags.build_completion_index):
+                if build_index:
+                    build_index(tag_file)
+
+                with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                    self.assertEqual(tagfile.completion_index is None,
+                                     not build_index)
+                    for query, expected in queries.items():
+                        self.assertEqual(tagfile.search_completions(query),
+                                         expected)
+                        self.assertEqual(
+                            tagfile.search_completions(query, 2),
+                            expected[:2])
+
+                    if build_index:
+                        self.assertEqual(
+                            tagfile.completion_index.complete_keys('ab'),
+                            [('ab', 'Ab'), ('ab', 'ab'), ('abc', 'Abc'),
+                             ('abc', 'abc'), ('abd', 'ABD')])
+
+            with open(tag_file, 'ab') as file_:  # index now stale
+                file_.write(b'ac\tac.py\t1;"\tf\n')
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertIsNone(tagfile.completion_index)
+                self.assertIn('ac', tagfile.search_completions('a'))
+        finally:
+            for suffix in ('', ctags.COMPLETION_INDEX_SUFFIX,
+                           ctags.ABBREVIATION_INDEX_SUFFIX,
+                           ctags.BLOOM_FILTER_SUFFIX):
+                os.remove(tag_file + suffix)
+
+    def test_get_abbreviation(self):
+        """
+        Test ``get_abbreviation`` splits camel case and snake case words.
+        """
+        symbols = {'getDisplayName': 'gdn', 'get_display_name': 'gdn',
+                   'GetHTTPResponse': 'ghr', 'XMLParser': 'xp',
+                   'parse2_dict': 'p2d', '__init__': None, 'get': None}
+
+        for symbol, expected in symbols.items():
+            self.assertEqual(ctags.get_abbreviation(symbol), expected)
+
+    def test_tag_file_search_abbreviations(self):
+        """
+        Test ``TagFile.search_abbreviations`` with and without an index.
+        """
+        symbols = ['getDisplayName', 'get_display_name', 'getDate',
+                   'GetDisplayNode', 'gdn', 'setDisplayName',
+                   'getDisplayName']
+        tags = ['{0}\t{0}.py\t{1};"\tf'.format(s, i)
+                for i, s in enumerate(symbols)]
+        tag_file = self.build_tag_file(sorted(tags))
+        queries = {'gd': ['getDate', 'GetDisplayNode', 'getDisplayName',
+                          'get_display_name'],
+                   'gDN': ['GetDisplayNode', 'getDisplayName',
+                           'get_display_name'],
+                   'sdn': ['setDisplayName'], 'x': []}
+
+        try:
+            for build_index in (False, ctags.build_completion_index):
+                if build_index:
+                    build_index(tag_file)
+
+                with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                    self.assertEqual(tagfile.abbreviation_index is None,
+                                     not build_index)
+                    for query, expected in queries.items():
+                        self.assertEqual(tagfile.search_abbreviations(query),
+                                         expected)
+                        self.assertEqual(
+                            tagfile.search_abbreviations(query, 1),
+                            expected[:1])
+
+                    tags = tagfile.get_tags_dict_by_abbreviation('gdn')
+                    self.assertEqual(sorted(tags), queries['gDN'])
+                    self.assertEqual(len(tags['getDisplayName']), 2)
+        finally:
+            for suffix in ('', ctags.COMPLETION_INDEX_SUFFIX,
+                           ctags.ABBREVIATION_INDEX_SUFFIX,
+                           ctags.BLOOM_FILTER_SUFFIX):
+                os.remove(tag_file + suffix)
+
+    def test_parsed_tag_cache(self):
+        """
+        Test ``ParsedTagCache`` reuses parsed tags until the tag file
+        changes.
+        """
+        lines = ['getSum\tDemoClass.java\t/^\tint getSum() {$/;"\tm\t'
+                 'class:DemoClass\tfile:',
+                 'main\tmain.py\t1;"\tf',
+                 'main\tmain.c\t2;"\tf']
+        tag_file = self.build_tag_file(lines)
+        cache_dir = tempfile.mkdtemp()
+        cache = ctags.ParsedTagCache(cache_dir)
+        parsed = []
+
+        def parse(tag_class):
+            def parse():
+                parsed.append(tag_class)
+                with codecs.open(tag_file, encoding='utf-8') as file_:
+                    return ctags.parse_tag_lines(file_, tag_class=tag_class)
+            return parse
+
+        try:
+            for tag_class in (ctags.TagElements, ctags.CompactTagElements):
+                query = ('all', tag_class.__name__)
+                expected = cache.get_tags(tag_file, query, parse(tag_class))
+                result = cache.get_tags(tag_file, query, parse(tag_class))
+                self.assertEqual(parsed, [tag_class])  # parsed once
+                del parsed[:]
+
+                self.assertIsInstance(result, ctags.CachedTags)
+                self.assertEqual(result.loaded, {})  # loaded lazily
+                self.assertEqual(sorted(result), ['getSum', 'main'])
+                self.assertEqual(len(result['main']), 2)
+                self.assertEqual(list(result.loaded), ['main'])
+                for key in expected:
+                    self.assertEqual(
+                        [dict(tag.items()) for tag in result[key]],
+                        [dict(tag.items()) for tag in expected[key]])
+                    self.assertIsInstance(result[key][0], tag_class)
+
+            # tags keep the directory of their tag file, to open their
+            # source file as ``scroll_to_tag`` does
+            for compact in (False, True):
+                def parse_tag_file():
+                    with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                        return tagfile.get_tags_dict(compact=compact)
+                query = ('tag file', compact)
+                expected = cache.get_tags(tag_file, query, parse_tag_file)
+                result = cache.get_tags(tag_file, query, parse_tag_file)
+                self.assertIsInstance(result, ctags.CachedTags)
+                tag = result['getSum'][0]
+                self.assertEqual(os.path.join(tag.root_dir, tag.filename),
+                                 os.path.join(os.path.dirname(tag_file),
+                                              'DemoClass.java'))
+                self.assertEqual(tag.root_dir, expected['getSum'][0].root_dir)
+                self.assertEqual(tag.tag_path, ('DemoClass.java', 'DemoClass',
+                                                'getSum'))
+
+            with open(tag_file, 'ab') as file_:
+                file_.write(b'other\tother.py\t1;"\tf\n')
+            result = cache.get_tags(tag_file, query,
+                                    parse(ctags.CompactTagElements))
+            self.assertEqual(len(parsed), 1)  # changed, so parsed again
+            self.assertIn('other', result)
+
+            cache.max_size = 0  # evict every entry
+            cache.get_tags(tag_file, ('other', ),
+                           parse(ctags.CompactTagElements))
+            self.assertEqual(len(os.listdir(cache_dir)), 0)
+        finally:
+            os.remove(tag_file)
+            shutil.rmtree(cache_dir)
+
+    def test_tags_cache(self):
+        """
+        Test ``TagsCache`` drops stale and least recently used entries.
+        """
+        lines = ['{0}\t{0}.py\t1;"\tf'.format(s) for s in 'abc']
+        tag_files = [self.build_tag_file(lines) for _ in range(3)]
+        tags = [ctags.TagFile(path, ctags.SYMBOL) for path in tag_files]
+        for index, tag_file in enumerate(tags):
+            with tag_file:
+                tags[index] = tag_file.get_tags_dict(compact=True)
+        size = ctags.estimate_tags_size(tags[0])
+        cache = ctags.TagsCache(max_size=size * 2)
+
+        try:
+            self.assertTrue(size > 0)
+            self.assertIsNone(cache.get('a', tag_files[0]))
+            cache.put('a', tag_files[0], tags[0])
+            self.assertIs(cache.get('a', tag_files[0]), tags[0])
+            self.assertIsNone(cache.get('a', tag_files[1]))  # other file
+
+            cache.put('a', tag_files[0], tags[0])
+            cache.put('b', tag_files[1], tags[1])
+            cache.get('a', tag_files[0])
+            cache.put('c', tag_files[2], tags[2])  # over budget
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get('b', tag_files[1]))  # evicted
+            self.assertIs(cache.get('c', tag_files[2]), tags[2])
+
+            with open(tag_files[2], 'ab') as file_:
+                file_.write(b'd\td.py\t1;"\tf\n')
+            self.assertIsNone(cache.get('c', tag_files[2]))  # stale
+
+            cache.invalidate(tag_files[0])
+            self.assertEqual(len(cache), 0)
+            self.assertEqual(cache.stats(), {
+                'entries': 0, 'size': 0, 'max_size': size * 2, 'hits': 3,
+                'misses': 4, 'stale': 2, 'evictions': 1})
+        finally:
+            for path in tag_files:
+                os.remove(path)
+
+    def test_may_contain_symbol(self):
+        """
+        Test ``may_contain_symbol`` rules out symbols using a bloom filter.
+        """
+        symbols = ['symbol_{0}'.format(i) for i in range(500)]
+        tag_file = self.build_tag_file(sorted(
+            '{0}\t{0}.py\t1;"\tf'.format(s) for s in symbols))
+
+        try:
+            self.assertTrue(ctags.may_contain_symbol(tag_file, 'missing'))
+            ctags.build_completion_index(tag_file)
+
+            for symbol in symbols:
+                self.assertTrue(ctags.may_contain_symbol(tag_file, symbol))
+            self.assertTrue(ctags.may_contain_symbol(tag_file, 'SYMBOL_1'))
+            false_positives = sum(
+                ctags.may_contain_symbol(tag_file, 'other_{0}'.format(i))
+                for i in range(1000))
+            self.assertTrue(false_positives < 50)
+
+            with open(tag_file, 'ab') as file_:  # filter now stale
+                file_.write(b'other_0\tother_0.py\t1;"\tf\n')
+            self.assertTrue(ctags.may_contain_symbol(tag_file, 'other_0'))
+        finally:
+            for suffix in ('', ctags.COMPLETION_INDEX_SUFFIX,
+                           ctags.ABBREVIATION_INDEX_SUFFIX,
+                           ctags.BLOOM_FILTER_SUFFIX):
+                os.remove(tag_file + suffix)
+
+    def test_search_tag_files(self):
+        """
+        Test ``search_tag_files`` keeps the order of paths and its budget.
+        """
+        delays = {'a': 0.2, 'b': 0, 'c': 0.05, 'd': 0}
+
+        def search(path):
+            time.sleep(delays[path])
+            if path == 'd':
+                return None
+            if path == 'e':
+                raise IOError(path)
+            return path.upper()
+
+        paths = sorted(delays)
+        self.assertEqual(ctags.search_tag_files(paths, search, jobs=2),
+                         [('a', 'A'), ('b', 'B'), ('c', 'C')])
+        self.assertEqual(
+            ctags.search_tag_files(paths, search, jobs=4, timeout=0.1),
+            [('b', 'B'), ('c', 'C')])  # 'a' is too slow
+
+        delays = {'a': 0.1, 'd': 0}
+        self.assertEqual(
+            ctags.search_tag_files(['d', 'a'], search, timeout=0.01),
+            [('a', 'A')])  # over budget, but the only results
+
+        delays['e'] = 0
+        self.assertEqual(ctags.search_tag_files(['e', 'a'], search),
+                         [('a', 'A')])
+        self.assertRaises(IOError, ctags.search_tag_files, ['d', 'e'],
+                          search)
+        self.assertEqual(ctags.search_tag_files([], search), [])
+
+    def test_tag_file_pool(self):
+        """
+        Test ``TagFilePool`` reuses open tag files until they change.
+        """
+        lines = ['{0}\t{0}.py\t1;"\tf'.format(s) for s in 'abc']
+        tag_files = [self.build_tag_file(lines) for _ in range(3)]
+        pool = ctags.TagFilePool(max_size=2)
+
+        try:
+            with pool.open(tag_files[0], ctags.SYMBOL) as tagfile:
+                first = tagfile
+                self.assertEqual(len(list(tagfile.search())), 3)
+                with pool.open(tag_files[0], ctags.SYMBOL) as other:
+                    self.assertIsNot(other, first)  # in use
+            self.assertEqual(len(pool), 1)
+            self.assertTrue(first.mapped.closed)  # duplicate closed
+
+            with pool.open(tag_files[0], ctags.SYMBOL) as tagfile:
+                self.assertIs(tagfile, other)
+                self.assertEqual(len(list(tagfile.search())), 3)
+
+            with open(tag_files[0], 'ab') as file_:
+                file_.write(b'd\td.py\t1;"\tf\n')
+            with pool.open(tag_files[0], ctags.SYMBOL) as tagfile:
+                self.assertIsNot(tagfile, other)
+                self.assertEqual(len(list(tagfile.search())), 4)
+
+            for path in tag_files[1:]:
+                with pool.open(path, ctags.SYMBOL):
+                    pass
+            self.assertEqual(len(pool), 2)  # least recently used closed
+            self.assertTrue(tagfile.mapped.closed)
+
+            pool.invalidate(tag_files[1])
+            self.assertEqual(len(pool), 1)
+            with pool.open(tag_files[2], ctags.SYMBOL):
+                pool.invalidate()
+            self.assertEqual(len(pool), 0)
+        finally:
+            for path in tag_files:
+                os.remove(path)
+
+    def test_tag_file_pool__max_idle(self):
+        """
+        Test ``TagFilePool`` closes tag files left unused.
+        """
+        tag_file = self.build_tag_file(['a\ta.py\t1;"\tf'])
+        pool = ctags.TagFilePool(max_idle=0.05)
+
+        try:
+            with pool.open(tag_file, ctags.SYMBOL) as tagfile:
+                pass
+            self.assertEqual(len(pool), 1)
+            time.sleep(0.5)
+            self.assertEqual(len(pool), 0)
+            self.assertTrue(tagfile.mapped.closed)
+            self.assertIsNone(pool.timer)
+        finally:
+            os.remove(tag_file)
+
+    def test_tag_file_search__line_index(self):
+        """
+        Test ``TagFile.search`` gives the same results with a line index.
+        """
+        symbols = ['a', 'ab', 'abc', 'b', 'c', 'cd', 'x', 'y', 'z']
+        lines = ['{0}\t{0}.py\t1;"\tf'.format(s) for s in symbols]
+        tag_file = self.build_tag_file(lines)
+
+        try:
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(tagfile.line_index, None)
+                expected = [
+                    [t.line for t in tagfile.search(True, symbol)]
+                    for symbol in symbols]
+                prefixed = [t.line for t in tagfile.search(False, 'a')]
+
+            index_file = ctags.build_line_index(tag_file)
+
+            with ctags.TagFile(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertEqual(len(tagfile), len(symbols))
+                result = [
+                    [t.line for t in tagfile.search(True, symbol)]
+                    for symbol in symbols]
+                self.assertEqual(
+                    [t.line for t in tagfile.search(False, 'a')], prefixed)
+
+            os.remove(index_file)
+        finally:
+            os.remove(tag_file)
+
+        self.assertEqual(result, expected)
+        self.assertEqual(expected, [[line] for line in lines])
+        self.assertEqual(prefixed, lines[:3])
+
 if __name__ == '__main__':
     unittest.main()
@@ -8,6 +8,7 @@ import os
 import sys
 import tempfile
 import shutil
+import threading
 
 if sys.version_info < (2, 7):
     import unittest2 as unittest
@@ -224,5 +225,291 @@ class CTagsPluginTest(unittest.TestCase):
 
         self.assertIn(result[0], relative_paths)
 
+    # format_tag_for_quickopen
+
+    def test_format_tag_for_quickopen__lazy_tag(self):
+        line = ('getSum\tDemoClass.java\t/^\tint getSum() {$/;"\tm\t'
+                'class:DemoClass\tfile:')
+
+        eager = ctags.parse_tag_lines(
+            [line], tag_class=ctags.TagElements)['getSum'][0]
+        lazy = ctags.parse_tag_lines(
+            [line], tag_class=ctags.LazyTagElements)['getSum'][0]
+
+        self.assertEqual(
+            ctagsplugin.format_tag_for_quickopen(lazy),
+            ctagsplugin.format_tag_for_quickopen(eager))
+        self.assertEqual(
+            ctagsplugin.format_tag_for_quickopen(lazy),
+            ['    DemoClass.getSum', 'DemoClass.java', 'int getSum() {'])
+
+    # BufferCompletions
+
+    def test_buffer_completions(self):
+        View = ctagsplugin.sublime.View
+        views = [View('def foo_bar(self):\n    return FooBaz\n'),
+                 View('foo = 1\nbar = foo\n')]
+        completions = ctagsplugin.BufferCompletions()
+
+        self.assertEqual(completions.complete(views, 'foo'),
+                         set(['foo_bar', 'FooBaz', 'foo']))
+
+        views[0].insert('x = fooQux')  # a single change, indexed in place
+        completions.modified(views[0])
+        self.assertEqual(completions.complete(views, 'fooq'), set())
+        views[0].insert(' + 1')
+        completions.modified(views[0])
+        self.assertEqual(completions.complete(views, 'fooq'),
+                         set(['fooQux']))
+
+        views[0].erase(len('x = fooQux + 1'))  # deleted words may remain
+        completions.modified(views[0])
+        self.assertEqual(completions.complete(views, 'fooq'),
+                         set(['fooQux']))
+        completions.refresh(views[0])
+        self.assertEqual(completions.complete(views, 'fooq'), set())
+
+        views[1].insert('foo_quux = 2\n')  # a missed change
+        views[1].insert('')
+        completions.modified(views[1])
+        self.assertEqual(completions.complete(views, 'foo_q'),
+                         set(['foo_quux']))
+
+        for view in views:
+            self.assertEqual(
+                completions.complete([view], 'f'),
+                set(view.extract_completions('f')))
+            completions.discard(view)
+        self.assertEqual(completions.views, {})
+
+    def test_buffer_completions__lines(self):
+        View = ctagsplugin.sublime.View
+        view = View('x = 1\n')
+        completions = ctagsplugin.BufferCompletions()
+
+        def type_(text):
+            for char in text:
+                view.insert(char)
+                completions.modified(view)
+
+        self.assertEqual(completions.complete([view], 'foo'), set())
+
+        type_('fooQux\n')  # typed, then the line left
+        self.assertEqual(completions.complete([view], 'foo'),
+                         set(['fooQux']))
+        type_('barQux')  # typed, then the cursor moved to another line
+        view.cursor = 0
+        type_('y')
+        self.assertEqual(completions.complete([view], 'bar'),
+                         set(['barQux']))
+
+        view.cursor = view.size()
+        view.insert('\nalpha_one = 1\nbeta_two = 2\ngamma = 3')  # pasted
+        completions.modified(view)
+        self.assertEqual(completions.complete([view], 'alpha'),
+                         set(['alpha_one']))
+        self.assertEqual(completions.complete([view], 'beta'),
+                         set(['beta_two']))
+
+        view.insert('\ndelta_four = 4\nepsilon')  # a line pasted before
+        completions.modified(view)
+        self.assertEqual(completions.complete([view], 'delta'),
+                         set(['delta_four']))
+        completions.refresh(view)
+        self.assertEqual(completions.complete([view], ''),
+                         set(view.extract_completions('')))
+
+    def test_buffer_completions__other_views(self):
+        View = ctagsplugin.sublime.View
+        views = [View('x = 1\n'), View('y = 2\n'), View('z = 3\n')]
+        completions = ctagsplugin.BufferCompletions()
+
+        def type_(view, text):
+            for char in text:
+                view.insert(char)
+                completions.modified(view)
+
+        self.assertEqual(completions.complete(views, 'foo'), set())
+
+        type_(views[0], 'fooBar')  # typed, then another view activated
+        self.assertEqual(completions.complete(views, 'foo'), set())
+        completions.refresh(views[1])
+        self.assertEqual(completions.complete(views, 'foo'),
+                         set(['fooBar']))
+
+        type_(views[1], 'fooBaz')  # typed, then the view deactivated
+        completions.flush(views[1])
+        self.assertEqual(completions.complete(views[1:], 'foo'),
+                         set(['fooBaz']))
+
+        type_(views[2], 'fooQux')  # completed from another view
+        self.assertEqual(completions.complete(views, 'fooq'), set())
+        self.assertEqual(completions.complete(views, 'fooq', views[0]),
+                         set(['fooQux']))
+
+    # CompletionSession
+
+    def test_completion_session(self):
+        tmp_dir = self.make_tmp_directory()
+        tag_file = os.path.join(tmp_dir, 'tags')
+        searches = []
+
+        def write(symbols):
+            with open(tag_file, 'w') as file_:
+                for symbol in sorted(symbols):
+                    file_.write('{0}\t{0}.py\t1;"\tf\n'.format(symbol))
+            ctags.build_completion_index(tag_file)
+
+        def search_completion_matches(tags_path, prefix):
+            searches.append(prefix)
+            return original(tags_path, prefix)
+
+        original = ctagsplugin.search_completion_matches
+        ctagsplugin.search_completion_matches = search_completion_matches
+        session = ctagsplugin.CompletionSession()
+
+        try:
+            write(['get', 'getUser', 'getUsers', 'getValue', 'gUnit', 'set'])
+            with ctagsplugin.tag_files.open(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertIsNotNone(tagfile.completion_index)
+
+            for prefix in ('g', 'ge', 'getu', 'getuse'):  # narrowed
+                self.assertEqual(session.complete(tag_file, prefix),
+                                 ctagsplugin.merge_completions(
+                                     *original(tag_file, prefix)))
+            self.assertEqual(session.complete(tag_file, 'getuse'),
+                             ['getUser', 'getUsers'])
+            self.assertEqual(searches, ['g'])
+
+            self.assertEqual(session.complete(tag_file, 's'), ['set'])
+            self.assertEqual(searches, ['g', 's'])  # unrelated prefix
+
+            self.assertEqual(session.complete(tag_file, 'g'),
+                             ['get', 'getUser', 'getUsers', 'getValue',
+                              'gUnit'])
+            self.assertEqual(session.complete(tag_file, 'gu'),
+                             ['gUnit', 'getUser', 'getUsers'])  # abbreviated
+            self.assertEqual(session.complete(tag_file, 'gv'),
+                             ['getValue'])
+            self.assertEqual(searches, ['g', 's', 'g', 'gv'])
+
+            write(['set', 'setUp'])
+            self.assertEqual(session.complete(tag_file, 'se'),
+                             ['set', 'setUp'])
+            self.assertEqual(searches, ['g', 's', 'g', 'gv', 'se'])  # changed
+        finally:
+            ctagsplugin.search_completion_matches = original
+            ctagsplugin.tag_files.invalidate(tag_file)
+            shutil.rmtree(tmp_dir)
+
+    def test_completion_session__keys(self):
+        tmp_dir = self.make_tmp_directory()
+        tag_file = os.path.join(tmp_dir, 'tags')
+        abbreviated = []
+
+        def get_abbreviation(symbol):
+            abbreviated.append(symbol)
+            return original(symbol)
+
+        with open(tag_file, 'w') as file_:
+            for symbol in ['getUser', 'getUsers', 'getValue']:
+                file_.write('{0}\t{0}.py\t1;"\tf\n'.format(symbol))
+        ctags.build_completion_index(tag_file)
+
+        original = ctags.get_abbreviation
+        ctags.get_abbreviation = get_abbreviation
+        session = ctagsplugin.CompletionSession()
+
+        try:
+            session.complete(tag_file, 'g')
+            del abbreviated[:]
+            self.assertEqual(session.complete(tag_file, 'gu'),
+                             ['getUser', 'getUsers'])
+            self.assertEqual(session.complete(tag_file, 'guv'), [])
+            self.assertEqual(abbreviated, [])  # keys kept from the search
+        finally:
+            ctags.get_abbreviation = original
+            ctagsplugin.tag_files.invalidate(tag_file)
+            shutil.rmtree(tmp_dir)
+
+    def test_search_completions__unindexed(self):
+        tmp_dir = self.make_tmp_directory()
+        tag_file = os.path.join(tmp_dir, 'tags')
+        builds = []
+        built = threading.Event()
+
+        def write(symbols):
+            with open(tag_file, 'a') as file_:
+                for symbol in sorted(symbols):
+                    file_.write('{0}\t{0}.py\t1;"\tf\n'.format(symbol))
+
+        def build_completion_index(tags_path):
+            builds.append(tags_path)
+            built.set()
+            raise OSError('read-only file system')
+
+        original = ctags.build_completion_index
+        ctags.build_completion_index = build_completion_index
+
+        try:
+            # nothing completed without an index while indexed in the
+            # background
+            write(['get', 'getUser', 'set'])
+            self.assertEqual(ctagsplugin.search_completions(tag_file, 'ge'),
+                             [])
+            self.assertTrue(built.wait(5))
+            self.assertEqual(builds, [tag_file])
+
+            # failed, so not indexed again until changed
+            self.assertEqual(ctagsplugin.search_completions(tag_file, 'gu'),
+                             [])
+            self.assertEqual(builds, [tag_file])
+            built.clear()
+            write(['setUp'])
+            self.assertEqual(ctagsplugin.search_completions(tag_file, 'se'),
+                             [])
+            self.assertTrue(built.wait(5))
+            self.assertEqual(builds, [tag_file, tag_file])
+
+            # searched once indexed
+            ctags.build_completion_index = original
+            write(['update'])
+            ctagsplugin.build_completion_index(tag_file).join()
+            with ctagsplugin.tag_files.open(tag_file, ctags.SYMBOL) as tagfile:
+                self.assertIsNotNone(tagfile.completion_index)
+            self.assertEqual(ctagsplugin.search_completions(tag_file, 'u'),
+                             ['update'])
+            self.assertEqual(ctagsplugin.search_completions(tag_file, 'se'),
+                             ['set', 'setUp'])
+        finally:
+            ctags.build_completion_index = original
+            ctagsplugin.completion_index_builds.pop(tag_file, None)
+            ctagsplugin.tag_files.invalidate(tag_file)
+            shutil.rmtree(tmp_dir)
+
+    # merge_tags
+
+    def test_merge_tags(self):
+        def tag(symbol, root_dir, filename, line='1'):
+            return ctags.TagElements(symbol=symbol, root_dir=root_dir,
+                                     filename=filename, ex_command=line)
+
+        project = {'main': [tag('main', '/project', 'main.c'),
+                            tag('main', '/project', 'lib/util.c')]}
+        library = {'main': [tag('main', '/project/lib', 'util.c'),
+                            tag('main', '/project/lib', 'util.c', '2')]}
+        partial = {'main_loop': [tag('main_loop', '/other', 'loop.c')]}
+
+        result = ctagsplugin.merge_tags([(2, partial), (0, project),
+                                         (0, library)])
+        self.assertEqual(list(result), ['main'])
+        self.assertEqual([(t.root_dir, t.filename, t.ex_command)
+                          for t in result['main']],
+                         [('/project', 'main.c', '1'),
+                          ('/project', 'lib/util.c', '1'),
+                          ('/project/lib', 'util.c', '2')])
+        self.assertEqual(ctagsplugin.merge_tags([(2, partial)]), partial)
+        self.assertEqual(ctagsplugin.merge_tags([]), {})
+
 if __name__ == '__main__':
     unittest.main()
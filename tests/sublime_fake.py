@@ -1,3 +1,5 @@
+import re
+
 class sublime(object):
     """
     Mock object for ``sublime`` class in Sublime Text.
@@ -12,6 +14,94 @@ class sublime(object):
     def version():
         return sublime.VERSION
 
+    class Region(object):
+        """
+        Mock object for ``sublime.Region`` class in Sublime Text.
+        """
+
+        def __init__(self, a, b=None):
+            self.a = a
+            self.b = a if b is None else b
+
+        def begin(self):
+            return min(self.a, self.b)
+
+        def end(self):
+            return max(self.a, self.b)
+
+    class View(object):
+        """
+        Mock object for ``sublime.View`` class in Sublime Text.
+
+        Holds the text of a buffer with a single cursor.
+        """
+        views = 0
+
+        def __init__(self, text=''):
+            sublime.View.views += 1
+            self.view_id = sublime.View.views
+            self.text = text
+            self.changes = 0
+            self.cursor = len(text)
+
+        def id(self):
+            return self.view_id
+
+        def change_count(self):
+            return self.changes
+
+        def size(self):
+            return len(self.text)
+
+        def substr(self, region):
+            return self.text[region.begin():region.end()]
+
+        def sel(self):
+            return [sublime.Region(self.cursor)]
+
+        def rowcol(self, point):
+            col = point - (self.text.rfind('\n', 0, point) + 1)
+            return self.text.count('\n', 0, point), col
+
+        def text_point(self, row, col):
+            start = 0
+            for _ in range(row):
+                start = self.text.index('\n', start) + 1
+            return start + col
+
+        def line(self, region):
+            if not isinstance(region, sublime.Region):  # a point
+                region = sublime.Region(region)
+            start = self.text.rfind('\n', 0, region.begin()) + 1
+            end = self.text.find('\n', region.end())
+            return sublime.Region(start, len(self.text) if end < 0 else end)
+
+        def extract_completions(self, prefix):
+            words, seen = [], set()
+            for word in re.findall(r'\w+', self.text, re.UNICODE):
+                if word.lower().startswith(prefix) and word not in seen:
+                    seen.add(word)
+                    words.append(word)
+            return words
+
+        def insert(self, text):
+            """
+            Insert text at the cursor, as a single change.
+            """
+            self.text = (self.text[:self.cursor] + text +
+                         self.text[self.cursor:])
+            self.cursor += len(text)
+            self.changes += 1
+
+        def erase(self, size):
+            """
+            Erase text before the cursor, as a single change.
+            """
+            self.text = (self.text[:self.cursor - size] +
+                         self.text[self.cursor:])
+            self.cursor -= size
+            self.changes += 1
+
 class sublime_plugin(object):
     """
     Mock object for ``sublime_plugin`` class in Sublime Text.